@@ -6,20 +6,27 @@ from itertools import chain
 import matplotlib.pyplot as plt
 from blaseball_mike import chronicler, models, utils
 
+from util import http_cache
+from util.vibes import get_vibe
+
 parties_json_name = "parties_data.json"
 
 player_name_cache = {}
 
 
-def main():
+def load_parties():
     try:
+        # From before the shared cache
         with open(parties_json_name, "r") as f:
-            data = json.load(f)
-            parties_by_myst, parties_by_vibe = data["myst"], data["vibe"]
+            return json.load(f)
     except FileNotFoundError:
         parties_by_myst, parties_by_vibe = get_data_from_blaseball()
-        with open(parties_json_name, "w") as f:
-            json.dump({"myst": parties_by_myst, "vibe": parties_by_vibe}, f)
+        return {"myst": parties_by_myst, "vibe": parties_by_vibe}
+
+
+def main():
+    data = http_cache.memoize("party_myst", parties_json_name, load_parties)
+    parties_by_myst, parties_by_vibe = data["myst"], data["vibe"]
 
     for data, name in [(parties_by_myst, "Myst"), (parties_by_vibe, "Vibes")]:
         fig, ax = plt.subplots(1, 1, figsize=[8, 6])
@@ -69,7 +76,7 @@ def get_data_from_blaseball():
                         player = find_player_in_game(match.group(1), game)
 
                         if player is not None:
-                            parties_by_vibe[player.get_vibe(day + 1)] += 1
+                            parties_by_vibe[get_vibe(player, day + 1)] += 1
 
                         stadium = models.Stadium.load_by_gameday(
                             game["stadiumId"], season, day + 1)
@@ -9,6 +9,9 @@ import numpy as np
 from blaseball_mike import chronicler, models
 from tqdm import tqdm
 
+from util.update_classifier import UpdateClassifier, contains, flavor_rule, regex, startswith
+from util.vibes import get_vibe
+
 
 def download_games(season=18):
     games = chronicler.get_games(season=season)
@@ -27,68 +30,46 @@ out_at_base_re = re.compile(
     r'^(.+) (?:out at (?:first|second|third|fourth) base\.|gets caught stealing)|A murder of Crows ambush (.+)!$',
     flags=re.MULTILINE)
 
-# TODO: Separate special from flavor
-flavor_events = {
-    "A desolate peanutty wind blows.",
-    "Peanut fragments rustle on the infield.",
-    "A solitary peanut rolls onto the field. Nobody cares.",
-    "The faint crunch of a shell underfoot",
-    "The sour smell of rancid peanuts on the wind",
-    "The Birds circle ... but they don't find what they're looking for.",
-    "swallowed a stray peanut and had an allergic reaction!",
-    "has returned from Elsewhere",
-    "They became Magmatic!",
-    "The Blooddrain gurgled!",
-    "They are now Triple Threats!",
-    "is now Reverberating wildly!",
-    "is Partying!",
-    " has been cured of their peanut allergy!",
-    "BIRD NOISES",
-    "The Shame Pit activates!",
-    "These birds hate Blaseball!",
-    "Rogue Umpire incinerated ",
-    "Don't feed the birds",
-    "Have you ever seen this many birds?",
-    "The birds are mad at you. You specifically. You know who you are.",
-    "The birds are after the children...",
-    "The Electricity zaps a strike away!",
-    "Several birds are pecking...",
-    "Game over.",
-    "Oh dear Gods...",
-    "Where did these birds come from?",
-    "What are we gonna do with all these birds?",
-    "This is too many birds.",
-    "There's just too many birds!",
-    "They're clearing feathers off the field...",
-    "The birds are very loud!",
-    "I hardly think a few birds are going to bring about the end of the world.",
-    "The birds continue to stare.",
-    "The birds are paralyzed! They can't move!",
-    "Do these birds have souls?",
-    "The Birds circle...\nThe Birds pecked ",
-    "  Perks up.",
-    "The Community Chest Opens!",
-    "A shimmering Crate descends.",
-    "Smithy beckons to ",
-    "The Black Hole swallows the Runs and ",
-    "Sun 2 set a Win upon the ",
-    "Incoming Shadow Fax...",
-    " Echoed ",  # uh oh, this one is vulnerable to the Scores Baserunner problem
-    " is homesick.",
-    " is happy to be home.",
-    " chugs a Third Wave of Coffee!",
-    "The Echo Chamber traps a wave",
-    " loves Peanuts.",
-    " misses Peanuts.",
-    "Reality flickers. Things look different ...",
-    "Reverberations are at unsafe levels!",
-    "Reverberations are at high levels!",
-    " tastes the infinite!",
-    "SALMON CANNONS FIRE",
-    " are Late to the Party",
-    " go Undersea. They're now Overperforming!",
-    "The Peanut Mister activates!",
-}
+OUTCOMES = UpdateClassifier([
+    ("half_inning_start", startswith("Top of ", "Bottom of ")),
+    ("batter_up", contains(" batting for the ")),
+    ("strike_swinging", contains("Strike, swinging", "Strikes, swinging")),
+    ("strike_looking", contains("Strike, looking", "Strikes, looking")),
+    ("strike_flinching", contains("Strike, flinching", "Strikes, flinching")),
+    ("ground_out", contains(" hit a ground out to ", " scores on the sacrifice.")),
+    ("flyout", contains(" hit a flyout to ", " hit a sacrifice fly.")),
+    ("strikeout", contains(" strikes out ")),
+    ("foul", contains("Foul Ball.", "Foul Balls.")),
+    ("ball", startswith("Ball.") + contains("\nBall. ")),
+    ("walk", contains(" draws a walk.")),
+    ("home_run", contains(" home run!")),
+    ("single", contains(" hits a Single!")),
+    ("double", contains(" hits a Double!")),
+    ("triple", contains(" hits a Triple!")),
+    ("bases_swept", contains("Baserunners are swept from play")),
+    ("steal", regex(r"(?=.* steals )(?=.* base!)")),
+    ("fielders_choice", contains("reaches on fielder's choice.")),
+    ("double_play", contains("hit into a double play!")),
+    ("caught_stealing", contains(" gets caught stealing ")),
+    ("mild_pitch", contains("throws a Mild pitch!\nBall,")),
+    ("player_skip", contains(" is Elsewhere..", " is Shelled and cannot escape")),
+    ("grand_slam", contains(" hits a grand slam!")),
+    ("run_to_safety", contains("They run to safety, resulting in an out.")),
+    ("love_walk", contains("walks to first base.")),  # Love blood
+    ("love_strikeout", contains(" times to strike out willingly!")),  # Love blood
+    ("flavor", flavor_rule()),
+    # The final score goes here, but it depends on more than the text, so
+    # consume_game_event checks for it itself
+    ("grind_rail", contains(" hops on the Grind Rail")),
+    ("secret_base", contains(" enters the Secret Base", " exits the Secret Base")),
+    ("poured_or_beaned", contains(" is Poured Over with a", " is Beaned by a")),
+    ("perks_up", contains(" Perks up")),
+    ("over_under", contains(" Over Under, On", " Over Under, Off", " Under Over, On", " Under Over, Off")),
+    ("consumers_attack", contains("CONSUMERS ATTACK")),
+    ("empty", regex(r"\Z")),
+])
+# Outcomes that come after the final score check
+AFTER_GAME_OVER = set(OUTCOMES.categories[OUTCOMES.rank("flavor") + 1:]) | {None}
 
 
 class Outcome(object):
@@ -117,11 +98,11 @@ class Outcome(object):
         return 0  # Most Excellent
 
     def add(self, day, batter, pitcher):
-        batter_vibe = batter.get_vibe(day)
+        batter_vibe = get_vibe(batter, day)
         if batter_vibe is not None:  # Ghosts from before vibes, apparently
             self.batter_occurrences[self.bin(batter_vibe)] += 1
 
-        pitcher_vibe = pitcher.get_vibe(day)
+        pitcher_vibe = get_vibe(pitcher, day)
         if pitcher_vibe is not None:  # Ghosts from before vibes, apparently
             self.pitcher_occurrences[self.bin(pitcher_vibe)] += 1
 
@@ -226,98 +207,63 @@ class GameState(object):
         if get_pitcher(update) is not None:
             self.pitcher = models.Player.load_one(get_pitcher(update))
 
-        if update['lastUpdate'].startswith("Top of "):
-            # print("Half-inning start")
-            pass
-        elif update['lastUpdate'].startswith("Bottom of "):
-            # print("Half-inning start")
-            pass
-        elif " batting for the " in update['lastUpdate']:
-            # print("Batter up")
+        day = update['day']
+        outcome = OUTCOMES.classify(update['lastUpdate'])
+        if (outcome in AFTER_GAME_OVER and
+                f"{update['homeTeamNickname']} {update['homeScore']}" in update['lastUpdate'] and
+                f"{update['awayTeamNickname']} {update['awayScore']}" in update['lastUpdate']):
+            outcome = "game_over"
+
+        if outcome in ("half_inning_start", "batter_up", "player_skip", "perks_up", "over_under",
+                       "game_over", "empty"):
             pass
-        elif "Strike, swinging" in update['lastUpdate'] or "Strikes, swinging" in update['lastUpdate']:
-            strike_swinging.add(update['day'], self.batter, self.pitcher)
-        elif "Strike, looking" in update['lastUpdate'] or "Strikes, looking" in update['lastUpdate']:
-            strike_looking.add(update['day'], self.batter, self.pitcher)
-        elif "Strike, flinching" in update['lastUpdate'] or "Strikes, flinching" in update['lastUpdate']:
-            strike_flinching.add(update['day'], self.batter, self.pitcher)
-        elif " hit a ground out to " in update['lastUpdate'] or " scores on the sacrifice." in update['lastUpdate']:
-            ground_out.add(update['day'], self.pitcher, self.batter)
-        elif " hit a flyout to " in update['lastUpdate'] or " hit a sacrifice fly." in update['lastUpdate']:
-            flyout.add(update['day'], self.pitcher, self.batter)
-        elif " strikes out " in update['lastUpdate']:
+        elif outcome == "strike_swinging":
+            strike_swinging.add(day, self.batter, self.pitcher)
+        elif outcome == "strike_looking":
+            strike_looking.add(day, self.batter, self.pitcher)
+        elif outcome == "strike_flinching":
+            strike_flinching.add(day, self.batter, self.pitcher)
+        elif outcome == "ground_out":
+            ground_out.add(day, self.pitcher, self.batter)
+        elif outcome == "flyout":
+            flyout.add(day, self.pitcher, self.batter)
+        elif outcome == "strikeout":
             if "swinging" in update['lastUpdate']:
-                strike_swinging.add(update['day'], self.batter, self.pitcher)
+                strike_swinging.add(day, self.batter, self.pitcher)
             elif "looking" in update['lastUpdate']:
-                strike_looking.add(update['day'], self.batter, self.pitcher)
+                strike_looking.add(day, self.batter, self.pitcher)
             elif "thinking" in update['lastUpdate']:
-                strike_thinking.add(update['day'], self.batter, self.pitcher)
+                strike_thinking.add(day, self.batter, self.pitcher)
             else:
                 raise RuntimeError("What kind of strikeout is this")
-        elif "Foul Ball." in update['lastUpdate'] or "Foul Balls." in update['lastUpdate']:
-            foul.add(update['day'], self.batter, self.pitcher)
-        elif update['lastUpdate'].startswith("Ball.") or "\nBall. " in update['lastUpdate']:
-            ball.add(update['day'], self.batter, self.pitcher)
-        elif " draws a walk." in update['lastUpdate']:
-            ball.add(update['day'], self.batter, self.pitcher)
-        elif " home run!" in update['lastUpdate']:
-            homer.add(update['day'], self.batter, self.pitcher)
-        elif " hits a Single!" in update['lastUpdate']:
-            single.add(update['day'], self.batter, self.pitcher)
-        elif " hits a Double!" in update['lastUpdate']:
-            double.add(update['day'], self.batter, self.pitcher)
-        elif " hits a Triple!" in update['lastUpdate']:
-            triple.add(update['day'], self.batter, self.pitcher)
-        elif "Baserunners are swept from play" in update['lastUpdate']:
-            special.add(update['day'], self.batter, self.pitcher)
-        elif " steals " in update['lastUpdate'] and " base!" in update['lastUpdate']:
-            stolen_base.add(update['day'], self.batter, self.pitcher)
-        elif "reaches on fielder's choice." in update['lastUpdate']:
-            fielders_choice.add(update['day'], self.batter, self.pitcher)
-        elif "hit into a double play!" in update['lastUpdate']:
-            double_play.add(update['day'], self.batter, self.pitcher)
-        elif " gets caught stealing " in update['lastUpdate']:
-            caught_stealing.add(update['day'], self.batter, self.pitcher)
-        elif "throws a Mild pitch!\nBall," in update['lastUpdate']:
-            special.add(update['day'], self.batter, self.pitcher)
-        elif " is Elsewhere.." in update['lastUpdate'] or " is Shelled and cannot escape" in update['lastUpdate']:
-            pass
-        elif " hits a grand slam!" in update['lastUpdate']:
-            homer.add(update['day'], self.batter, self.pitcher)
-        elif "They run to safety, resulting in an out." in update['lastUpdate']:
-            special.add(update['day'], self.batter, self.pitcher)
-        elif "walks to first base." in update['lastUpdate']:  # Love blood
-            special.add(update['day'], self.batter, self.pitcher)
-        elif " times to strike out willingly!" in update['lastUpdate']:  # Love blood
-            special.add(update['day'], self.batter, self.pitcher)
-        elif (any(event in update['lastUpdate'] for event in flavor_events) or
-              re.match(r"^\d+ Birds$", update['lastUpdate'])):
+        elif outcome == "foul":
+            foul.add(day, self.batter, self.pitcher)
+        elif outcome in ("ball", "walk"):
+            ball.add(day, self.batter, self.pitcher)
+        elif outcome in ("home_run", "grand_slam"):
+            homer.add(day, self.batter, self.pitcher)
+        elif outcome == "single":
+            single.add(day, self.batter, self.pitcher)
+        elif outcome == "double":
+            double.add(day, self.batter, self.pitcher)
+        elif outcome == "triple":
+            triple.add(day, self.batter, self.pitcher)
+        elif outcome == "steal":
+            stolen_base.add(day, self.batter, self.pitcher)
+        elif outcome == "fielders_choice":
+            fielders_choice.add(day, self.batter, self.pitcher)
+        elif outcome == "double_play":
+            double_play.add(day, self.batter, self.pitcher)
+        elif outcome == "caught_stealing":
+            caught_stealing.add(day, self.batter, self.pitcher)
+        elif outcome == "grind_rail":
+            grind_rail.add(day, self.batter, self.pitcher)
+        elif outcome in ("bases_swept", "mild_pitch", "run_to_safety", "love_walk", "love_strikeout",
+                         "secret_base", "poured_or_beaned", "consumers_attack"):
+            special.add(day, self.batter, self.pitcher)
+        elif outcome == "flavor":
             if self.batter is not None and self.pitcher is not None:
-                flavor.add(update['day'], self.batter, self.pitcher)
-        elif (f"{update['homeTeamNickname']} {update['homeScore']}" in update['lastUpdate'] and
-              f"{update['awayTeamNickname']} {update['awayScore']}" in update['lastUpdate']):
-            # print("Game over")
-            pass
-        elif " hops on the Grind Rail" in update['lastUpdate']:
-            grind_rail.add(update['day'], self.batter, self.pitcher)
-        elif (" enters the Secret Base" in update['lastUpdate'] or
-              " exits the Secret Base" in update['lastUpdate']):
-            special.add(update['day'], self.batter, self.pitcher)
-        elif (" is Poured Over with a" in update['lastUpdate'] or
-              " is Beaned by a" in update['lastUpdate']):
-            special.add(update['day'], self.batter, self.pitcher)
-        elif " Perks up" in update['lastUpdate']:
-            pass
-        elif (" Over Under, On" in update['lastUpdate'] or
-              " Over Under, Off" in update['lastUpdate'] or
-              " Under Over, On" in update['lastUpdate'] or
-              " Under Over, Off" in update['lastUpdate']):
-            pass
-        elif "CONSUMERS ATTACK" in update['lastUpdate']:
-            special.add(update['day'], self.batter, self.pitcher)
-        elif update['lastUpdate'] == "":
-            # print("Empty update")
-            pass
+                flavor.add(day, self.batter, self.pitcher)
         else:
             raise RuntimeError("Unknown gameId update")
 
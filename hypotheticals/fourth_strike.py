@@ -9,6 +9,9 @@ import numpy as np
 from blaseball_mike import chronicler
 from matplotlib import colors
 
+from util.update_classifier import (FLAVOR_EVENTS, UpdateClassifier, contains, endswith, flavor_rule, regex,
+                                    startswith)
+
 CLAB = '8d87c468-699a-47a8-b40d-cfb73a5660ad'
 
 num_games = 99
@@ -58,46 +61,130 @@ def is_crab(update):
         return update['homeTeam'] != CLAB
 
 
+CLASSIFIER = UpdateClassifier([
+    ("half_inning_start", startswith("Top of ", "Bottom of ")),
+    ("batter_up", contains(" batting for the ")),
+    ("strike", startswith("Strike, ")),
+    ("ground_out", contains(" hit a ground out to ", " scores on the sacrifice.")),
+    ("flyout", contains(" hit a flyout to ", " hit a sacrifice fly.")),
+    ("strikeout", contains(" strikes out ")),
+    ("foul", startswith("Foul Ball.")),
+    ("ball", startswith("Ball.")),
+    ("walk", contains(" draws a walk.")),
+    ("home_run", contains(" home run!")),
+    ("hit", contains(" hits a Single!", " hits a Double!", " hits a Triple!", " hits a Quadruple!")),
+    ("bases_swept", contains("Baserunners are swept from play")),
+    ("steal", regex(r"(?=.* steals )(?=.* base!)")),
+    ("fielders_choice", contains("reaches on fielder's choice.")),
+    ("double_play", contains("hit into a double play!")),
+    ("caught_stealing", contains(" gets caught stealing ")),
+    ("mild_pitch", contains("throws a Mild pitch!\nBall,")),
+    ("player_skip", contains(" is Elsewhere..", " is Shelled and cannot escape ")),
+    ("grand_slam", endswith(" hits a grand slam!")),
+    ("run_to_safety", contains("They run to safety, resulting in an out.")),
+    ("love_walk", contains("walks to first base.")),  # Love blood
+    ("love_strikeout", contains(" times to strike out willingly!")),  # Love blood
+    ("flavor", flavor_rule()),
+])
+
+
+def classify(last_update):
+    kind = CLASSIFIER.classify(last_update)
+    if kind == "strikeout":
+        if "swinging" in last_update:
+            return "strikeout_swinging"
+        elif "looking" in last_update:
+            return "strikeout_looking"
+        raise RuntimeError("What kind of strikeout is this")
+    elif kind is None:
+        raise RuntimeError("Unknown gameId update")
+    return kind
+
+
+class parsed_field(object):
+    # functools.cached_property without its lock, which costs more than most
+    # of the fields do
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.func(instance)
+        return value
+
+
+class ParsedUpdate(dict):
+    """
+    A game update, plus everything GameState works out from its text. Each
+    of those is only worked out the first time it's asked for, so any number
+    of GameStates can consume the same ParsedUpdate for the cost of one.
+    """
+
+    def __init__(self, update):
+        super().__init__(update)
+        self.kind = classify(update['lastUpdate']) if update['phase'] in (3, 5, 6) else None
+
+    @parsed_field
+    def strike_type(self):
+        for strike_type in ("flinching", "looking", "swinging"):
+            if "Strike, " + strike_type in self['lastUpdate']:
+                return strike_type
+        return None
+
+    @parsed_field
+    def out_without_reaching(self):
+        return out_without_reaching_re.search(self['lastUpdate']) is not None
+
+    @parsed_field
+    def runners_out_at_base(self):
+        return out_at_base_re.findall(self['lastUpdate'])
+
+    @parsed_field
+    def runners_who_scored(self):
+        return runners_scored_re.findall(self['lastUpdate'])
+
+    @parsed_field
+    def runners_on(self):
+        return [self['basesOccupied'].count(i) for i in range(GameState.number_of_bases)]
+
+
+def count_outcome(update):
+    global crab_hits_onto_base, crab_hits_into_fc, crab_hits_into_hr, crab_hits_into_outs, crab_fouls, crab_walks
+    global crab_strikeouts_swinging, crab_strikeouts_looking
+    global opponent_hits_onto_base, opponent_hits_into_fc, opponent_hits_into_hr, opponent_hits_into_outs
+    global opponent_fouls, opponent_walks, opponent_strikeouts_swinging, opponent_strikeouts_looking
+
+    if update.kind in ("ground_out", "flyout", "double_play"):
+        crab_hits_into_outs += is_crab(update)
+        opponent_hits_into_outs += not is_crab(update)
+    elif update.kind == "strikeout_swinging":
+        crab_strikeouts_swinging += is_crab(update)
+        opponent_strikeouts_swinging += not is_crab(update)
+    elif update.kind == "strikeout_looking":
+        crab_strikeouts_looking += is_crab(update)
+        opponent_strikeouts_looking += not is_crab(update)
+    elif update.kind == "foul":
+        crab_fouls += is_crab(update)
+        opponent_fouls += not is_crab(update)
+    elif update.kind == "walk":
+        crab_walks += is_crab(update)
+        opponent_walks += not is_crab(update)
+    elif update.kind == "home_run":
+        crab_hits_into_hr += is_crab(update)
+        opponent_hits_into_hr += not is_crab(update)
+    elif update.kind == "hit":
+        crab_hits_onto_base += is_crab(update)
+        opponent_hits_onto_base += not is_crab(update)
+    elif update.kind == "fielders_choice":
+        crab_hits_into_fc += is_crab(update)
+        opponent_hits_into_fc += not is_crab(update)
+
+
 class GameState(object):
     # Events that don't change any of the gameId state that I track
-    flavor_events = {
-        "A desolate peanutty wind blows.",
-        "Peanut fragments rustle on the infield.",
-        "A solitary peanut rolls onto the field. Nobody cares.",
-        "The faint crunch of a shell underfoot",
-        "The sour smell of rancid peanuts on the wind",
-        "The Birds circle ... but they don't find what they're looking for.",
-        "swallowed a stray peanut and had an allergic reaction!",
-        "has returned from Elsewhere",
-        "They became Magmatic!",
-        "The Blooddrain gurgled!",
-        "They are now Triple Threats!",
-        "is now Reverberating wildly!",
-        "is Partying!",
-        " has been cured of their peanut allergy!",
-        "BIRD NOISES",
-        "The Shame Pit activates!",
-        "These birds hate Blaseball!",
-        "Rogue Umpire incinerated ",
-        "Don't feed the birds",
-        "Have you ever seen this many birds?",
-        "The birds are mad at you. You specifically. You know who you are.",
-        "The birds are after the children...",
-        "The Electricity zaps a strike away!",
-        "Several birds are pecking...",
-        "Game over.",
-        "Oh dear Gods...",
-        "Where did these birds come from?",
-        "What are we gonna do with all these birds?",
-        "This is too many birds.",
-        "There's just too many birds!",
-        "They're clearing feathers off the field...",
-        "The birds are very loud!",
-        "I hardly think a few birds are going to bring about the end of the world.",
-        "The birds continue to stare.",
-        "The birds are paralyzed! They can't move!",
-        "Do these birds have souls?",
-    }
+    flavor_events = FLAVOR_EVENTS
 
     number_of_bases = 4  # Someone can update this for fifth base if they want
 
@@ -135,6 +222,9 @@ class GameState(object):
             print(*args, **kwargs)
 
     def consume(self, update):
+        if not isinstance(update, ParsedUpdate):
+            update = ParsedUpdate(update)
+
         self.home_team = update['homeTeam']
         self.away_team = update['awayTeam']
         if update['phase'] == 0:
@@ -176,11 +266,6 @@ class GameState(object):
         self.borrowed_time = False
 
     def consume_game_event(self, update):
-        global crab_hits_onto_base, crab_hits_into_fc, crab_hits_into_hr, crab_hits_into_outs, crab_fouls, crab_walks
-        global crab_strikeouts_swinging, crab_strikeouts_looking
-        global opponent_hits_onto_base, opponent_hits_into_fc, opponent_hits_into_hr, opponent_hits_into_outs
-        global opponent_fouls, opponent_walks, opponent_strikeouts_swinging, opponent_strikeouts_looking
-
         self.print(update['lastUpdate'])
 
         # assert update['inning'] == self.inning
@@ -198,85 +283,43 @@ class GameState(object):
         if self.borrowed_time:
             self.print("BORROWED TIME: ", end='')
 
-        if update['lastUpdate'].startswith("Top of "):
-            self.print("Half-inning start")
-        elif update['lastUpdate'].startswith("Bottom of "):
+        kind = update.kind
+        if kind == "half_inning_start":
             self.print("Half-inning start")
-        elif " batting for the " in update['lastUpdate']:
+        elif kind == "batter_up":
             self.current_batter = update['lastUpdate'][:update['lastUpdate'].index(" batting for the")]
             batter_id = update['awayBatter'] if update['topOfInning'] else update['homeBatter']
             self.player_id_to_name[batter_id] = self.current_batter
             self.print("Batter up")
-        elif update['lastUpdate'].startswith("Strike, "):
+        elif kind in ("strike", "strikeout_swinging", "strikeout_looking"):
             self.strike(update)
-        elif " hit a ground out to " in update['lastUpdate'] or " scores on the sacrifice." in update['lastUpdate']:
+        elif kind in ("ground_out", "flyout", "run_to_safety", "love_strikeout"):
             self.out(update)
-            crab_hits_into_outs += is_crab(update)
-            opponent_hits_into_outs += not is_crab(update)
-        elif " hit a flyout to " in update['lastUpdate'] or " hit a sacrifice fly." in update['lastUpdate']:
-            self.out(update)
-            crab_hits_into_outs += is_crab(update)
-            opponent_hits_into_outs += not is_crab(update)
-        elif " strikes out " in update['lastUpdate']:
-            self.strike(update)
-            if "swinging" in update['lastUpdate']:
-                crab_strikeouts_swinging += is_crab(update)
-                opponent_strikeouts_swinging += not is_crab(update)
-            elif "looking" in update['lastUpdate']:
-                crab_strikeouts_looking += is_crab(update)
-                opponent_strikeouts_looking += not is_crab(update)
-            else:
-                raise RuntimeError("What kind of strikeout is this")
-        elif update['lastUpdate'].startswith("Foul Ball."):
+        elif kind == "foul":
             self.foul(update)
-            crab_fouls += is_crab(update)
-            opponent_fouls += not is_crab(update)
-        elif update['lastUpdate'].startswith("Ball."):
+        elif kind in ("ball", "walk", "mild_pitch"):
             self.ball(update)
-        elif " draws a walk." in update['lastUpdate']:
-            self.ball(update)
-            crab_walks += is_crab(update)
-            opponent_walks += not is_crab(update)
-        elif " home run!" in update['lastUpdate']:
+        elif kind in ("home_run", "grand_slam"):
             self.home_run(update)
-            crab_hits_into_hr += is_crab(update)
-            opponent_hits_into_hr += not is_crab(update)
-        elif (" hits a Single!" in update['lastUpdate'] or " hits a Double!" in update['lastUpdate'] or
-              " hits a Triple!" in update['lastUpdate'] or " hits a Quadruple!" in update['lastUpdate']):
+        elif kind == "hit":
             self.hit(update)
-            crab_hits_onto_base += is_crab(update)
-            opponent_hits_onto_base += not is_crab(update)
-        elif "Baserunners are swept from play" in update['lastUpdate']:
+        elif kind == "bases_swept":
             self.clear_bases()
-        elif " steals " in update['lastUpdate'] and " base!" in update['lastUpdate']:
+        elif kind == "steal":
             self.steal(update)
-        elif "reaches on fielder's choice." in update['lastUpdate']:
+        elif kind == "fielders_choice":
             # For scoring purposes I don't THINK it matters who replaced whom
             self.out(update)
-            crab_hits_into_fc += is_crab(update)
-            opponent_hits_into_fc += not is_crab(update)
-        elif "hit into a double play!" in update['lastUpdate']:
+        elif kind == "double_play":
             self.out(update, 2)
-            crab_hits_into_outs += is_crab(update)
-            opponent_hits_into_outs += not is_crab(update)
-        elif " gets caught stealing " in update['lastUpdate']:
+        elif kind == "caught_stealing":
             self.caught_stealing(update)
-        elif "throws a Mild pitch!\nBall," in update['lastUpdate']:
-            self.ball(update)
-        elif " is Elsewhere.." in update['lastUpdate'] or " is Shelled and cannot escape " in update['lastUpdate']:
+        elif kind == "player_skip":
             self.print("Player skip")
-        elif update['lastUpdate'].endswith(" hits a grand slam!"):
-            self.home_run(update)
-        elif "They run to safety, resulting in an out." in update['lastUpdate']:
-            self.out(update)
-        elif "walks to first base." in update['lastUpdate']:  # Love blood
+        elif kind == "love_walk":
             self.walk(update)
-        elif " times to strike out willingly!" in update['lastUpdate']:  # Love blood
-            self.out(update)
-        elif any(event in update['lastUpdate'] for event in GameState.flavor_events) or re.match(r"^\d+ Birds$", update['lastUpdate']):
+        elif kind == "flavor":
             self.print("Flavor event")
-        else:
-            raise RuntimeError("Unknown gameId update")
 
         self.baserunners_prev = update['baseRunners']
 
@@ -288,10 +331,11 @@ class GameState(object):
         # assert abs(update['homeScore'] - self.runs_home) < 1e-6
         # assert abs(update['awayScore'] - self.runs_away) < 1e-6
 
-        away_str = "{0:.1f}".format(self.runs_away).rstrip('0').rstrip('.')
-        home_str = "{0:.1f}".format(self.runs_home).rstrip('0').rstrip('.')
-        self.print(
-            f"{self.outs} outs, {self.strikes} strikes, {self.balls} balls, {sum(self.runners_on)} on, score {away_str}-{home_str}")
+        if not self.quiet:
+            away_str = "{0:.1f}".format(self.runs_away).rstrip('0').rstrip('.')
+            home_str = "{0:.1f}".format(self.runs_home).rstrip('0').rstrip('.')
+            self.print(f"{self.outs} outs, {self.strikes} strikes, {self.balls} balls, "
+                       f"{sum(self.runners_on)} on, score {away_str}-{home_str}")
 
     def advance_half_inning(self):
         if self.top_of_inning:
@@ -329,8 +373,8 @@ class GameState(object):
         else:
             self.print("Out")
 
-        if out_without_reaching_re.search(update['lastUpdate']) is None:
-            runners_out = out_at_base_re.findall(update['lastUpdate'])
+        if not update.out_without_reaching:
+            runners_out = list(update.runners_out_at_base)
             if "hit into a double play!" in update['lastUpdate']:
                 # Find the runner who got out. The gameId doesn't tell us.
                 runners_out.append(self.player_id_to_name[
@@ -430,7 +474,7 @@ class GameState(object):
             runs_by_reaching_on_borrowed_time += len(self.reached_on_borrowed_time)
             self.reached_on_borrowed_time = []
         else:
-            runners_who_scored = runners_scored_re.findall(update['lastUpdate'])
+            runners_who_scored = update.runners_who_scored
             assert len(runners_who_scored) == runs_scored
             for runner in runners_who_scored:
                 if runner in self.reached_on_borrowed_time:
@@ -489,8 +533,7 @@ class GameState(object):
 
     def move_runners(self, update):
         runner_change = 0
-        for i, runners in enumerate(self.runners_on):
-            new_runners = update['basesOccupied'].count(i)
+        for i, (runners, new_runners) in enumerate(zip(self.runners_on, update.runners_on)):
             runner_change += new_runners - runners
             self.runners_on[i] = new_runners
 
@@ -553,6 +596,28 @@ class GameState(object):
         raise RuntimeError("Clab not found!")
 
 
+class Scenarios(object):
+    """
+    Several GameStates, one per counterfactual, fed the same updates. Each
+    update is parsed once and shared, so adding a scenario only adds its
+    own bookkeeping.
+    """
+
+    def __init__(self, **states):
+        self.states = states
+
+    def __getitem__(self, name):
+        return self.states[name]
+
+    def consume(self, update):
+        update = ParsedUpdate(update)
+        for state in self.states.values():
+            state.consume(update)
+        if update.kind is not None:
+            count_outcome(update)
+        return update
+
+
 def simulate_season():
     games_won_optimist, games_won_pessimist = 0, 0
     games_lost_optimist, games_lost_pessimist = 0, 0
@@ -595,21 +660,21 @@ def simulate_season():
         with open(events_file_path, 'r') as events_file:
             events = json.load(events_file)
 
-        optimist_state = GameState(optimistic=True)
-        pessimist_state = GameState(optimistic=False)
+        scenarios = Scenarios(optimist=GameState(optimistic=True),
+                              pessimist=GameState(optimistic=False))
+        optimist_state = scenarios['optimist']
+        pessimist_state = scenarios['pessimist']
 
         for event in events['data']:
-            e = event['data']
-            optimist_state.consume(e)
-            pessimist_state.consume(e)
+            e = scenarios.consume(event['data'])
 
-            if "Strike, flinching" in e['lastUpdate']:
+            if e.strike_type == "flinching":
                 crab_strikes_flinching += is_crab(e)
                 opponent_strikes_flinching += not is_crab(e)
-            elif "Strike, looking" in e['lastUpdate']:
+            elif e.strike_type == "looking":
                 crab_strikes_looking += is_crab(e)
                 opponent_strikes_looking += not is_crab(e)
-            elif "Strike, swinging" in e['lastUpdate']:
+            elif e.strike_type == "swinging":
                 crab_strikes_swinging += is_crab(e)
                 opponent_strikes_swinging += not is_crab(e)
 
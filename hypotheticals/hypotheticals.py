@@ -1,41 +1,248 @@
+"""
+Counterfactual seasons: what if a team had played under different rules?
+
+A season's events are loaded once from the datablase into one row per event
+(cached as data/events-s{season}.parquet), and the rules are applied to
+every team's plate appearances at once, since each half-inning only involves
+one team's batting. So
+
+    python hypotheticals.py --season 10 11 12 --strikes 3
+
+answers "what if every team had 3 strikes" for every team in those seasons,
+and --team Crabs just picks one row out of the result.
+
+It works like fourth_strike.py's pessimist: plate appearances that would have
+ended sooner (a strikeout on the 3rd strike, a walk on the 4th ball) end
+there, everything after them happens as it really did, except that the
+half-inning ends as soon as it has its outs. Plate appearances and
+half-innings that would have gone on longer (more strikes or balls than
+there were, or more outs than the half-inning got) can't be simulated, so
+games with any of those are counted as unknown, along with games that would
+have ended in a tie.
+"""
+
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from os import path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from blaseball_mike import models
+
+from util.http_cache import cached_session
+
+DATABLASE_EVENTS = "https://api.blaseball-reference.com/v1/events"
+
+# Pitch codes in the datablase's pitches column
+BALL, STRIKE, FOUL, OTHER = 1, 2, 3, 4
+PITCH_CODES = {"B": BALL, "C": STRIKE, "S": STRIKE, "K": STRIKE, "F": FOUL}
 
-from blaseball_mike import chronicler, database, models
-from blaseball_mike.session import session, check_network_response
+
+@dataclass
+class Rules:
+    # None keeps whatever the team really had
+    strikes: Optional[int] = None
+    balls: Optional[int] = None
+    outs: Optional[int] = None
+    run_value: float = 1
 
 
 def get_events_from_datablase(s, game_id):
-    return check_network_response(s.get("https://api.blaseball-reference.com/v1/events", params={
+    resp = s.get(DATABLASE_EVENTS, params={
         "gameId": game_id,
         "baseRunners": True,
-    }))['results']
+    })
+    resp.raise_for_status()
+    return resp.json()['results']
 
 
-def hypothetical_game(team, game_id, args, s):
-    print(f"Running hypothetical on game {game_id}")
-    events = get_events_from_datablase(s, game_id)
+def events_to_rows(game_id, events):
+    rows = []
     for event in events:
-        pass
+        runners = event.get('base_runners') or []
+        occupied = {runner['base_before_play'] for runner in runners}
+        rows.append({
+            'game_id': game_id,
+            'event_index': event['event_index'],
+            'day': event['day'],
+            'inning': event['inning'],
+            'top_of_inning': event['top_of_inning'],
+            'batter_team_id': event['batter_team_id'],
+            'pitcher_team_id': event['pitcher_team_id'],
+            'event_type': event['event_type'],
+            'pitches': "".join(event.get('pitches') or []),
+            'outs_on_play': event['outs_on_play'],
+            'runs_on_play': sum(runner.get('runs_scored', 0) for runner in runners),
+            'bases_loaded': {1, 2, 3} <= occupied,
+        })
+    return rows
+
+
+def load_season(season, data_dir="data"):
+    cache_path = path.join(data_dir, f"events-s{season}.parquet")
+    if path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    s = cached_session("datablase")
+    game_ids = list(models.Game.load_by_season(season))
+    with ThreadPoolExecutor(16) as executor:
+        events_by_game = executor.map(lambda game_id: get_events_from_datablase(s, game_id), game_ids)
+        rows = [row for game_id, events in zip(game_ids, events_by_game)
+                for row in events_to_rows(game_id, events)]
+
+    df = pd.DataFrame(rows).sort_values(['game_id', 'event_index'], ignore_index=True)
+    df.to_parquet(cache_path)
+    return df
+
+
+def pitch_matrix(pitches: pd.Series):
+    # One row per event, one column per pitch, 0 past the end
+    width = max(pitches.str.len().max(), 1)
+    lookup = np.full(256, OTHER, dtype=np.int8)
+    lookup[0] = 0
+    for code, value in PITCH_CODES.items():
+        lookup[ord(code)] = value
+    padded = pitches.str.pad(width, side='right', fillchar='\0').str.cat()
+    return lookup[np.frombuffer(padded.encode('latin-1'), dtype=np.uint8)].reshape(len(pitches), width)
+
+
+def first_true(mask):
+    # Index of the first True in each row, or -1
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
 
 
-def hypothetical_season(team, args):
-    print(f"Running hypothetical on {team.full_name} for season {args.season}")
-    s = session(expiry=None)
-    for game_id in models.Game.load_by_season(args.season, team_id=team.id):
-        hypothetical_game(team, game_id, args, s)
+def replay_counts(pitches, strikes, balls):
+    """
+    Where each plate appearance would have ended with `strikes` strikes and
+    `balls` balls (arrays, one per event), as the index of the pitch that
+    would have ended it and whether it was a strikeout or a walk. -1 if no
+    pitch would have.
+    """
+    is_ball = pitches == BALL
+    counts_as_strike = (pitches == STRIKE) | (pitches == FOUL)
+    # Fouls can't be the last strike, but they can get you to it
+    strikes_before = np.cumsum(counts_as_strike, axis=1) - counts_as_strike
+    strikeout_at = first_true((pitches == STRIKE) & (strikes_before >= strikes[:, None] - 1))
+    walk_at = first_true(is_ball & (np.cumsum(is_ball, axis=1) >= balls[:, None]))
+
+    walk_first = (walk_at >= 0) & ((strikeout_at < 0) | (walk_at < strikeout_at))
+    ends_at = np.where(walk_first, walk_at, strikeout_at)
+    return ends_at, walk_first
+
+
+def apply_rules(df: pd.DataFrame, rules: Rules):
+    """
+    Runs each team would have scored on each event, and whether the event
+    is one that can't be simulated, with `rules` applied to every team.
+    """
+    pitches = pitch_matrix(df['pitches'])
+    num_pitches = df['pitches'].str.len().to_numpy()
+    no_limit = np.full(len(df), np.iinfo(np.int32).max)
+    strikes = no_limit if rules.strikes is None else np.full(len(df), rules.strikes)
+    balls = no_limit if rules.balls is None else np.full(len(df), rules.balls)
+    ends_at, walked = replay_counts(pitches, strikes, balls)
+
+    ended_early = (ends_at >= 0) & (ends_at < num_pitches - 1)
+    strikeout = ended_early & ~walked
+    walk = ended_early & walked
+
+    # Strikeouts and walks that the new rules wouldn't have ended there
+    event_type = df['event_type'].to_numpy()
+    would_continue = (((event_type == "STRIKEOUT") & (rules.strikes is not None) & (ends_at < 0)) |
+                      ((event_type == "WALK") & (rules.balls is not None) & (ends_at < 0)))
+
+    outs_on_play = np.where(strikeout, 1, np.where(walk, 0, df['outs_on_play'].to_numpy()))
+    runs_on_play = np.where(strikeout, 0,
+                            np.where(walk, df['bases_loaded'].to_numpy().astype(float),
+                                     df['runs_on_play'].to_numpy()))
+
+    # Nothing after the half-inning's last out happens
+    outs = 3 if rules.outs is None else rules.outs
+    half_inning = df.groupby(['game_id', 'inning', 'top_of_inning'], sort=False).ngroup().to_numpy()
+    outs_before = pd.Series(outs_on_play).groupby(half_inning).cumsum().to_numpy() - outs_on_play
+    played = outs_before < outs
+
+    # Half-innings that really ended on their outs but wouldn't have had
+    # enough of them under the new rules would have gone on
+    real_outs = df['outs_on_play'].groupby(half_inning).transform('sum').to_numpy()
+    new_outs = pd.Series(outs_on_play).groupby(half_inning).transform('sum').to_numpy()
+    cut_short = (real_outs >= 3) & (new_outs < outs)
+
+    return runs_on_play * played * rules.run_value, (would_continue & played) | cut_short
+
+
+def records(df: pd.DataFrame, runs, unknown):
+    """
+    Each team's real record and its record if only it had played by the new
+    rules, judged against its opponents' real runs.
+    """
+    games = pd.DataFrame({
+        'game_id': df['game_id'],
+        'team_id': df['batter_team_id'],
+        'runs': df['runs_on_play'],
+        'new_runs': runs,
+        'unknown': unknown,
+    }).groupby(['game_id', 'team_id'], as_index=False).agg(
+        runs=('runs', 'sum'), new_runs=('new_runs', 'sum'), unknown=('unknown', 'any'))
+
+    games = games.merge(games[['game_id', 'team_id', 'runs']].rename(
+        columns={'team_id': 'opponent_id', 'runs': 'opponent_runs'}), on='game_id')
+    games = games[games['team_id'] != games['opponent_id']]
+
+    won = games['runs'] > games['opponent_runs']
+    lost = games['runs'] < games['opponent_runs']
+    new_won = ~games['unknown'] & (games['new_runs'] > games['opponent_runs'])
+    new_lost = ~games['unknown'] & (games['new_runs'] < games['opponent_runs'])
+    return pd.DataFrame({
+        'team_id': games['team_id'],
+        'wins': won,
+        'losses': lost,
+        'ties': ~won & ~lost,
+        'new_wins': new_won,
+        'new_losses': new_lost,
+        'unknown': ~new_won & ~new_lost,
+        'flipped': (won & new_lost) | (lost & new_won),
+    }).groupby('team_id').sum()
+
+
+def hypothetical_season(season, rules: Rules):
+    df = load_season(season)
+    runs, unknown = apply_rules(df, rules)
+    result = records(df, runs, unknown)
+    result.insert(0, 'season', season)
+    return result
 
 
 def main(args):
-    team = models.Team.load_by_name(args.team)
-    hypothetical_season(team, args)
+    rules = Rules(strikes=args.strikes, balls=args.balls, outs=args.outs, run_value=args.run_value)
+    print(f"Running hypothetical {rules} on seasons {', '.join(map(str, args.season))}")
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        result = pd.concat(executor.map(hypothetical_season, args.season, repeat(rules)))
+
+    teams = models.Team.load_all()
+    result.insert(1, 'team', [teams[team_id].nickname if team_id in teams else team_id
+                              for team_id in result.index])
+    if args.team is not None:
+        result = result[result['team'] == models.Team.load_by_name(args.team).nickname]
+
+    with pd.option_context('display.max_rows', None, 'display.width', None):
+        print(result.sort_values(['season', 'team']).to_string(index=False))
 
 
 if __name__ == '__main__':
     parser = ArgumentParser("Blaseball Hypotheticals")
-    # TODO: Add support for running a hypothetical on a whole season
-    parser.add_argument('--team', required=True, help="Team whose hypothetical to run")
-    parser.add_argument('--season', type=int, required=True, help="Season whose hypothetical to run")
+    parser.add_argument('--team', help="Only show this team's results")
+    parser.add_argument('--season', type=int, nargs='+', required=True, help="Seasons to run the hypothetical on")
+    parser.add_argument('--workers', type=int, default=None, help="Seasons to run at once")
 
     adjustments = parser.add_argument_group('adjustments', "Adjustments")
+    adjustments.add_argument('--strikes', type=int, help="Strikes for a strikeout")
+    adjustments.add_argument('--balls', type=int, help="Balls for a walk")
+    adjustments.add_argument('--outs', type=int, help="Outs per half-inning")
+    adjustments.add_argument('--run-value', type=float, default=1, help="What each run is worth")
 
     main(parser.parse_args())
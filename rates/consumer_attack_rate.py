@@ -9,6 +9,7 @@ import numpy as np
 from blaseball_mike import eventually, models, chronicler, utils
 from dateutil.parser import parse
 
+from util import http_cache
 from util.plot_utils import error_bounds
 
 EVENT_TYPES = {
@@ -78,21 +79,21 @@ def main():
 
 
 def get_attack_rate():
-    try:
-        with open('consumer_attack_rate.json', 'r') as f:
-            attack_rate = json.load(f)
-            num_events_per_level = attack_rate["num_events_per_level"]
-            num_attacks_per_level = attack_rate["num_attacks_per_level"]
-
-    except FileNotFoundError:
-        num_events_per_level, num_attacks_per_level = load_attack_rate()
-
-        with open('consumer_attack_rate.json', 'w') as f:
-            json.dump({
+    def compute():
+        try:
+            # From before the shared cache
+            with open('consumer_attack_rate.json', 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            num_events_per_level, num_attacks_per_level = load_attack_rate()
+            return {
                 "num_events_per_level": num_events_per_level,
                 "num_attacks_per_level": num_attacks_per_level,
-            }, f)
+            }
 
+    attack_rate = http_cache.memoize("consumer_attack_rate", "attack_rate", compute)
+    num_events_per_level = attack_rate["num_events_per_level"]
+    num_attacks_per_level = attack_rate["num_attacks_per_level"]
     return (defaultdict(int, num_attacks_per_level),
             defaultdict(int, num_events_per_level))
 
@@ -142,18 +143,18 @@ def load_attack_rate():
 
 
 def get_updates_for_team():
-    try:
-        with open('../team_updates.json', 'r') as f:
-            updates_for_team = json.load(f)
-    except FileNotFoundError:
-        updates_for_team = load_updates_for_team(updates_for_team)
-
-        with open('../team_updates.json', 'w') as f:
-            json.dump(updates_for_team, f)
-    return updates_for_team
+    def compute():
+        try:
+            # From before the shared cache
+            with open('../team_updates.json', 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return load_updates_for_team()
+
+    return http_cache.memoize("consumer_attack_rate", "team_updates", compute)
 
 
-def load_updates_for_team(updates_for_team):
+def load_updates_for_team():
     teams = models.League.load().teams
     team_updates = chronicler.get_team_updates(
         ids=list(teams.keys()),
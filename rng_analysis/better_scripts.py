@@ -1,5 +1,7 @@
 import z3, json, struct, requests, random
 
+from util import chron_client
+
 MASK = 0xFFFFFFFFFFFFFFFF
 
 def reverse17(val):
@@ -137,8 +139,7 @@ def step_backwards(s0, s1, amount):
     return s0, s1
 
 def get_first_player_data(id): 
-    versions = requests.get("https://api.sibr.dev/chronicler/v2/versions?type=player&id={}&count=1&order=asc".format(id)).json()
-    return versions["items"][0]["data"]
+    return chron_client.get_oldest_versions("player", [id])[id]["data"]
 
 def generate_statmap(players):
     statmap = {}
@@ -2,7 +2,7 @@ import copy
 import math
 from itertools import chain
 
-from rng_analysis.util import load_players_oldest_records
+from rng_analysis.player_records import load_players_oldest_records
 from rng_matcher import rng_walker_for_birth, RngMatcherError
 
 explained_failures = {
@@ -0,0 +1,168 @@
+"""
+Scores many candidate start states against one sequence of rolls at once.
+
+A template is the list of rolls a day consumes, in order, where some rolls
+carry a constraint from the known outcome (e.g. a ball means the strike zone
+roll was at least the pitcher's strike threshold). VecRng steps every
+candidate in lock-step with numpy, so checking 64 offsets or a +-N window
+costs about as much as replaying the day once.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .rng import Rng
+
+State = Tuple[Tuple[int, int], int]
+
+U17 = np.uint64(17)
+U23 = np.uint64(23)
+U26 = np.uint64(26)
+U34 = np.uint64(34)
+U46 = np.uint64(46)
+U51 = np.uint64(51)
+U12 = np.uint64(12)
+DOUBLE_ONE = np.uint64(0x3FF0000000000000)
+
+
+@dataclass
+class Roll:
+    label: str
+    # The roll must be in [lo, hi) for the candidate to pass this roll
+    lo: float = field(default=0.0)
+    hi: float = field(default=1.0)
+
+    @property
+    def constrained(self) -> bool:
+        return self.lo > 0 or self.hi < 1
+
+
+@dataclass
+class Skip:
+    # Rolls known to be consumed by something the template doesn't model
+    rolls: int
+
+
+Template = List[Union[Roll, Skip]]
+
+
+class VecRng:
+    """Same stepping rules as nd.rng.Rng, for an array of states."""
+
+    def __init__(self, states: Sequence[State]):
+        self.s0 = np.array([s[0][0] for s in states], dtype=np.uint64)
+        self.s1 = np.array([s[0][1] for s in states], dtype=np.uint64)
+        self.offset = np.array([s[1] for s in states], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offset)
+
+    @staticmethod
+    def _forward(s0, s1, amount):
+        for _ in range(amount):
+            x = s0 ^ (s0 << U23)
+            x ^= x >> U17
+            x ^= s1
+            x ^= s1 >> U26
+            s0, s1 = s1, x
+        return s0, s1
+
+    @staticmethod
+    def _backward(s0, s1, amount):
+        for _ in range(amount):
+            prev = s1 ^ (s0 >> U26) ^ s0
+            prev = prev ^ (prev >> U17) ^ (prev >> U34) ^ (prev >> U51)
+            prev = prev ^ (prev << U23) ^ (prev << U46)
+            s0, s1 = prev, s0
+        return s0, s1
+
+    def step_raw(self, amount: int, mask=None):
+        step = self._forward if amount > 0 else self._backward
+        if mask is None:
+            self.s0, self.s1 = step(self.s0, self.s1, abs(amount))
+        else:
+            self.s0[mask], self.s1[mask] = step(self.s0[mask], self.s1[mask], abs(amount))
+
+    def step(self, steps: int = 1):
+        self.offset -= steps
+
+        # Candidates cross block boundaries at different times, so only the
+        # ones that need it get moved
+        while (mask := self.offset < 0).any():
+            self.step_raw(128, mask)
+            self.offset[mask] += 64
+
+        while (mask := self.offset >= 64).any():
+            self.step_raw(-128, mask)
+            self.offset[mask] -= 64
+
+        self.step_raw(-steps)
+
+    def value(self) -> np.ndarray:
+        return ((self.s0 >> U12) | DOUBLE_ONE).view(np.float64) - 1
+
+    def next(self) -> np.ndarray:
+        self.step(1)
+        return self.value()
+
+
+def all_offsets(state: Tuple[int, int]) -> List[State]:
+    return [(state, offset) for offset in range(64)]
+
+
+def window_around(state: Tuple[int, int], offset: int, n: int) -> List[State]:
+    # The 2n + 1 states from n rolls before the given one to n rolls after
+    r = Rng(state, offset)
+    r.step(-n - 1)
+    window = []
+    for _ in range(2 * n + 1):
+        r.step(1)
+        window.append((r.state, r.offset))
+    return window
+
+
+@dataclass
+class Scores:
+    candidates: List[State]
+    passed: np.ndarray
+    failed: np.ndarray
+    # Index into the template of each candidate's first failed roll, or the
+    # template length if it never failed
+    first_failure: np.ndarray
+
+    def ranked(self) -> np.ndarray:
+        return np.lexsort((-self.first_failure, -self.passed + self.failed))
+
+    def print_top(self, n: int = 10):
+        for i in self.ranked()[:n]:
+            (s0, s1), offset = self.candidates[i]
+            failure = f"first at roll {self.first_failure[i]}" if self.failed[i] else "never"
+            print(f"Rng(({s0}, {s1}), {offset}): {self.passed[i]} passed, "
+                  f"{self.failed[i]} failed ({failure})")
+
+
+def score(candidates: List[State], template: Template, start_step: int = 0) -> Scores:
+    rng = VecRng(candidates)
+    if start_step:
+        rng.step(start_step)
+
+    passed = np.zeros(len(rng), dtype=np.int64)
+    failed = np.zeros(len(rng), dtype=np.int64)
+    first_failure = np.full(len(rng), len(template), dtype=np.int64)
+    for i, roll in enumerate(template):
+        if isinstance(roll, Skip):
+            rng.step(roll.rolls)
+            continue
+
+        value = rng.next()
+        if not roll.constrained:
+            continue
+
+        ok = (roll.lo <= value) & (value < roll.hi)
+        passed += ok
+        failed += ~ok
+        first_failure[~ok & (first_failure == len(template))] = i
+
+    return Scores(candidates, passed, failed, first_failure)
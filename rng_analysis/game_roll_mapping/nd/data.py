@@ -1,5 +1,7 @@
+import asyncio
 import json
-import requests
+
+from util import chron_client
 
 # Lawful Good -> Chaotic Good -> Lawful Evil -> Chaotic Evil
 team_order = [
@@ -64,30 +66,27 @@ blood_types = ["A", "AAA", "AA", "Acidic", "Basic", "O", "O No", "H₂O", "Elect
 coffee_styles = ["Black", "Light & Sweet", "Macchiato", "Cream & Sugar", "Cold Brew", "Flat White", "Americano", "Espresso", "Heavy Foam", "Latte", "Decaf", "Milk Substitute", "Plenty of Sugar", "Anything"]
 
 def get_teams(at):
-    teams = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=team&at={}".format(at)).json()
-    return {t["entityId"]: t["data"] for t in teams["items"]}
+    return chron_client.get_entities("team", at)
 
 def get_players(at):
-    players = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=player&at={}".format(at)).json()
-    return {t["entityId"]: t["data"] for t in players["items"]}
+    return chron_client.get_entities("player", at)
 
 def get_team_roster(team):
     return team["lineup"] + team["rotation"] + team.get("shadows", []) + team.get("bench", []) + team.get("bullpen", [])
 
-def get_team_order(at):
-    sim = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=sim&at={}".format(at)).json()
-
-    subleagues = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=subleague&at={}".format(at)).json()
-    subleagues = {d["entityId"]: d["data"] for d in subleagues["items"]}
+async def _get_team_order(at):
+    client = chron_client.default_client()
+    sim, subleagues, divisions = await asyncio.gather(
+        client.get_entities("sim", at),
+        client.get_entities("subleague", at),
+        client.get_entities("division", at),
+    )
 
-    divisions = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=division&at={}".format(at)).json()
-    divisions = {d["entityId"]: d["data"] for d in divisions["items"]}
-
-    league_id = sim["items"][0]["data"]["league"]
-    league = requests.get("https://api.sibr.dev/chronicler/v2/entities?type=league&at={}&id={}".format(at, league_id)).json()
+    league_id = next(iter(sim.values()))["league"]
+    league = (await client.get_entities("league", at, [league_id]))[league_id]
 
     team_ids = []
-    for subleague_id in league["items"][0]["data"]["subleagues"]:
+    for subleague_id in league["subleagues"]:
         subleague = subleagues[subleague_id]
         for division_id in subleague["divisions"]:
             division = divisions[division_id]
@@ -95,6 +94,9 @@ def get_team_order(at):
                 team_ids.append(team_id)
     return team_ids
 
+def get_team_order(at):
+    return chron_client.run(_get_team_order(at))
+
 def load_oldest():
     with open("players_baby_grand_oldest.json", encoding="utf-8") as f:
         data = json.load(f)
@@ -0,0 +1,143 @@
+"""
+Local point-in-time store for Chronicler entities (teams, players, stadiums...).
+
+Every version of every entity of one type is kept in an Arrow IPC file as
+(entity_id, valid_from, valid_to, data). On load each entity gets a sorted
+array of its validFrom times, so finding the version in effect at a timestamp
+is a binary search and never touches the network.
+
+Build one for a resim window with
+
+    store = EntityStore.fetch("player", after=min_stamp, before=max_stamp)
+    store.save("cache/entities_player.arrow")
+
+and then `store.at(timestamp)` gives the same {entityId: data} mapping as
+`/v2/entities?type=player&at=timestamp`.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import requests
+from dateutil.parser import isoparse
+
+CHRON_BASE = "https://api.sibr.dev/chronicler/v2"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+OPEN_ENDED = np.iinfo(np.int64).max
+
+SCHEMA = pa.schema([
+    ("entity_id", pa.string()),
+    ("valid_from", pa.int64()),
+    ("valid_to", pa.int64()),
+    ("data", pa.string()),
+])
+
+
+def to_micros(timestamp: Optional[str]) -> int:
+    # Chronicler timestamps have anywhere from 0 to 6 fractional digits, so
+    # they can't be compared as strings
+    if timestamp is None:
+        return OPEN_ENDED
+    return (isoparse(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def chron_pages(url: str, params: dict) -> Iterator[dict]:
+    session = requests.Session()
+    params = dict(params, count=1000)
+    while True:
+        resp = session.get(url, params=params).json()
+        yield from resp["items"]
+
+        if not resp.get("nextPage") or not resp["items"]:
+            break
+        params["page"] = resp["nextPage"]
+
+
+class EntityStore:
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.entity_ids = table.column("entity_id").to_pylist()
+        self.valid_to = table.column("valid_to").to_numpy()
+        self.data = table.column("data")
+
+        valid_from = table.column("valid_from").to_numpy()
+        rows_for_entity = {}
+        for row, entity_id in enumerate(self.entity_ids):
+            rows_for_entity.setdefault(entity_id, []).append(row)
+
+        # entity id -> (sorted validFrom times, row of each)
+        self.index: Dict[str, tuple] = {}
+        for entity_id, rows in rows_for_entity.items():
+            rows = np.array(rows)
+            order = np.argsort(valid_from[rows], kind="stable")
+            self.index[entity_id] = (valid_from[rows][order], rows[order])
+
+    @classmethod
+    def load(cls, path: str) -> "EntityStore":
+        # The table's buffers keep the mapping alive, so it isn't closed here
+        return cls(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, SCHEMA, options=options) as writer:
+                writer.write_table(self.table)
+
+    @classmethod
+    def from_versions(cls, versions: Iterator[dict]) -> "EntityStore":
+        seen = set()
+        columns = {name: [] for name in SCHEMA.names}
+        for version in versions:
+            key = (version["entityId"], version["validFrom"])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            columns["entity_id"].append(version["entityId"])
+            columns["valid_from"].append(to_micros(version["validFrom"]))
+            columns["valid_to"].append(to_micros(version.get("validTo")))
+            columns["data"].append(json.dumps(version["data"], separators=(",", ":")))
+        return cls(pa.table(columns, schema=SCHEMA))
+
+    @classmethod
+    def fetch(cls, type_: str, after: str, before: str) -> "EntityStore":
+        # The versions endpoint filters on validFrom, so entities that didn't
+        # change during the window need to be seeded from a snapshot at its start
+        def versions():
+            yield from chron_pages(f"{CHRON_BASE}/entities", {"type": type_, "at": after})
+            yield from chron_pages(f"{CHRON_BASE}/versions", {
+                "type": type_, "after": after, "before": before, "order": "asc",
+            })
+
+        return cls.from_versions(versions())
+
+    def row_at(self, entity_id: str, at: int) -> Optional[int]:
+        if entity_id not in self.index:
+            return None
+
+        valid_from, rows = self.index[entity_id]
+        i = np.searchsorted(valid_from, at, side="right") - 1
+        if i < 0 or self.valid_to[rows[i]] <= at:
+            return None
+        return rows[i]
+
+    def get(self, entity_id: str, timestamp: str) -> Optional[dict]:
+        row = self.row_at(entity_id, to_micros(timestamp))
+        if row is None:
+            return None
+        return json.loads(self.data[row].as_py())
+
+    def at(self, timestamp: str) -> Dict[str, dict]:
+        # Always parses fresh dicts, since resims mutate what they get back
+        at = to_micros(timestamp)
+        snapshot = {}
+        for entity_id in self.index:
+            row = self.row_at(entity_id, at)
+            if row is not None:
+                snapshot[entity_id] = json.loads(self.data[row].as_py())
+        return snapshot
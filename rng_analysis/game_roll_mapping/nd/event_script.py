@@ -0,0 +1,375 @@
+"""
+Event scripts: the hand-written games from finals_solve as data.
+
+A script is a CSV file with the columns event, pitcher, batter, arg, flags.
+Most rows are one pitch/play (sl, ss, ball, foul, ground_out, flyout, bird,
+solo_homer, two_run_homer, single, double, triple, base_steal,
+caught_stealing) with the fielder name in `arg` for outs and any of
+`runner inning_ending is_on_third` in `flags`. A few rows control the run
+instead:
+
+    players_at,,,2020-08-09T00:25:00Z,    which players/lineups to use
+    start,,,2009851709471025379 7904764474545764681 7,
+    step,,,14,                            unexplained rolls (fc? dp?)
+    weather,,,peanuts,
+
+Names are resolved to indices once by compile_script, so a compiled script
+can be rerun against many start states:
+
+    python -m nd.event_script convert finals_solve_orig.py finals.csv
+    python -m nd.event_script run finals.csv
+"""
+
+import ast
+import csv
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import data
+from .rng import Rng
+
+COLUMNS = ["event", "pitcher", "batter", "arg", "flags"]
+FLAGS = ["runner", "inning_ending", "is_on_third"]
+CONTROL_EVENTS = {"players_at", "start", "step", "weather"}
+
+
+@dataclass
+class Op:
+    line: int
+    event: str
+    pitcher: int = -1
+    batter: int = -1
+    # Lineup slot of the fielder an out went to
+    fielder: int = -1
+    runner: bool = False
+    inning_ending: bool = False
+    is_on_third: bool = False
+    steps: int = 0
+    weather: Optional[str] = None
+
+
+@dataclass
+class Roster:
+    names: List[str]
+    ruthlessness: np.ndarray
+    moxie: np.ndarray
+    musclitude: np.ndarray
+    lineup_slot: Dict[str, int]
+    index: Dict[str, int] = field(init=False)
+
+    def __post_init__(self):
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def at(cls, timestamp: str) -> "Roster":
+        teams = data.get_teams(timestamp)
+        players = list(data.get_players(timestamp).values())
+
+        name_for_id = {p["id"]: p["name"] for p in players}
+        lineup_slot = {}
+        for team in teams.values():
+            for i, player_id in enumerate(team["lineup"]):
+                lineup_slot[name_for_id[player_id]] = i
+
+        return cls(
+            names=[p["name"] for p in players],
+            ruthlessness=np.array([p["ruthlessness"] for p in players]),
+            moxie=np.array([p["moxie"] for p in players]),
+            musclitude=np.array([p["musclitude"] for p in players]),
+            lineup_slot=lineup_slot,
+        )
+
+
+def read_script(path: str) -> List[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def write_script(path: str, rows: List[dict]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def script_settings(rows: List[dict]) -> Tuple[Optional[str], Optional[Tuple[Tuple[int, int], int]]]:
+    players_at, start = None, None
+    for row in rows:
+        if row["event"] == "players_at":
+            players_at = row["arg"]
+        elif row["event"] == "start" and start is None:
+            s0, s1, offset = (int(x) for x in row["arg"].split())
+            start = ((s0, s1), offset)
+    return players_at, start
+
+
+def compile_script(rows: List[dict], roster: Roster) -> List[Op]:
+    ops = []
+    for line, row in enumerate(rows, start=2):
+        event = row["event"]
+        if event in ("players_at", "start"):
+            continue
+        if event not in CONTROL_EVENTS and event not in HANDLERS:
+            raise ValueError(f"line {line}: unknown event {event!r}")
+
+        op = Op(line, event)
+        if event == "step":
+            op.steps = int(row["arg"])
+        elif event == "weather":
+            op.weather = row["arg"]
+        else:
+            if row["pitcher"]:
+                op.pitcher = roster.index[row["pitcher"]]
+            if row["batter"]:
+                op.batter = roster.index[row["batter"]]
+            if row["arg"]:
+                op.fielder = roster.lineup_slot[row["arg"]]
+            flags = (row["flags"] or "").split()
+            for flag in flags:
+                if flag not in FLAGS:
+                    raise ValueError(f"line {line}: unknown flag {flag!r}")
+                setattr(op, flag, True)
+        ops.append(op)
+    return ops
+
+
+class Interpreter:
+    def __init__(self, roster: Roster, rng: Rng, verbose: bool = True):
+        self.roster = roster
+        self.r = rng
+        self.weather = None
+        self.verbose = verbose
+        self.errors: List[Tuple[int, str]] = []
+        self.op: Optional[Op] = None
+
+    def error(self, message: str):
+        self.errors.append((self.op.line, message))
+        if self.verbose:
+            print(f"line {self.op.line} @ {self.r.get_state_str()}: {message}")
+
+    def run(self, ops: List[Op]) -> List[Tuple[int, str]]:
+        for op in ops:
+            self.op = op
+            if op.event == "step":
+                self.r.step(op.steps)
+            elif op.event == "weather":
+                self.weather = op.weather
+            else:
+                HANDLERS[op.event](self, op)
+        return self.errors
+
+    # Rolls shared by most events
+
+    def weather_check(self, birds: bool):
+        roll = self.r.next()
+        if self.weather == "birds" and (roll < 0.05) != birds:
+            self.error(f"rolled {roll}, wrong birds")
+        return roll
+
+    def pitch_start(self, op: Op):
+        self.weather_check(False)
+        self.r.next()
+        if op.runner:
+            self.r.next()
+
+    def strike_swing_check(self, op: Op, outcome: str):
+        strike_roll = self.r.next()
+        self.r.next()
+
+        threshold = 0.35 + self.roster.ruthlessness[op.pitcher] * 0.35
+        if outcome == "b" and strike_roll < threshold:
+            self.error(f"rolled {strike_roll}, too low for ball, threshold is {threshold}")
+        if outcome == "sl" and strike_roll >= threshold:
+            self.error(f"rolled {strike_roll}, too high for strike looking")
+
+    def fielder_check(self, op: Op, fielder_roll: float, what: str):
+        if int(fielder_roll * 9) != op.fielder:
+            self.error(f"{what} rolled {fielder_roll}, wrong fielder")
+
+    def rolls(self, n: int):
+        for _ in range(n):
+            self.r.next()
+
+    # One method per event, consuming the same rolls as finals_solve_orig
+
+    def sl(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "sl")
+
+    def ss(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "ss")
+        self.rolls(1)
+
+    def ball(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "b")
+
+    def foul(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "f")
+        self.rolls(1)
+        fair = self.r.next()
+        if fair > 0.36 and self.verbose:
+            print(f"line {op.line}: warn: rolled high fair on foul ({fair}) "
+                  f"with musc {self.roster.musclitude[op.batter]:.03f}")
+
+    def ground_out(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "go")
+        self.rolls(6)
+        fielder = self.r.next()
+        if not op.inning_ending:
+            if op.runner:
+                self.rolls(1)
+            if op.is_on_third:
+                self.rolls(1)  # rgsots check??
+        self.fielder_check(op, fielder, "ground out")
+
+    def flyout(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "fo")
+        self.rolls(4)
+        fielder = self.r.next()
+        self.rolls(1)
+        self.fielder_check(op, fielder, "flyout")
+        if not op.inning_ending and op.runner:
+            self.rolls(1)
+
+    def bird(self, op: Op):
+        self.weather_check(True)
+        self.rolls(2)
+
+    def homer(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "h")
+        self.rolls(5)
+
+    def single(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "h")
+        self.rolls(8)
+        if not op.is_on_third and op.runner:
+            self.rolls(1)
+
+    def extra_base_hit(self, op: Op):
+        self.pitch_start(op)
+        self.strike_swing_check(op, "h")
+        self.rolls(8)
+
+    def base_steal(self, op: Op):
+        self.weather_check(False)
+        self.rolls(3)
+
+    def caught_stealing(self, op: Op):
+        # this is probably wrong somehow
+        self.weather_check(False)
+        self.rolls(5)
+
+
+HANDLERS = {
+    "sl": Interpreter.sl,
+    "ss": Interpreter.ss,
+    "ball": Interpreter.ball,
+    "foul": Interpreter.foul,
+    "ground_out": Interpreter.ground_out,
+    "flyout": Interpreter.flyout,
+    "bird": Interpreter.bird,
+    "solo_homer": Interpreter.homer,
+    "two_run_homer": Interpreter.homer,
+    "single": Interpreter.single,
+    "double": Interpreter.extra_base_hit,
+    "triple": Interpreter.extra_base_hit,
+    "base_steal": Interpreter.base_steal,
+    "caught_stealing": Interpreter.caught_stealing,
+}
+
+# Positional arguments of the finals_solve functions, after pitcher and batter
+POSITIONAL_ARG = {"ground_out", "flyout"}
+
+
+def count_nexts(node) -> int:
+    return sum(isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr == "next"
+               for n in ast.walk(node))
+
+
+def convert_python(path: str) -> List[dict]:
+    # Pulls the module-level calls out of a finals_solve-style file
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    rows = []
+
+    def row(event, pitcher="", batter="", arg="", flags=""):
+        rows.append(dict(event=event, pitcher=pitcher, batter=batter, arg=arg, flags=flags))
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name == "timestamp":
+                row("players_at", arg=ast.literal_eval(node.value))
+            elif name == "weather":
+                row("weather", arg=ast.literal_eval(node.value))
+            elif name == "r" and isinstance(node.value, ast.Call):
+                (s0, s1), offset = (ast.literal_eval(a) for a in node.value.args)
+                row("start", arg=f"{s0} {s1} {offset}")
+            elif count_nexts(node.value):
+                row("step", arg=str(count_nexts(node.value)))
+            continue
+
+        if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call)):
+            continue
+        call = node.value
+        if isinstance(call.func, ast.Attribute) and call.func.attr == "step":
+            row("step", arg=str(ast.literal_eval(call.args[0]) if call.args else 1))
+        elif (isinstance(call.func, ast.Attribute) and call.func.attr == "next" or
+              isinstance(call.func, ast.Name) and call.func.id == "print"):
+            # r.next() and print(r.next()) still use a roll each
+            if count_nexts(call):
+                row("step", arg=str(count_nexts(call)))
+        elif isinstance(call.func, ast.Name) and call.func.id in HANDLERS:
+            event = call.func.id
+            args = [ast.literal_eval(a) for a in call.args]
+            kwargs = {k.arg: ast.literal_eval(k.value) for k in call.keywords}
+            if event in ("base_steal", "caught_stealing"):
+                # (pitcher, runner)
+                row(event, pitcher=args[0], batter=args[1])
+                continue
+            pitcher, batter, *rest = args + [""] * (2 - len(args))
+            arg = rest[0] if event in POSITIONAL_ARG and rest else kwargs.pop("out_to", "")
+            flags = " ".join(flag for flag in FLAGS if kwargs.get(flag))
+            row(event, pitcher, batter, arg, flags)
+
+    return rows
+
+
+def error_counts(ops: List[Op], roster: Roster,
+                 states: List[Tuple[Tuple[int, int], int]]) -> List[int]:
+    counts = []
+    for state in states:
+        counts.append(len(Interpreter(roster, Rng(*state), verbose=False).run(ops)))
+    return counts
+
+
+def main(argv: List[str]):
+    command, path = argv[0], argv[1]
+    if command == "convert":
+        write_script(argv[2], convert_python(path))
+        return
+
+    rows = read_script(path)
+    players_at, start = script_settings(rows)
+    roster = Roster.at(players_at)
+    ops = compile_script(rows, roster)
+
+    # The script has its own step(-1) after the start row if it needs one
+    rng = Rng(*start)
+    errors = Interpreter(roster, rng).run(ops)
+    print(f"{len(errors)} errors, ended at {rng.get_state_str()}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -109,10 +109,17 @@ def to_coffee(val):
 class Rng(object):
     state: Tuple[int, int]
     offset: int
+    # Net number of rolls stepped since construction
+    position: int
+    # The part of position that came from calling step() directly rather
+    # than rolling, i.e. the resims' corrections
+    corrections: int
 
     def __init__(self, state: Tuple[int, int], offset: int):
         self.state = state
         self.offset = offset
+        self.position = 0
+        self.corrections = 0
 
     def get_state(self) -> Tuple[int, int, int]:
         return self.state[0], self.state[1], self.offset
@@ -135,7 +142,7 @@ class Rng(object):
         return to_double(self.state[0])
 
     def next(self) -> float:
-        self.step(1)
+        self._step(1)
         return self.value()
 
     def prev(self) -> float:
@@ -151,6 +158,11 @@ class Rng(object):
                 self.state = xs128p_backward(self.state)
 
     def step(self, steps=1, debug_block_boundaries=False):
+        self.corrections += steps
+        self._step(steps, debug_block_boundaries)
+
+    def _step(self, steps=1, debug_block_boundaries=False):
+        self.position += steps
         self.offset -= steps
 
         while self.offset < 0:
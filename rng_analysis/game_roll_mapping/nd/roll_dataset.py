@@ -0,0 +1,105 @@
+"""
+One Parquet dataset for the roll logs of every resimmed game.
+
+Rows are the rng_game event rows (flattened "batter.moxie"-style columns plus
+a game_id column), hive-partitioned by event type, so a read like
+
+    read("roll_data/events", columns=["batter_swings_roll", "batter.moxie"],
+         filter=ds.field("event_type") == "EventType.StrikeLooking")
+
+only opens the StrikeLooking files and only decodes those two columns.
+Re-adding a game replaces its rows.
+
+To load the game_*.csv / game_*.parquet files from older resims:
+
+    python -m nd.roll_dataset roll_data/events game_*.csv game_*.parquet
+"""
+
+import os
+import sys
+from glob import glob
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARTITIONING = ds.partitioning(pa.schema([("event_type", pa.string())]), flavor="hive")
+
+
+def game_id_for_path(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0][len("game_"):]
+
+
+def append_game(dataset_dir: str, game_id: str, table: pa.Table):
+    # Rows with no event type only mark rolls that no event accounts for
+    table = table.filter(pc.is_valid(table.column("event_type")))
+    # event_type may come in dictionary-encoded, but partition values have to
+    # be plain strings
+    if pa.types.is_dictionary(table.schema.field("event_type").type):
+        table = table.set_column(table.schema.get_field_index("event_type"), "event_type",
+                                 table.column("event_type").cast(pa.string()))
+    table = table.append_column("game_id", pa.array([game_id] * len(table), pa.string()))
+
+    # Files are named after the game. Clear out the old ones first, in case
+    # an event type it used to have isn't there any more
+    for old_file in glob(os.path.join(dataset_dir, "*", f"{game_id}-*.parquet")):
+        os.remove(old_file)
+    ds.write_dataset(
+        table, dataset_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"{game_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+def read_game_file(path: str) -> pa.Table:
+    if path.endswith(".parquet"):
+        return pq.read_table(path)
+
+    df = pd.read_csv(path)
+    # Old CSVs were written with the pandas index
+    return pa.Table.from_pandas(df.drop(columns=["Unnamed: 0"], errors="ignore"),
+                                preserve_index=False)
+
+
+def has_game(dataset_dir: str, game_id: str) -> bool:
+    return bool(glob(os.path.join(dataset_dir, "*", f"{game_id}-*.parquet")))
+
+
+def import_files(dataset_dir: str, paths: List[str]):
+    for path in paths:
+        append_game(dataset_dir, game_id_for_path(path), read_game_file(path))
+
+
+def import_missing(dataset_dir: str, paths: List[str]):
+    # Only the games that aren't in the dataset yet, so a newer resim of a
+    # game isn't overwritten by its old file
+    import_files(dataset_dir, [path for path in paths
+                               if not has_game(dataset_dir, game_id_for_path(path))])
+
+
+def dataset(dataset_dir: str) -> ds.Dataset:
+    # Games from different resims have different columns, so the schema is
+    # unified from every file's footer rather than taken from the first one
+    files = glob(os.path.join(dataset_dir, "*", "*.parquet"))
+    schema = pa.unify_schemas([pq.read_schema(f) for f in files] + [PARTITIONING.schema],
+                              promote_options="permissive")
+    return ds.dataset(dataset_dir, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+
+def read(dataset_dir: str, columns: Optional[List[str]] = None,
+         filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+    if columns is not None and "event_type" not in columns:
+        columns = ["event_type", *columns]
+    df = dataset(dataset_dir).to_table(columns=columns, filter=filter).to_pandas()
+    df["event_type"] = df["event_type"].astype("category")
+    return df
+
+
+if __name__ == "__main__":
+    import_files(sys.argv[1], [p for pattern in sys.argv[2:] for p in glob(pattern)])
@@ -0,0 +1,110 @@
+"""
+Where do the rolls (and the time) go in a resim?
+
+The resim calls begin() when it starts handling an event and end() when it's
+done; rolls are counted from Rng.position and corrections (steps the resim
+makes directly, like `r.step(14)  # fc?`) from Rng.corrections, so the
+profiler never touches the Rng. A disabled profiler returns straight out of
+every method.
+"""
+
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from .rng import Rng
+
+Key = Tuple[str, str, str]
+BETWEEN_EVENTS: Key = ("(between events)", "-", "-")
+
+
+@dataclass
+class EventStats:
+    count: int = 0
+    roll_counts: Counter = field(default_factory=Counter)
+    corrections: int = 0
+    seconds: float = 0
+
+    @property
+    def rolls(self) -> int:
+        return sum(n * times for n, times in self.roll_counts.items())
+
+
+class RollProfiler:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.stats: Dict[Key, EventStats] = {}
+        self.current = None
+        self.last: Optional[Tuple[int, int]] = None
+
+    def _record(self, key: Key, rolls: int, corrections: int, seconds: float):
+        stats = self.stats.setdefault(key, EventStats())
+        stats.count += 1
+        stats.roll_counts[rolls] += 1
+        stats.corrections += corrections
+        stats.seconds += seconds
+
+    def begin(self, rng: Rng, event_type=None, weather=None, handler=None):
+        if not self.enabled:
+            return
+
+        self.end(rng)
+        if self.last is not None:
+            position, corrections = self.last
+            moved = rng.position - position
+            corrected = rng.corrections - corrections
+            if moved or corrected:
+                self._record(BETWEEN_EVENTS, moved - corrected, corrected, 0)
+
+        self.current = dict(position=rng.position, corrections=rng.corrections,
+                            start=time.perf_counter(), event_type=event_type,
+                            weather=weather, handler=handler)
+
+    def annotate(self, **labels):
+        # For labels that aren't known yet when the event begins
+        if not self.enabled or self.current is None:
+            return
+        self.current.update((k, v) for k, v in labels.items() if v is not None)
+
+    def end(self, rng: Rng, event_type=None):
+        if not self.enabled or self.current is None:
+            return
+
+        self.annotate(event_type=event_type)
+        current = self.current
+        corrected = rng.corrections - current["corrections"]
+        key = (str(current["event_type"]), str(current["weather"]), str(current["handler"] or "-"))
+        self._record(key, rng.position - current["position"] - corrected, corrected,
+                     time.perf_counter() - current["start"])
+
+        self.current = None
+        self.last = (rng.position, rng.corrections)
+
+    def print_summary(self, title: str = ""):
+        if not self.enabled:
+            return
+
+        print(f"Roll profile {title}".strip())
+        header = (f"{'event type':<24} {'weather':>7} {'handler':<20} {'count':>6} {'rolls':>7} "
+                  f"{'fixes':>6} {'ms':>8} {'us/evt':>7}  rolls per event (x times)")
+        print(header)
+        print("-" * len(header))
+        by_time = sorted(self.stats.items(), key=lambda item: -item[1].seconds)
+        for (event_type, weather, handler), stats in by_time:
+            counts = " ".join(f"{n}x{times}" for n, times in sorted(stats.roll_counts.items()))
+            print(f"{event_type:<24} {weather:>7} {handler:<20} {stats.count:>6} {stats.rolls:>7} "
+                  f"{stats.corrections:>6} {stats.seconds * 1000:>8.1f} "
+                  f"{stats.seconds * 1e6 / stats.count:>7.0f}  {counts}")
+
+        total = EventStats()
+        for stats in self.stats.values():
+            total.count += stats.count
+            total.roll_counts.update(stats.roll_counts)
+            total.corrections += stats.corrections
+            total.seconds += stats.seconds
+        print(f"{'total':<24} {'':>7} {'':<20} {total.count:>6} {total.rolls:>7} "
+              f"{total.corrections:>6} {total.seconds * 1000:>8.1f}")
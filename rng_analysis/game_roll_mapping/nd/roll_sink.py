@@ -0,0 +1,69 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Value used for a column that wasn't given in a row, by numpy dtype kind
+MISSING = {
+    "f": np.nan,
+    "i": 0,
+    "b": False,
+    "O": None,
+}
+
+
+class ColumnarSink:
+    """
+    Collects rows into one preallocated numpy array per column instead of a
+    list of dataclasses. `schema` maps column name to numpy dtype (use "O" for
+    strings). Arrays double in size when full, so appending is amortized O(1)
+    and nothing is converted until the table is written out.
+    """
+
+    def __init__(self, schema: Dict[str, str], capacity: int = 1024):
+        self.schema = {name: np.dtype(dtype) for name, dtype in schema.items()}
+        self.length = 0
+        self.arrays = {
+            name: self._empty(dtype, capacity) for name, dtype in self.schema.items()
+        }
+
+    @staticmethod
+    def _empty(dtype: np.dtype, size: int) -> np.ndarray:
+        return np.full(size, MISSING[dtype.kind], dtype=dtype)
+
+    def __len__(self):
+        return self.length
+
+    def _grow(self):
+        for name, array in self.arrays.items():
+            grown = self._empty(array.dtype, len(array) * 2)
+            grown[: self.length] = array[: self.length]
+            self.arrays[name] = grown
+
+    def append(self, **values):
+        if self.length == len(next(iter(self.arrays.values()))):
+            self._grow()
+
+        for name, value in values.items():
+            if value is not None:
+                self.arrays[name][self.length] = value
+        self.length += 1
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {name: array[: self.length] for name, array in self.arrays.items()}
+
+    def to_arrow(self) -> pa.Table:
+        arrays = {}
+        for name, column in self.columns().items():
+            if column.dtype.kind == "O":
+                # Names and event types repeat a lot, so dictionary-encode them
+                arrays[name] = pa.array(column, type=pa.string()).dictionary_encode()
+            elif column.dtype.kind == "f":
+                arrays[name] = pa.array(column, from_pandas=True)
+            else:
+                arrays[name] = pa.array(column)
+        return pa.table(arrays)
+
+    def to_parquet(self, path: str, compression: Optional[str] = "zstd"):
+        pq.write_table(self.to_arrow(), path, compression=compression)
@@ -0,0 +1,138 @@
+"""
+Exact threshold fitting with linear programming.
+
+Each logged roll gives one linear constraint on a threshold formula
+`threshold = intercept + sum(coef * attr)`: if the outcome says the roll
+passed then roll < threshold, otherwise roll >= threshold. If the formula is
+right and the rolls are aligned, the constraints are all satisfiable and the
+coefficients that satisfy them form a polytope. ThresholdFitter finds a point
+in it with the largest margin, the range of each coefficient over it, or, if
+there's no such point, a minimal set of rows that contradict each other
+(which is usually a misaligned roll).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import linprog
+
+INTERCEPT = "intercept"
+
+
+@dataclass
+class Fit:
+    feasible: bool
+    # Smallest distance between a roll and the threshold. Negative if the
+    # rows are contradictory, in which case it's the least-bad compromise.
+    margin: float
+    coefficients: Dict[str, float]
+    conflicting_rows: Optional[List[int]] = None
+
+
+class ThresholdFitter:
+    def __init__(self, features: Sequence[str]):
+        self.features = list(features)
+        self.names = self.features + [INTERCEPT]
+        self.chunks: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.rows = 0
+        self.solution: Optional[np.ndarray] = None
+        self.margin: Optional[float] = None
+        self._matrix = None
+
+    def add(self, attrs: np.ndarray, rolls: np.ndarray, passed: np.ndarray):
+        """
+        attrs is one row per roll with a column for each feature, passed is
+        True where the outcome means the roll was under the threshold.
+        """
+        attrs = np.asarray(attrs, dtype=float)
+        rolls = np.asarray(rolls, dtype=float)
+        # Rewrite every row as A @ [coefs, intercept] <= b
+        sign = np.where(np.asarray(passed, dtype=bool), -1.0, 1.0)
+        a = sign[:, None] * np.hstack([attrs, np.ones((len(attrs), 1))])
+        b = sign * rolls
+        self.chunks.append((a, b))
+        self.rows += len(b)
+        self._matrix = None
+
+        # New rows that the current solution already satisfies with the same
+        # margin don't change the answer, so there's nothing to re-solve
+        if self.solution is not None:
+            slack = b - a @ self.solution
+            if slack.min() >= self.margin:
+                return
+            self.solution = None
+
+    def add_frame(self, df, roll_column: str, passed):
+        self.add(df[self.features].to_numpy(), df[roll_column].to_numpy(), passed)
+
+    def matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._matrix is None:
+            self._matrix = (np.vstack([a for a, _ in self.chunks]),
+                            np.concatenate([b for _, b in self.chunks]))
+        return self._matrix
+
+    def _max_margin(self, a: np.ndarray, b: np.ndarray):
+        # Variables are [coefs, intercept, margin]; maximize the margin, which
+        # is capped so data that doesn't pin the formula down stays bounded
+        n = a.shape[1]
+        a_ub = np.hstack([a, np.ones((len(a), 1))])
+        bounds = [(None, None)] * n + [(None, 1)]
+        c = np.zeros(n + 1)
+        c[-1] = -1
+        res = linprog(c, A_ub=a_ub, b_ub=b, bounds=bounds, method="highs")
+        if res.status != 0:
+            raise RuntimeError(f"LP failed: {res.message}")
+        return res.x[:-1], res.x[-1], res
+
+    def fit(self) -> Fit:
+        a, b = self.matrix()
+        if self.solution is None:
+            self.solution, self.margin, _ = self._max_margin(a, b)
+
+        coefficients = dict(zip(self.names, self.solution))
+        if self.margin >= 0:
+            return Fit(True, self.margin, coefficients)
+        return Fit(False, self.margin, coefficients, self.conflicting_rows())
+
+    def is_feasible(self, rows: Sequence[int]) -> bool:
+        a, b = self.matrix()
+        rows = list(rows)
+        _, margin, _ = self._max_margin(a[rows], b[rows])
+        return margin >= 0
+
+    def conflicting_rows(self) -> List[int]:
+        a, b = self.matrix()
+        # The rows the max-margin LP leans on (non-zero duals) are already an
+        # infeasible subset by Farkas' lemma; trim that down to a minimal one
+        # by dropping each row that isn't needed to stay infeasible.
+        _, _, res = self._max_margin(a, b)
+        rows = [int(i) for i in np.flatnonzero(np.abs(res.ineqlin.marginals) > 1e-12)]
+        for row in list(rows):
+            without = [r for r in rows if r != row]
+            if without and not self.is_feasible(without):
+                rows = without
+        return rows
+
+    def ranges(self) -> Dict[str, Tuple[float, float]]:
+        """
+        Smallest and largest value each coefficient can take while every
+        row is still satisfied. +-inf means the data doesn't bound it.
+        """
+        a, b = self.matrix()
+        n = a.shape[1]
+        result = {}
+        for i, name in enumerate(self.names):
+            extremes = []
+            for direction in (1, -1):
+                c = np.zeros(n)
+                c[i] = direction
+                res = linprog(c, A_ub=a, b_ub=b, bounds=[(None, None)] * n, method="highs")
+                if res.status == 3:
+                    extremes.append(-direction * np.inf)
+                elif res.status == 0:
+                    extremes.append(res.x[i])
+                else:
+                    raise RuntimeError(f"LP failed: {res.message}")
+            result[name] = (extremes[0], extremes[1])
+        return result
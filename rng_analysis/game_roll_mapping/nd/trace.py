@@ -0,0 +1,265 @@
+"""
+Binary roll traces, for checking what a change to a resim did to its rolls.
+
+A trace is a flat array of fixed-size records (position, event, label, value)
+followed by a JSON trailer holding the label names. Record one by swapping the
+resim's Rng for a TracingRng, then compare two runs with
+
+    python -m nd.trace before.trace after.trace
+
+which prints the first roll where they disagree and how the rest of the two
+traces line up.
+"""
+
+import json
+import linecache
+import re
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .rng import Rng
+
+RECORD = np.dtype([
+    ("position", "<i8"),
+    ("event", "<i4"),
+    ("label", "<u2"),
+    ("kind", "u1"),
+    ("pad", "u1"),
+    ("value", "<f8"),
+])
+TRAILER = struct.Struct("<I4s")
+MAGIC = b"RTRC"
+
+KIND_ROLL = 0
+KIND_STEP = 1
+
+STRING_RE = re.compile(r"""["']([^"']*)["']""")
+ASSIGN_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=[^=]")
+
+
+def label_for_line(filename: str, lineno: int, function: str) -> str:
+    # Resims announce their rolls as `print("strike:", r.next())` or
+    # `strike_roll = r.next()`, so the label is taken straight from the source
+    line = linecache.getline(filename, lineno)
+    if match := STRING_RE.search(line):
+        return match.group(1).strip().rstrip(":")
+    if match := ASSIGN_RE.match(line):
+        return match.group(1)
+    # Otherwise the line itself, not its number, so that editing the file
+    # above a call doesn't relabel it
+    if line.strip():
+        return f"{function}: {line.strip()}"
+    return function
+
+
+class TraceWriter:
+    def __init__(self, path: str, buffer_size: int = 4096):
+        self.file = open(path, "wb")
+        self.labels: Dict[str, int] = {}
+        self.label_for_site: Dict[Tuple[str, int], int] = {}
+        self.buffer = np.zeros(buffer_size, dtype=RECORD)
+        self.buffered = 0
+        # Set by the resim as it moves through events
+        self.event = -1
+
+    def label_code(self, label: str) -> int:
+        if label not in self.labels:
+            self.labels[label] = len(self.labels)
+        return self.labels[label]
+
+    def site_code(self, frame) -> int:
+        site = (frame.f_code.co_filename, frame.f_lineno)
+        if site not in self.label_for_site:
+            label = label_for_line(*site, frame.f_code.co_name)
+            self.label_for_site[site] = self.label_code(label)
+        return self.label_for_site[site]
+
+    def record(self, position: int, label: int, kind: int, value: float):
+        self.buffer[self.buffered] = (position, self.event, label, kind, 0, value)
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        names = sorted(self.labels, key=self.labels.get)
+        trailer = json.dumps(names).encode("utf-8")
+        self.file.write(trailer)
+        self.file.write(TRAILER.pack(len(trailer), MAGIC))
+        self.file.close()
+
+
+class TracingRng(Rng):
+    """
+    Rng that writes every value it hands out (and every manual step) to a
+    TraceWriter. Rolls are labelled from the line of source that asked for
+    them.
+    """
+
+    def __init__(self, state: Tuple[int, int], offset: int, writer: TraceWriter):
+        super().__init__(state, offset)
+        self.writer = writer
+
+    def next(self) -> float:
+        value = super().next()
+        self.writer.record(self.position, self.writer.site_code(sys._getframe(1)),
+                           KIND_ROLL, value)
+        return value
+
+    def step(self, steps=1, debug_block_boundaries=False):
+        # next() doesn't go through step(), so these are all steps the resim
+        # asked for directly
+        super().step(steps, debug_block_boundaries)
+        self.writer.record(self.position, self.writer.site_code(sys._getframe(1)),
+                           KIND_STEP, steps)
+
+
+def mark_event(rng: Rng, event: int):
+    # No-op unless the resim is recording
+    if isinstance(rng, TracingRng):
+        rng.writer.event = event
+
+
+class Trace:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        trailer_length, magic = TRAILER.unpack(data[-TRAILER.size:])
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a roll trace (or wasn't closed)")
+
+        end = len(data) - TRAILER.size - trailer_length
+        self.label_names: List[str] = json.loads(data[end:-TRAILER.size])
+        self.records = np.frombuffer(data[:end], dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def labels(self) -> List[str]:
+        names = np.array(self.label_names, dtype=object)
+        return list(names[self.records["label"]]) if len(self.records) else []
+
+    def describe(self, i: int) -> str:
+        if i >= len(self.records):
+            return "<end of trace>"
+        rec = self.records[i]
+        kind = "step" if rec["kind"] == KIND_STEP else "roll"
+        return (f"#{i} event {rec['event']} pos {rec['position']} {kind} "
+                f"{self.label_names[rec['label']]!r} = {rec['value']}")
+
+
+def first_divergence(a_keys: List[tuple], b_keys: List[tuple]) -> Optional[int]:
+    for i, (a_key, b_key) in enumerate(zip(a_keys, b_keys)):
+        if a_key != b_key:
+            return i
+    if len(a_keys) != len(b_keys):
+        return min(len(a_keys), len(b_keys))
+    return None
+
+
+def align(a: List, b: List, max_edits: int) -> Optional[List[Tuple[int, int]]]:
+    # Myers' O(ND) diff, i.e. a longest common subsequence that's cheap when
+    # the two traces only differ in a few places. Returns the matched
+    # (a index, b index) pairs, or None if there are more than max_edits
+    # insertions and deletions.
+    n, m = len(a), len(b)
+    v = {1: 0}
+    history = []
+    for d in range(max_edits + 1):
+        history.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x, y = x + 1, y + 1
+            v[k] = x
+            if x >= n and y >= m:
+                return backtrack(history, n, m)
+    return None
+
+
+def backtrack(history: List[Dict[int, int]], x: int, y: int) -> List[Tuple[int, int]]:
+    pairs = []
+    for d in reversed(range(len(history))):
+        v = history[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x, y = x - 1, y - 1
+            pairs.append((x, y))
+        x, y = prev_x, prev_y
+    pairs.reverse()
+    return pairs
+
+
+def runs(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+    # Collapses matched pairs into (a start, b start, length)
+    result = []
+    for i, j in pairs:
+        if result and result[-1][0] + result[-1][2] == i and result[-1][1] + result[-1][2] == j:
+            result[-1] = (result[-1][0], result[-1][1], result[-1][2] + 1)
+        else:
+            result.append((i, j, 1))
+    return result
+
+
+def diff(a_path: str, b_path: str, max_edits: int = 1000, context: int = 5):
+    a, b = Trace(a_path), Trace(b_path)
+    print(f"{a_path}: {len(a)} records, {b_path}: {len(b)} records")
+
+    a_keys = list(zip(a.labels(), a.records["kind"].tolist(), a.records["value"].tolist()))
+    b_keys = list(zip(b.labels(), b.records["kind"].tolist(), b.records["value"].tolist()))
+    first = first_divergence(a_keys, b_keys)
+    if first is None:
+        print("Traces are identical")
+        return
+
+    print("First divergence:")
+    print("  a:", a.describe(first))
+    print("  b:", b.describe(first))
+
+    # Align the rest on labels alone, since once a roll is added or dropped
+    # every value after it is shifted
+    a_labels = [key[:2] for key in a_keys[first:]]
+    b_labels = [key[:2] for key in b_keys[first:]]
+    pairs = align(a_labels, b_labels, max_edits)
+    if pairs is None:
+        print(f"Traces differ by more than {max_edits} rolls after the divergence, not aligning")
+        return
+
+    print("After that:")
+    a_at, b_at = 0, 0
+    for a_start, b_start, length in runs(pairs) + [(len(a_labels), len(b_labels), 0)]:
+        for i in range(a_at, a_start)[:context]:
+            print("  only in a:", a.describe(first + i))
+        for j in range(b_at, b_start)[:context]:
+            print("  only in b:", b.describe(first + j))
+        if length:
+            a_rec = a.records[first + a_start:first + a_start + length]
+            b_rec = b.records[first + b_start:first + b_start + length]
+            offset = int(b_rec["position"][0] - a_rec["position"][0])
+            same = int((a_rec["value"] == b_rec["value"]).sum())
+            print(f"  a[{first + a_start}:{first + a_start + length}] matches "
+                  f"b[{first + b_start}:{first + b_start + length}], b is {offset:+d} rolls "
+                  f"from a, {same}/{length} values equal")
+        a_at, b_at = a_start + length, b_start + length
+
+
+if __name__ == "__main__":
+    diff(sys.argv[1], sys.argv[2])
@@ -0,0 +1,176 @@
+"""
+Local store for Chronicler game updates.
+
+All games live in one Arrow IPC file with one zstd-compressed record batch per
+game. Each batch has the columns play_count, timestamp, hash and data (the
+update's `data` object as a JSON string), deduplicated to the last update for
+each play count and sorted by it. The file's schema metadata maps game id to
+batch number, so opening the (memory-mapped) file costs nothing and looking up
+a play only decompresses that one game.
+
+To convert an existing `cache/` directory of game_updates_*.json files:
+
+    python -m nd.update_store cache
+"""
+
+import json
+import os
+import sys
+from glob import glob
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+SCHEMA = pa.schema([
+    ("play_count", pa.int32()),
+    ("timestamp", pa.string()),
+    ("hash", pa.string()),
+    ("data", pa.string()),
+])
+INDEX_KEY = b"game_batches"
+
+
+class LoadedGame:
+    def __init__(self, batch: pa.RecordBatch):
+        self.play_counts = batch.column("play_count").to_numpy()
+        self.data = batch.column("data")
+        self.first_play = int(self.play_counts[0]) if len(self.play_counts) else 0
+        # Play counts are almost always contiguous, in which case the row is
+        # just an offset from the first one
+        self.contiguous = bool(np.all(np.diff(self.play_counts) == 1))
+        self.parsed = {}
+
+    def row_for(self, play_count: int) -> Optional[int]:
+        if self.contiguous:
+            row = play_count - self.first_play
+            return row if 0 <= row < len(self.play_counts) else None
+
+        row = int(np.searchsorted(self.play_counts, play_count))
+        if row < len(self.play_counts) and self.play_counts[row] == play_count:
+            return row
+        return None
+
+    def get(self, play_count: int) -> Optional[dict]:
+        row = self.row_for(play_count)
+        if row is None:
+            return None
+        if row not in self.parsed:
+            self.parsed[row] = json.loads(self.data[row].as_py())
+        return self.parsed[row]
+
+
+def updates_to_batch(updates: List[dict]) -> pa.RecordBatch:
+    by_play = {}
+    for update in updates:
+        # Later updates with the same play count win, same as the old dict
+        by_play[update["data"]["playCount"]] = update
+    play_counts = sorted(by_play)
+
+    return pa.RecordBatch.from_arrays([
+        pa.array(play_counts, type=pa.int32()),
+        pa.array([by_play[p].get("timestamp") for p in play_counts], type=pa.string()),
+        pa.array([by_play[p].get("hash") for p in play_counts], type=pa.string()),
+        pa.array([json.dumps(by_play[p]["data"], separators=(",", ":"))
+                  for p in play_counts], type=pa.string()),
+    ], schema=SCHEMA)
+
+
+class GameUpdateStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.source = None
+        self.reader = None
+        self.batch_for_game: Dict[str, int] = {}
+        self.pending: Dict[str, pa.RecordBatch] = {}
+        self.loaded: Dict[str, LoadedGame] = {}
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            return
+
+        self.source = pa.memory_map(self.path, "r")
+        self.reader = pa.ipc.open_file(self.source)
+        metadata = self.reader.schema.metadata or {}
+        self.batch_for_game = json.loads(metadata.get(INDEX_KEY, b"{}"))
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self.batch_for_game or game_id in self.pending
+
+    def __len__(self):
+        return len(self.batch_for_game) + len(self.pending)
+
+    def _batch(self, game_id: str) -> pa.RecordBatch:
+        if game_id in self.pending:
+            return self.pending[game_id]
+        return self.reader.get_batch(self.batch_for_game[game_id])
+
+    def _game(self, game_id: str) -> Optional[LoadedGame]:
+        if game_id not in self.loaded:
+            if game_id not in self:
+                return None
+            self.loaded[game_id] = LoadedGame(self._batch(game_id))
+        return self.loaded[game_id]
+
+    def get(self, game_id: str, play_count: int) -> Optional[dict]:
+        game = self._game(game_id)
+        if game is None:
+            return None
+        return game.get(play_count)
+
+    def add(self, game_id: str, updates: List[dict]):
+        self.pending[game_id] = updates_to_batch(updates)
+        self.loaded.pop(game_id, None)
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        games = [g for g in self.batch_for_game if g not in self.pending]
+        games += list(self.pending)
+        index = {game_id: i for i, game_id in enumerate(games)}
+        schema = SCHEMA.with_metadata({INDEX_KEY: json.dumps(index)})
+
+        # Arrow files can't be appended to, so write a new one next to the
+        # mapped one and swap it in
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, schema, options=options) as writer:
+                for game_id in games:
+                    writer.write_batch(self._batch(game_id))
+
+        # Loaded games point into the old mapping, so drop them before closing it
+        self.loaded.clear()
+        self.reader = None
+        if self.source is not None:
+            self.source.close()
+        os.replace(tmp_path, self.path)
+        self.pending.clear()
+        self._open()
+
+
+def import_json_cache(cache_dir: str, store: GameUpdateStore):
+    for path in sorted(glob(os.path.join(cache_dir, "game_updates_*.json"))):
+        game_id = os.path.basename(path)[len("game_updates_"):-len(".json")]
+        if game_id in store:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            store.add(game_id, json.load(f)["data"])
+    store.flush()
+
+
+def main(cache_dir: str):
+    store = GameUpdateStore(os.path.join(cache_dir, "game_updates.arrow"))
+    import_json_cache(cache_dir, store)
+
+    json_size = sum(os.path.getsize(p)
+                    for p in glob(os.path.join(cache_dir, "game_updates_*.json")))
+    print(f"{len(store)} games, {json_size / 1e6:.1f} MB of JSON -> "
+          f"{os.path.getsize(store.path) / 1e6:.1f} MB store")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "cache")
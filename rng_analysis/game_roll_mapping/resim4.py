@@ -1,66 +1,71 @@
+import atexit
 import itertools
-import math
-from dataclasses import dataclass
-from typing import List
 
 import json
 import os
-import pandas as pd
-import requests
-
-from nd import rng
-
-
-@dataclass
-class RollLog:
-    event_type: str
-    roll: float
-    passed: bool
-
-    batter_name: str
-    batter_buoyancy: float
-    batter_divinity: float
-    batter_martyrdom: float
-    batter_moxie: float
-    batter_musclitude: float
-    batter_patheticism: float
-    batter_thwackability: float
-    batter_tragicness: float
-
-    pitcher_name: str
-    pitcher_ruthlessness: float
-    pitcher_overpowerment: float
-    pitcher_unthwackability: float
-    pitcher_shakespearianism: float
-    pitcher_suppression: float
-    pitcher_coldness: float
+
+from nd import rng, trace
+from nd.entity_store import EntityStore
+from nd.roll_profile import RollProfiler
+from nd.roll_sink import ColumnarSink
+from nd.update_store import GameUpdateStore
+from util import chron_client, offline_api
+from util.vibes import VibesTable
+
+
+ROLL_LOG_SCHEMA = {
+    "event_type": "O",
+    "roll": "f8",
+    "passed": "?",
+
+    "batter_name": "O",
+    "batter_buoyancy": "f8",
+    "batter_divinity": "f8",
+    "batter_martyrdom": "f8",
+    "batter_moxie": "f8",
+    "batter_musclitude": "f8",
+    "batter_patheticism": "f8",
+    "batter_thwackability": "f8",
+    "batter_tragicness": "f8",
+
+    "pitcher_name": "O",
+    "pitcher_ruthlessness": "f8",
+    "pitcher_overpowerment": "f8",
+    "pitcher_unthwackability": "f8",
+    "pitcher_shakespearianism": "f8",
+    "pitcher_suppression": "f8",
+    "pitcher_coldness": "f8",
 
     # on a lark
-    pitcher_chasiness: float
+    "pitcher_chasiness": "f8",
+
+    "defense_avg_anticapitalism": "f8",
+    "defense_avg_chasiness": "f8",
+    "defense_avg_omniscience": "f8",
+    "defense_avg_tenaciousness": "f8",
+    "defense_avg_watchfulness": "f8",
 
-    defense_avg_anticapitalism: float
-    defense_avg_chasiness: float
-    defense_avg_omniscience: float
-    defense_avg_tenaciousness: float
-    defense_avg_watchfulness: float
+    "ballpark_grandiosity": "f8",
+    "ballpark_fortification": "f8",
+    "ballpark_obtuseness": "f8",
+    "ballpark_ominousness": "f8",
+    "ballpark_inconvenience": "f8",
+    "ballpark_viscosity": "f8",
+    "ballpark_forwardness": "f8",
+    "ballpark_mysticism": "f8",
+    "ballpark_elongation": "f8",
 
-    ballpark_grandiosity: float
-    ballpark_fortification: float
-    ballpark_obtuseness: float
-    ballpark_ominousness: float
-    ballpark_inconvenience: float
-    ballpark_viscosity: float
-    ballpark_forwardness: float
-    ballpark_mysticism: float
-    ballpark_elongation: float
+    "batting_team_hype": "f8",
+    "pitching_team_hype": "f8",
 
-    batting_team_hype: float
-    pitching_team_hype: float
+    "batter_vibes": "f8",
+    "pitcher_vibes": "f8",
+}
 
-    batter_vibes: float
-    pitcher_vibes: float
+strike_roll_log = ColumnarSink(ROLL_LOG_SCHEMA)
 
-strike_roll_log: List[RollLog] = []
+# SIBR_ARCHIVE=<dir> serves the API requests from a local archive
+offline_api.install_from_env()
 
 cache = {}
 def get_cached(key, url):
@@ -72,49 +77,66 @@ def get_cached(key, url):
     if not os.path.exists(os.path.dirname(path)):
         os.makedirs(os.path.dirname(path))
 
+    # responses cached before the shared http cache are still on disk as json;
+    # new ones go in the http cache with everything else
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
     else:
-        data = requests.get(url).json()
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f)
+        data = chron_client.get(url)
     cache[key] = data
     return data
 
 
-cached_plays = {}
+update_store = GameUpdateStore(os.path.join("cache", "game_updates.arrow"))
+# Flushing rewrites the whole file, so new games are written once a day and
+# at exit rather than as they're fetched
+atexit.register(update_store.flush)
 def get_game(game_id):
-    resp = get_cached("game_updates_{}".format(game_id), "https://api.sibr.dev/chronicler/v1/games/updates?count=2000&game={}&started=true".format(game_id))
-    return resp["data"]
+    key = "game_updates_{}".format(game_id)
+    url = "https://api.sibr.dev/chronicler/v1/games/updates?count=2000&game={}&started=true".format(game_id)
+    # games cached before the update store existed are still on disk as json
+    if os.path.exists(os.path.join("cache", key + ".json")):
+        return get_cached(key, url)["data"]
+    return chron_client.get(url)["data"]
 
 def get_game_update(game_id, play):
-    if (game_id, play + 1) in cached_plays:
-        return cached_plays[(game_id, play + 1)]
-
-    game_data = get_game(game_id)
-    for update in game_data:
-        cached_plays[(game_id, update["data"]["playCount"])] = update["data"]
-
-    return cached_plays.get((game_id, play + 1))
+    if game_id not in update_store:
+        update_store.add(game_id, get_game(game_id))
+
+    return update_store.get(game_id, play + 1)
+
+entity_stores = {}
+def get_entity_states(type_, timestamp):
+    # snapshots cached before the entity store existed are still on disk as json
+    legacy_key = "{}s_at_{}".format(type_, timestamp).replace(":", "_")
+    if os.path.exists(os.path.join("cache", legacy_key + ".json")):
+        resp = get_cached(legacy_key, None)
+        return {e["entityId"]: e["data"] for e in resp["items"]}
+
+    # otherwise all versions in the resim window are fetched once, and after
+    # that every snapshot is a local lookup
+    if type_ not in entity_stores:
+        key = "entities_{}_{}_{}".format(type_, min_stamp, max_stamp).replace(":", "_")
+        path = os.path.join("cache", key + ".arrow")
+        if os.path.exists(path):
+            entity_stores[type_] = EntityStore.load(path)
+        else:
+            entity_stores[type_] = EntityStore.fetch(type_, min_stamp, max_stamp)
+            entity_stores[type_].save(path)
+    return entity_stores[type_].at(timestamp)
 
 def get_team_states(timestamp):
     # Hack around timing problems
     if timestamp == '2021-05-22T15:26:45.984Z':
         timestamp = '2021-05-22T15:27:45.984Z'
-    key = "teams_at_{}".format(timestamp)
-    resp = get_cached(key, "https://api.sibr.dev/chronicler/v2/entities?type=team&at={}&count=1000".format(timestamp))
-    return {e["entityId"]: e["data"] for e in resp["items"]}
+    return get_entity_states("team", timestamp)
 
 def get_player_states(timestamp):
-    key = "players_at_{}".format(timestamp)
-    resp = get_cached(key, "https://api.sibr.dev/chronicler/v2/entities?type=player&at={}&count=1000".format(timestamp))
-    return {e["entityId"]: e["data"] for e in resp["items"]}
+    return get_entity_states("player", timestamp)
 
 def get_stadium_states(timestamp):
-    key = "stadiums_at_{}".format(timestamp)
-    resp = get_cached(key, "https://api.sibr.dev/chronicler/v2/entities?type=stadium&at={}&count=1000".format(timestamp))
-    return {e["entityId"]: e["data"] for e in resp["items"]}
+    return get_entity_states("stadium", timestamp)
 
 def get_feed_between(start, end):
     key = "feed_range_{}_{}".format(start, end)
@@ -228,6 +250,18 @@ r = rng.Rng((530316401040218212, 2247554972408709593), 11) # s19 d108 (original
 # r = rng.Rng((16300910589699054409, 765138142953410791), 52) # s15 d39
 r.step(-9)
 
+# Set to a path to record every roll to a binary trace, for diffing against
+# another run with `python -m nd.trace a.trace b.trace`
+TRACE_PATH = None
+trace_writer = None
+if TRACE_PATH:
+    trace_writer = trace.TraceWriter(TRACE_PATH)
+    r = trace.TracingRng(r.state, r.offset, trace_writer)
+
+# Set to print where the rolls and time went, by event type and weather
+PROFILE = False
+profiler = RollProfiler(enabled=PROFILE)
+
 def try_damage(player):
     if "items" not in player:
         return False
@@ -311,15 +345,23 @@ events = get_feed_between(min_stamp, max_stamp)
 fetched_for_days = set()
 
 
-def calculate_vibes(player, day):
-    frequency = 6 + round(10 * player['buoyancy'])
-    phase = math.pi * ((2 / frequency) * day + 0.5)
+# Vibes for every player on every day. Rebuilt whenever `players` is refetched.
+vibes_table = VibesTable(players)
 
-    range = 0.5 * (player['pressurization'] + player['cinnamon'])
-    return (range * math.sin(phase)) - (0.5 * player['pressurization']) + (0.5 * player['cinnamon'])
+# Lineup averages only change when the lineup or the player states do, so they
+# are computed once per lineup. Cleared whenever `players` is refetched.
+lineup_averages_cache = {}
+def lineup_averages(lineup):
+    key = tuple(lineup)
+    if key not in lineup_averages_cache:
+        lineup_averages_cache[key] = {
+            attr: sum(players[pid][attr] for pid in lineup) / len(lineup)
+            for attr in ["anticapitalism", "chasiness", "omniscience", "tenaciousness", "watchfulness"]
+        }
+    return lineup_averages_cache[key]
 
 seen_mods = set()
-def make_roll_log(event_type: str, roll: float, passed: bool):
+def log_roll(event_type: str, roll: float, passed: bool):
     batter_multiplier = 1
     for mod in itertools.chain(batter_mods, batting_team_mods):
         seen_mods.add(mod)
@@ -350,7 +392,8 @@ def make_roll_log(event_type: str, roll: float, passed: bool):
             if not update["topOfInning"]:
                 pitcher_multiplier += 0.05
 
-    return RollLog(
+    defense = lineup_averages(batting_team['lineup'])
+    strike_roll_log.append(
         event_type=event_type,
         roll=roll,
         passed=passed,
@@ -374,21 +417,11 @@ def make_roll_log(event_type: str, roll: float, passed: bool):
         pitcher_coldness=pitcher["coldness"] * pitcher_multiplier,
         pitcher_chasiness=pitcher["chasiness"] * pitcher_multiplier,
 
-        defense_avg_anticapitalism=sum(
-            players[pid]['anticapitalism'] for pid in batting_team['lineup']) / len(
-            batting_team['lineup']),
-        defense_avg_chasiness=sum(
-            players[pid]['chasiness'] for pid in batting_team['lineup']) / len(
-            batting_team['lineup']),
-        defense_avg_omniscience=sum(
-            players[pid]['omniscience'] for pid in batting_team['lineup']) / len(
-            batting_team['lineup']),
-        defense_avg_tenaciousness=sum(
-            players[pid]['tenaciousness'] for pid in batting_team['lineup']) / len(
-            batting_team['lineup']),
-        defense_avg_watchfulness=sum(
-            players[pid]['watchfulness'] for pid in batting_team['lineup']) / len(
-            batting_team['lineup']),
+        defense_avg_anticapitalism=defense["anticapitalism"],
+        defense_avg_chasiness=defense["chasiness"],
+        defense_avg_omniscience=defense["omniscience"],
+        defense_avg_tenaciousness=defense["tenaciousness"],
+        defense_avg_watchfulness=defense["watchfulness"],
 
         ballpark_grandiosity=stadium["grandiosity"],
         ballpark_fortification=stadium["fortification"],
@@ -403,12 +436,22 @@ def make_roll_log(event_type: str, roll: float, passed: bool):
         batting_team_hype=stadium["hype"] if not update["topOfInning"] else 0,
         pitching_team_hype=stadium["hype"] if update["topOfInning"] else 0,
 
-        batter_vibes=calculate_vibes(batter, update["day"]),
-        pitcher_vibes=calculate_vibes(pitcher, update["day"]),
+        batter_vibes=vibes_table.get(batter["id"], update["day"]),
+        pitcher_vibes=vibes_table.get(pitcher["id"], update["day"]),
     )
 
 
-for event in events:
+profile_day = None
+for event_index, event in enumerate(events):
+    trace.mark_event(r, event_index)
+    if PROFILE and event["day"] != profile_day:
+        # One summary per day, like rng_game
+        if profile_day is not None:
+            profiler.end(r)
+            profiler.print_summary(f"for day {profile_day + 1}")
+            profiler.reset()
+        profile_day = event["day"]
+    profiler.begin(r, event_type=event["type"])
     if not event["metadata"] or "play" not in event["metadata"]:
         print("unknown event", event)
         continue
@@ -463,9 +506,12 @@ for event in events:
         print("new game, refetching...")
 
         if event["day"] not in fetched_for_days:
+            update_store.flush()
             teams = get_team_states(timestamp)
             players = get_player_states(timestamp)
             stadiums = get_stadium_states(timestamp)
+            lineup_averages_cache.clear()
+            vibes_table = VibesTable(players)
             fetched_for_days.add(event["day"])
         continue
     if event["type"] == 54:
@@ -474,6 +520,8 @@ for event in events:
             # special casing this so we get a post-incin player list
             teams = get_team_states("2021-05-22T01:22:43.576Z")
             players = get_player_states("2021-05-22T01:22:43.576Z")
+            lineup_averages_cache.clear()
+            vibes_table = VibesTable(players)
 
 
     update = get_game_update(game_id, play-1)
@@ -481,6 +529,7 @@ for event in events:
     if not update or not next_update:
         print("couldn't find update for", game_id, "play #", play)
         continue
+    profiler.annotate(weather=update["weather"])
 
     batting_team_id = update["awayTeam"] if update["topOfInning"] else update["homeTeam"]
     batting_team = teams[batting_team_id]
@@ -1131,7 +1180,7 @@ for event in events:
     if ty in [5, 14, 27]:  # Walk, Ball, Mild pitch (in order)
         # ball/walk
         strike_roll = r.next()
-        strike_roll_log.append(make_roll_log('Ball', strike_roll, False))
+        log_roll('Ball', strike_roll, False)
 
         print("strike:", strike_roll, "(batter {}, pitcher {})".format(batter["name"], pitcher["name"]))
         if "ACIDIC" in pitching_team_mods:
@@ -1305,7 +1354,7 @@ for event in events:
         if ", swinging." in event["description"] or "strikes out swinging." in event["description"]:
             print("contact:", r.next())
         else:
-            strike_roll_log.append(make_roll_log('StrikeLooking', strike_roll, True))
+            log_roll('StrikeLooking', strike_roll, True)
             if strike_roll > 0.85:
                 print("!!! too high strike roll?", strike_roll)
 
@@ -1457,7 +1506,11 @@ for event in events:
         else:
             print("NOT reverbing")
 
-strike_roll_df = pd.DataFrame(strike_roll_log)
-strike_roll_df.to_csv(f"roll_data/{min_stamp}-strikes.csv")
+strike_roll_log.to_parquet(f"roll_data/{min_stamp}-strikes.parquet")
+profiler.end(r)
+if profile_day is not None:
+    profiler.print_summary(f"for day {profile_day + 1}")
+if trace_writer:
+    trace_writer.close()
 
 print(seen_mods)
\ No newline at end of file
@@ -1,16 +1,52 @@
-import math
+import heapq
+import os
 from abc import ABC
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields
 from enum import Enum, auto
-from typing import List, Optional, Generator, Tuple
+from typing import Callable, List, Optional, Generator, Tuple
 
-import pandas as pd
-import requests_cache
+import pyarrow.parquet as pq
 from blaseball_mike import chronicler
 from blaseball_mike.session import _SESSIONS_BY_EXPIRY
 from parsy import string, Parser, alt, eof, fail, regex, seq
 
+from nd import roll_dataset
+from nd.candidates import Roll, Skip, State, Template, score
 from nd.rng import Rng
+from nd.roll_profile import RollProfiler
+from nd.roll_sink import ColumnarSink
+from nd.trace import TraceWriter, TracingRng, mark_event
+from util import http_cache, offline_api
+from util.vibes import player_vibes
+
+# Every game's rows also go into this dataset, for formula fitting across games
+ROLL_DATASET = os.path.join("roll_data", "events")
+# Set to a directory to record each day's rolls as day_<n>.trace in it
+TRACE_DIR = None
+# Set to print where each day's rolls and time went
+PROFILE = False
+profiler = RollProfiler(enabled=PROFILE)
+
+
+# Given a game's index in GameDay.game_ids and the timestamp of its next
+# update, returns a sort key. When several games have an update at the same
+# timestamp the one with the lowest key is advanced first.
+TieBreak = Callable[[int, str], int]
+
+
+def tie_break_by_index(game_index: int, timestamp: str) -> int:
+    return game_index
+
+
+def deferred_at(*timestamps: str) -> TieBreak:
+    # Games whose next update is at one of these timestamps lose every tie,
+    # which is what the old "move the game to the end of the list" hack did
+    def tie_break(game_index: int, timestamp: str) -> int:
+        if timestamp in timestamps:
+            return game_index + 1000
+        return game_index
+
+    return tie_break
 
 
 @dataclass
@@ -20,6 +56,7 @@ class GameDay:
     skip: int = field(default=0)
     start_time: Optional[str] = field(default=None)
     pull_data_at: Optional[str] = field(default=None)
+    tie_break: TieBreak = field(default=tie_break_by_index)
 
 
 DAYS = [
@@ -55,9 +92,10 @@ DAYS = [
 BIRDS_WEATHER = 11
 
 # Persist blaseball-mike's None-timeout cache to disk to speed up requests
-session = requests_cache.CachedSession("blaseball-mike-cache",
-                                       backend="sqlite", expire_after=None)
+session = http_cache.cached_session("blaseball_mike")
 _SESSIONS_BY_EXPIRY[None] = session
+# SIBR_ARCHIVE=<dir> serves the API requests from a local archive
+offline_api.install_from_env(sessions=[session])
 
 ATTRIBUTES = [
     "thwackability",
@@ -179,6 +217,35 @@ class EventInfo:
     thief: Optional[dict] = field(default=None)
 
 
+# Entity attributes are flattened into "batter.moxie"-style columns, the same
+# names pd.json_normalize used to produce
+EVENT_INFO_ENTITIES = ["batter", "pitcher", "thief"]
+EVENT_INFO_SCHEMA = {
+    "event_type": "O",
+    "timestamp": "O",
+    # Rolls used by this event, and before it by the same update (deduced
+    # rolls). Updates that use rolls but have no event get a row with no
+    # event type, which only has rolls.
+    "rolls": "i8",
+    "skipped_rolls": "i8",
+    "has_runner": "?",
+    **{f.name: "f8" for f in fields(EventInfo) if f.name.endswith("_roll")},
+    **{f"{entity}.{attr}": "f8" for entity in EVENT_INFO_ENTITIES for attr in ATTRIBUTES},
+}
+
+
+def event_info_row(info: EventInfo) -> dict:
+    row = {f.name: getattr(info, f.name) for f in fields(EventInfo)
+           if f.name not in EVENT_INFO_ENTITIES}
+    row["event_type"] = str(info.event_type)
+    for entity_name in EVENT_INFO_ENTITIES:
+        entity = getattr(info, entity_name)
+        if entity is not None:
+            for attr, value in entity.items():
+                row[f"{entity_name}.{attr}"] = value
+    return row
+
+
 class Event(ABC):
     def __init__(self, batter: Optional[dict] = None,
                  pitcher: Optional[dict] = None):
@@ -1010,7 +1077,7 @@ def apply_incineration(victim_team: TeamInfo, timestamp: str, day: int,
         cache_time=None,
     ))["data"]
     assert new_player["name"] == replacement_name
-    new_player['vibes'] = vibes(new_player, day)
+    new_player['vibes'] = player_vibes(new_player, day)
     victim_team.lineup[slot] = new_player
 
     return Incineration()
@@ -1067,24 +1134,20 @@ def apply_game_update(update: dict, prev_update: dict, rng: Rng, home: TeamInfo,
     else:
         p = parser(update_data, prev_update_data, home, away)
 
-    return p.parse(update_data['lastUpdate']).apply(rng, update_data, prev_update_data)
+    event = p.parse(update_data['lastUpdate'])
+    profiler.begin(rng, weather=update_data['weather'], handler=type(event).__name__)
+    event_info = event.apply(rng, update_data, prev_update_data)
+    profiler.end(rng, event_type=event_info.event_type.name if event_info else None)
+    return event_info
 
 
 GameGenerator = Generator[None, Rng, None]
 
 
-def vibes(player, day):
-    frequency = 6 + round(10 * player['buoyancy'])
-    phase = math.pi * ((2 / frequency) * day + 0.5)
-
-    range = 0.5 * (player['pressurization'] + player['cinnamon'])
-    return (range * math.sin(phase)) - (0.5 * player['pressurization']) + (0.5 * player['cinnamon'])
-
-
 def init_vibes(team: TeamInfo, day: int):
-    team.pitcher['vibes'] = vibes(team.pitcher, day)
+    team.pitcher['vibes'] = player_vibes(team.pitcher, day)
     for batter in team.lineup:
-        batter['vibes'] = vibes(batter, day)
+        batter['vibes'] = player_vibes(batter, day)
 
 
 def game_generator(game_id, start_time: Optional[str],
@@ -1129,33 +1192,19 @@ def game_generator(game_id, start_time: Optional[str],
     if prev_update is not None and prev_update["data"]["homeBatter"]:
         home.active_batter_id = prev_update["data"]["homeBatter"]
 
-    data_rows = []
+    data_rows = ColumnarSink(EVENT_INFO_SCHEMA)
     for i, update in enumerate(game_updates):
         # This is a fun inversion
         game_rng = yield update["timestamp"]
+        mark_event(game_rng, i)
 
         update_id = update["data"]['_id'] if '_id' in update['data'] else update['data']['id']
 
-        # There's a missing event here and by counting the rolls it seems to be a foul with a
-        # basestealing check (7 rolls). TODO Restructure the code so I can insert a deduced event
-        if update["hash"] in ["50140ef4-ef62-dbd6-8b52-937fc8d4002e",
-                              "e5b743d3-0a26-63c9-7781-fac2e8705c5b"]:
-            print("Advancing past deduced foul with baserunner")
-            game_rng.step(7)
-        elif update["hash"] in ['6c058a18-1f49-7c83-d422-7bb0ba668e94',
-                                'ccdc2eae-4e27-c57e-941e-ef51650db48b',
-                                '643860d1-bac7-894e-9f04-b1f73c077e00']:
-            print("Advancing past deduced foul")
-            game_rng.step(6)
-        elif update["hash"] == 'c99e8d4f-4306-0174-4027-8547d0594d36':
-            print("Advancing past 2 consecutive deduced fouls")
-            game_rng.step(12)
-        elif update["hash"] == 'ad3f8b4a-7914-b7cb-17cb-e5f52929db8c':
-            print("Advancing past 3 consecutive deduced fouls (hi fish)")
-            game_rng.step(18)
-        elif update["hash"] == '4dcc8d09-6a69-2cc3-8a0e-a6b05c937858':
-            print("Advancing past ground out advancement")
-            game_rng.step(2)
+        deduced_rolls = 0
+        if update["hash"] in DEDUCED_ROLLS:
+            message, deduced_rolls = DEDUCED_ROLLS[update["hash"]]
+            print(message)
+            game_rng.step(deduced_rolls)
 
         # Must persist active batter because sometimes it goes away while we
         # still need it (e.g. home runs)
@@ -1167,46 +1216,135 @@ def game_generator(game_id, start_time: Optional[str],
         game_rng.step(1)
         print(update["timestamp"][14:19], update_id[:8], f"{i:>3}", game_rng.state[0], end=' - ')
         game_rng.step(-1)
+        position = game_rng.position
         event_info = apply_game_update(update, prev_update, game_rng, home, away)
         if event_info is not None:
-            data_rows.append(event_info)
+            data_rows.append(**event_info_row(event_info),
+                             timestamp=update["timestamp"],
+                             skipped_rolls=deduced_rolls,
+                             rolls=game_rng.position - position)
+        elif deduced_rolls or game_rng.position != position:
+            # A row with no event type, so day_template still knows when
+            # these rolls were used
+            data_rows.append(timestamp=update["timestamp"],
+                             rolls=deduced_rolls + game_rng.position - position)
 
         prev_update = update
 
-    df = pd.json_normalize([asdict(obj) for obj in data_rows])
-    df.to_csv(f"game_{game_id}.csv")
+    data_rows.to_parquet(f"game_{game_id}.parquet")
+    roll_dataset.append_game(ROLL_DATASET, game_id, data_rows.to_arrow())
+
+
+# Updates where the feed is missing an event, and the rolls it must have used.
+# TODO Restructure the code so I can insert a deduced event
+DEDUCED_ROLLS = {
+    # By counting the rolls it seems to be a foul with a basestealing check
+    "50140ef4-ef62-dbd6-8b52-937fc8d4002e": ("Advancing past deduced foul with baserunner", 7),
+    "e5b743d3-0a26-63c9-7781-fac2e8705c5b": ("Advancing past deduced foul with baserunner", 7),
+    "6c058a18-1f49-7c83-d422-7bb0ba668e94": ("Advancing past deduced foul", 6),
+    "ccdc2eae-4e27-c57e-941e-ef51650db48b": ("Advancing past deduced foul", 6),
+    "643860d1-bac7-894e-9f04-b1f73c077e00": ("Advancing past deduced foul", 6),
+    "c99e8d4f-4306-0174-4027-8547d0594d36": ("Advancing past 2 consecutive deduced fouls", 12),
+    "ad3f8b4a-7914-b7cb-17cb-e5f52929db8c": ("Advancing past 3 consecutive deduced fouls (hi fish)", 18),
+    "4dcc8d09-6a69-2cc3-8a0e-a6b05c937858": ("Advancing past ground out advancement", 2),
+}
+
+
+def event_template(row: dict) -> Template:
+    if row["event_type"] is None:
+        return [Skip(int(row["rolls"]))]
+
+    template: Template = []
+    if row["skipped_rolls"]:
+        template.append(Skip(int(row["skipped_rolls"])))
+
+    rolls = [Roll(str(i)) for i in range(int(row["rolls"]))]
+    # Pitches roll weather, mystery, steal (with runners), then strike zone.
+    # Balls and strikes looking are the only outcomes that pin that roll down.
+    if row["event_type"] in (str(EventType.Ball), str(EventType.StrikeLooking)):
+        strike_roll = rolls[2 if row["should_try_to_steal_roll"] is None else 3]
+        threshold = strike_threshold(row["pitcher.ruthlessness"])
+        if row["event_type"] == str(EventType.Ball):
+            strike_roll.lo = threshold
+        else:
+            strike_roll.hi = threshold
+
+    return template + rolls
+
+
+def day_template(day: GameDay) -> Template:
+    # Needs the game_<id>.parquet files from a previous run of the day. Rows
+    # are merged in the same order interleave_games runs the games.
+    def game_rows(i, game_id):
+        for row in pq.read_table(f"game_{game_id}.parquet").to_pylist():
+            yield (row["timestamp"], day.tie_break(i, row["timestamp"]), i), row
+
+    games = [game_rows(i, game_id) for i, game_id in enumerate(day.game_ids)]
+    template = []
+    for _, row in heapq.merge(*games, key=lambda keyed: keyed[0]):
+        template.extend(event_template(row))
+    return template
+
+
+def rank_start_states(day: GameDay, candidates: List[State], top: int = 10):
+    # e.g. rank_start_states(DAYS[0], window_around(*DAYS[0].rng_state, 200))
+    scores = score(candidates, day_template(day), start_step=-1)
+    scores.print_top(top)
+    return scores
 
 
 def main():
     for i, day in enumerate(DAYS):
         print(f"Starting {i + 1}th game")
-        run_day(day)
+        trace_path = os.path.join(TRACE_DIR, f"day_{i}.trace") if TRACE_DIR else None
+        run_day(day, trace_path)
+
+
+def interleave_games(games: List[GameGenerator], rng: Rng,
+                     tie_break: TieBreak = tie_break_by_index):
+    # Min-heap of (next timestamp, tie-break key, game index, generator). The
+    # game index is unique, so the generators themselves are never compared.
+    heap = []
+    for i, game in enumerate(games):
+        try:
+            timestamp = next(game)
+        except StopIteration:
+            continue
+        heap.append((timestamp, tie_break(i, timestamp), i, game))
+    heapq.heapify(heap)
+
+    while heap:
+        _, _, i, game = heap[0]
+        try:
+            # Each game consumes rolls for its next update, then yields the
+            # timestamp of the one after that
+            timestamp = game.send(rng)
+        except StopIteration:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (timestamp, tie_break(i, timestamp), i, game))
 
 
-def run_day(day: GameDay):
-    game_rng = Rng(*day.rng_state)
+def run_day(day: GameDay, trace_path: Optional[str] = None):
+    if trace_path:
+        writer = TraceWriter(trace_path)
+        game_rng = TracingRng(*day.rng_state, writer)
+    else:
+        writer = None
+        game_rng = Rng(*day.rng_state)
     game_rng.step(-1)
 
     games = [game_generator(game_id, day.start_time, day.pull_data_at, i < day.skip)
              for i, game_id in enumerate(day.game_ids)]
 
-    # Start all the generators and get the first event timestamps
-    games = [(next(game), game) for game in games]
-
-    while games:
-        (i, (prev_timestamp, game)) = min(enumerate(games), key=lambda g: g[1][0])
-        try:
-            next_timestamp = game.send(game_rng)
-        except StopIteration:
-            games.pop(i)
-        else:
-            games[i] = (next_timestamp, game)
-            # Temp hack: At this specific time, move the game to the end of the list
-            # if next_timestamp == '2020-08-08T16:19:29.172Z':
-            #     games.append(games.pop(i))
+    interleave_games(games, game_rng, day.tie_break)
 
     game_rng.step(3)
     print("Next day start state should be", game_rng.get_state_str())
+    profiler.print_summary(f"for games {', '.join(g[:8] for g in day.game_ids)}")
+    profiler.reset()
+    if writer:
+        writer.close()
 
 
 def chron_get_lineup(timestamp: str, team: dict):
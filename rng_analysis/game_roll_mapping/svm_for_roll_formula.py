@@ -1,16 +1,29 @@
+import os
 from glob import glob
 
-import numpy as np
 import pandas as pd
-from sklearn.svm import LinearSVC
+import pyarrow.dataset as ds
 
+from nd import roll_dataset
+from nd.threshold_lp import ThresholdFitter
 
-def main():
-    files = glob("game_*.csv")
-    df = pd.concat((pd.read_csv(f) for f in files))
+ROLL_DATASET = os.path.join("roll_data", "events")
 
-    # Get rid of all entries that don't have a value for the roll
-    df = df[~df['pitch_in_strike_zone_roll'].isnull()]
+
+def main():
+    # Older resims were only written as per-game CSV or Parquet files. Newer
+    # ones write to the dataset too, so only games it doesn't have are added.
+    roll_dataset.import_missing(ROLL_DATASET, glob("game_*.csv") + glob("game_*.parquet"))
+
+    # Only load the attributes and the rolls we're using, and only entries
+    # that have a value for the strike zone roll
+    columns = [col for col in roll_dataset.dataset(ROLL_DATASET).schema.names
+               if col.startswith(('batter.', 'pitcher.'))]
+    df = roll_dataset.read(
+        ROLL_DATASET,
+        columns=['pitch_in_strike_zone_roll', 'batter_swings_roll', *columns],
+        filter=ds.field('pitch_in_strike_zone_roll').is_valid(),
+    )
 
     # Only on pitches in/out of the strike zone
     df = df[df['pitch_in_strike_zone_roll'] < 0.35 * (1 + df['pitcher.ruthlessness'])]
@@ -27,58 +40,45 @@ def main():
     # df = df[(df['event_type'] == "EventType.StrikeLooking") |
     #         (df['event_type'] == "EventType.StrikeSwinging")]
 
-    for key, group in df.groupby('pitcher.ruthlessness'):
-        print(f"Against pitcher with ruthlessness {key:.3f}, {len(group)} samples")
-        run_group(group)
+    # The LP is exact, so there's no need to fit each pitcher separately
+    print(f"{len(df)} samples")
+    run_group(df)
 
 
 def run_group(df):
     batter_attrs = [col for col in df if col.startswith('batter.')]
     pitcher_attrs = [col for col in df if col.startswith('pitcher.')]
 
-    # samples = df[['pitch_in_strike_zone_roll', 'pitcher.ruthlessness', 'pitcher.unthwackability']]
-    # samples = df[['batter_swings_roll', "batter.moxie", "batter.thwackability", "batter.vibes", "pitcher.vibes", 'pitcher.coldness']]
-    # samples = df[['batter_swings_roll', *batter_attrs, 'pitcher.coldness', 'pitcher.vibes']]
-    samples = df[['batter_swings_roll', *batter_attrs]]
-    in_strike_zone = df['event_type'] == "EventType.StrikeLooking"
-
-    batter_swung = (
-            (df['event_type'] == 'EventType.StrikeSwinging') |
-            (df['event_type'] == 'EventType.Foul') |
-            (df['event_type'] == 'EventType.GroundOut') |
-            (df['event_type'] == 'EventType.HomeRun') |
-            (df['event_type'] == 'EventType.Single') |
-            (df['event_type'] == 'EventType.Double') |
-            (df['event_type'] == 'EventType.Triple') |
-            (df['event_type'] == 'EventType.FieldersChoice') |
-            (df['event_type'] == 'EventType.DoublePlay') |
-            (df['event_type'] == 'EventType.Sacrifice')
-    )
-
-    X = np.array(samples)
-    y = ~np.array(batter_swung)
-    clf = LinearSVC(verbose=True, tol=1e-10, max_iter=1e8)
-    fit = clf.fit(X, y)
-
-    y_pred = clf.predict(X)
-    # y_pred = df['batter_swings_roll'] > 0.45 - 0.25 * df['batter.moxie']
-
-    # n_errors = (y_pred ^ y).sum()
-    # n_samples = y.shape[0]
-    # print(f"Error: {n_errors / n_samples:.03} ({n_errors}/{n_samples})")
-    # for category in df['event_type'].unique():
-    #     print(category, np.average(y_pred[df['event_type'] == category]))
-    #
-    # print((df['batter_swings_roll'] - (0.45 - 0.25 * df['batter.moxie']))[y_pred ^ y])
-    # print((df['event_type'])[y_pred ^ y])
-
-    coeff = pd.Series(clf.coef_.squeeze(), samples.columns)
+    # Attributes that weren't logged for these games can't be fit
+    features = [col for col in [*batter_attrs, *pitcher_attrs] if df[col].notnull().all()]
+    batter_swung = df['event_type'].isin([
+        'EventType.StrikeSwinging',
+        'EventType.Foul',
+        'EventType.GroundOut',
+        'EventType.HomeRun',
+        'EventType.Single',
+        'EventType.Double',
+        'EventType.Triple',
+        'EventType.FieldersChoice',
+        'EventType.DoublePlay',
+        'EventType.Sacrifice',
+    ])
+
+    fitter = ThresholdFitter(features)
+    fitter.add_frame(df, 'batter_swings_roll', batter_swung.to_numpy())
+    fit = fitter.fit()
+
+    if not fit.feasible:
+        print(f"No threshold formula fits (best margin {fit.margin:.6f}). Conflicting rows:")
+        print(df.iloc[fit.conflicting_rows][['event_type', 'batter_swings_roll', *features]])
+        return
+
+    coeff = pd.Series(fit.coefficients)
     coeff.sort_values(inplace=True, key=abs, ascending=False)
-    # print("\nCoefficients:\n" + str(coeff))
-    # print("Intercept:", clf.intercept_)
+    print(f"\nSwing threshold coefficients (margin {fit.margin:.6f}):\n" + str(coeff))
 
-    print("\nNormalized coefficients:\n" + str(coeff / -coeff['batter_swings_roll']))
-    print("Normalized intercept:", clf.intercept_ / -coeff['batter_swings_roll'])
+    ranges = pd.DataFrame(fitter.ranges(), index=["min", "max"]).T
+    print("\nFeasible range of each coefficient:\n" + str(ranges.loc[coeff.index]))
 
 
 if __name__ == '__main__':
@@ -11,7 +11,7 @@ from blaseball_mike import chronicler
 from blaseball_mike.models import Stadium
 
 from rng_analysis.rng import Rng
-from rng_analysis.util import load_players_oldest_records
+from rng_analysis.player_records import load_players_oldest_records
 
 HALL_BLUE = (89 / 255, 136 / 255, 255 / 255)
 
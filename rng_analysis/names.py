@@ -3,7 +3,7 @@ from math import floor, ceil
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
-from rng_analysis.util import load_players_oldest_records
+from rng_analysis.player_records import load_players_oldest_records
 from rng_matcher import rng_walker_for_birth, RngMatcherError
 
 
@@ -0,0 +1,31 @@
+import json
+
+from util import chron_client
+
+
+def player_oldest_record(player):
+    id_ = player['data']['id']
+    return chron_client.get_oldest_versions("player", [id_])[id_]
+
+
+def fetch_players_oldest_records(players, path='data/all_players.json'):
+    # One request per player, but as many in flight as the client allows
+    oldest = chron_client.get_oldest_versions(
+        "player", [player['data']['id'] for player in players])
+    # Players with no versions at all don't come back
+    records = [oldest[player['data']['id']] for player in players
+               if player['data']['id'] in oldest]
+    with open(path, 'w') as f:
+        json.dump(records, f)
+    return records
+
+
+def load_players_oldest_records(exclude_initial=False):
+    with open('data/all_players.json', 'r') as f:
+        players_oldest = json.load(f)
+
+    if exclude_initial:
+        return [p for p in players_oldest if
+                p['validFrom'] != '2020-07-29T08:12:22.438Z']
+
+    return players_oldest
@@ -20,9 +20,9 @@ value, walker[-2] the first name value, walker[1] the moxie, and so on.
 import random
 import struct
 from copy import copy
-from itertools import islice
+from dataclasses import dataclass
 from math import floor
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 import z3
@@ -360,6 +360,148 @@ def validate_rng_for_player(generator, player_full, mismatches):
     return True
 
 
+@dataclass
+class PlayerVector:
+    """
+    Everything validate_rng_for_player checks, as arrays with one slot per RNG
+    value starting at thwackability. Attributes are compared to the RNG value
+    directly (scale 0); everything else is floor(value * scale + offset), so
+    soul has scale 8 and offset 2 and peanut allergy is 0 if allergic (value
+    below 0.5) with scale 2. Slots that can't be checked, like the ritual or
+    attributes mark_unknown/boost set to None, have known = False.
+    """
+    names: List[str]
+    expected: np.ndarray
+    known: np.ndarray
+    scale: np.ndarray
+    offset: np.ndarray
+
+    def __len__(self):
+        return len(self.names)
+
+
+def player_vector(player_full) -> PlayerVector:
+    player = player_full['data']
+    slots = []
+
+    for attr in attrs_ordered:
+        value = player[attr]
+        # Tragicness of 0 or 0.1 was set after generation
+        if attr == 'tragicness' and (value == 0 or value == 0.1):
+            value = None
+        slots.append((attr, value, 0, 0))
+
+    if 'cinnamon' in player:
+        slots.append(('cinnamon', player['cinnamon'], 0, 0))
+    slots.append(('soul', player['soul'], 8, 2))
+    if 'peanutAllergy' in player:
+        allergy = player['peanutAllergy']
+        slots.append(('allergy', None if allergy is None else int(not allergy), 2, 0))
+    if 'fate' in player:
+        slots.append(('fate', player['fate'], 100, 0))
+    if player_full['validFrom'] > '2021':
+        slots.append(('ritual', None, 1, 0))
+        slots.append(('blood', player['blood'], 13, 0))
+        slots.append(('coffee', player['coffee'], 13, 0))
+
+    names, expected, scale, offset = zip(*slots)
+    return PlayerVector(
+        names=list(names),
+        expected=np.array([np.nan if v is None else v for v in expected], dtype=float),
+        known=np.array([v is not None for v in expected]),
+        scale=np.array(scale, dtype=float),
+        offset=np.array(offset, dtype=float),
+    )
+
+
+def stack_vectors(vectors: Sequence[PlayerVector]) -> PlayerVector:
+    # Shorter vectors are padded with unknown slots, so the padding always
+    # matches whatever the RNG windows have there
+    length = max(len(v) for v in vectors)
+
+    def stacked(attr, fill):
+        out = np.full((len(vectors), length), fill, dtype=getattr(vectors[0], attr).dtype)
+        for i, v in enumerate(vectors):
+            out[i, :len(v)] = getattr(v, attr)
+        return out
+
+    return PlayerVector(
+        names=max((v.names for v in vectors), key=len),
+        expected=stacked('expected', np.nan),
+        known=stacked('known', False),
+        scale=stacked('scale', 0),
+        offset=stacked('offset', 0),
+    )
+
+
+def window_matches(windows: np.ndarray, vector: PlayerVector) -> np.ndarray:
+    """
+    Which slots of each window match. windows has the RNG values in its last
+    axis (at least len(vector) of them) and anything that broadcasts against
+    the vector's arrays before it.
+    """
+    windows = windows[..., :vector.expected.shape[-1]]
+    exact = vector.scale == 0
+    quantized = np.floor(windows * vector.scale + vector.offset)
+    matches = np.where(exact, np.abs(windows - vector.expected) < 1e-12,
+                       quantized == vector.expected)
+    return matches | ~vector.known
+
+
+def valid_windows(windows: np.ndarray, vector: PlayerVector) -> np.ndarray:
+    """
+    Vectorized validate_rng_for_player: windows is one row per candidate RNG
+    window, starting at the value that would be thwackability. Returns which
+    rows could have generated the player.
+    """
+    return window_matches(windows, vector).all(axis=-1)
+
+
+def first_mismatches(windows: np.ndarray, vector: PlayerVector) -> List[Optional[str]]:
+    # Same names validate_rng_for_player appends to its mismatches list
+    matches = window_matches(windows, vector)
+    first = np.argmin(matches, axis=-1)
+    return [None if row.all() else vector.names[i] for row, i in zip(matches, first)]
+
+
+def validate_players(windows: np.ndarray, vectors: Sequence[PlayerVector]) -> np.ndarray:
+    """
+    Validate many players at once. windows is (players, candidates, values)
+    and the result is (players, candidates).
+    """
+    stacked = stack_vectors(vectors)
+    for attr in ('expected', 'known', 'scale', 'offset'):
+        setattr(stacked, attr, getattr(stacked, attr)[:, None, :])
+    return valid_windows(windows, stacked)
+
+
+def to_double_array(out: np.ndarray) -> np.ndarray:
+    double_bits = (out >> np.uint64(12)) | np.uint64(0x3FF0000000000000)
+    return double_bits.view(np.float64) - 1
+
+
+def generate_matrix(states: Sequence[Tuple[int, int]], count: int) -> np.ndarray:
+    """
+    The first `count` values of generate_numbers for every state at once, one
+    row per state.
+    """
+    s0 = np.array([s for s, _ in states], dtype=np.uint64)
+    s1 = np.array([s for _, s in states], dtype=np.uint64)
+    num_blocks = -(-count // BLOCK_SIZE)
+    out = np.empty((len(states), num_blocks * BLOCK_SIZE), dtype=np.uint64)
+    for i in range(num_blocks * BLOCK_SIZE):
+        x, y = s0, s1
+        x = x ^ (x << np.uint64(23))
+        x = x ^ (x >> np.uint64(17))
+        x = x ^ y ^ (y >> np.uint64(26))
+        s0, s1 = y, x
+        out[:, i] = s0
+
+    # Blocks come out in reverse
+    values = to_double_array(out).reshape(len(states), num_blocks, BLOCK_SIZE)[:, :, ::-1]
+    return values.reshape(len(states), -1)[:, :count]
+
+
 def grouper(n, iterable):
     args = [iter(iterable)] * n
     return zip(*args)
@@ -393,32 +535,26 @@ def rng_walker_for_birth(player_full):
             sync_to = i
             break
 
-    # Find all offsets that work
-    valid_offsets = []
-    mismatches = []
-    for offset in range(64):
-        s0, s1 = step_backwards(initial_s0, initial_s1, offset)
-
-        generator = generate_numbers(s0, s1)
-        sync_iterations = None
-        for i, generated in enumerate(islice(generator,
-                                             advance_generator_by + sync_to,
-                                             advance_generator_by + sync_to + 128)):
-            if abs(generated - values[sync_to]) < 1e-12:
-                # Synced!
-                sync_iterations = i
-                break
-
-        if sync_iterations is None:
-            mismatches.append('sync')
-            continue
-
-        generator = islice(generate_numbers(s0, s1),
-                           advance_generator_by + sync_iterations,
-                           None)
-        if validate_rng_for_player(generator, player_full, mismatches):
-            valid_offsets.append(
-                (offset, advance_generator_by + sync_iterations))
+    # Find all offsets that work, checking every offset at once
+    vector = player_vector(player_full)
+    states = [(initial_s0, initial_s1)]
+    for _ in range(63):
+        states.append(xs128p_backward(*states[-1]))
+    sync_start = advance_generator_by + sync_to
+    numbers = generate_matrix(states, sync_start + 128 + len(vector))
+
+    synced = np.abs(numbers[:, sync_start:sync_start + 128] - values[sync_to]) < 1e-12
+    has_sync = synced.any(axis=1)
+    sync_iterations = np.argmax(synced, axis=1)
+
+    starts = advance_generator_by + sync_iterations
+    windows = numbers[np.arange(len(states))[:, None], starts[:, None] + np.arange(len(vector))]
+    valid = valid_windows(windows, vector) & has_sync
+
+    mismatches = ['sync' if not has_sync[offset] else mismatch
+                  for offset, mismatch in enumerate(first_mismatches(windows, vector))
+                  if not valid[offset]]
+    valid_offsets = [(offset, int(starts[offset])) for offset in np.flatnonzero(valid)]
 
     if len(valid_offsets) == 0:
         print(f"Mismatches ({len(mismatches)}):", mismatches)
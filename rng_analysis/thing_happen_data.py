@@ -1,5 +1,7 @@
 import functools
 import math
+import os
+import sys
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
@@ -13,10 +15,14 @@ from dateutil.parser import isoparse as parse_date
 from tqdm import tqdm
 
 from rng_analysis.load_fragments import load_fragments, RngEntry
+from util import offline_api
 
 DT_MIN = datetime.min.replace(tzinfo=timezone.utc)
 ONE_HOUR = timedelta(hours=1)
 
+# SIBR_ARCHIVE=<dir> serves the eventually queries from a local archive
+offline_api.install_from_env()
+
 QUERY_BASE = {
     # Data needs to be sorted by a unique key or else the paging skips items
     'sortby': '{id}',
@@ -721,3 +727,50 @@ def get_merged_events():
     merged_events = feed_events.join(event_matches,
                                      lsuffix='_feed', rsuffix='_rng')
     return merged_events
+
+
+def check_archive():
+    """
+    Check that every Eventually query this module makes finds events in the
+    SIBR_ARCHIVE archive. The archive answers queries it can't match with an
+    empty list rather than an error, so this is how to tell.
+
+        SIBR_ARCHIVE=archive_dir python -m rng_analysis.thing_happen_data
+    """
+    if not os.environ.get("SIBR_ARCHIVE"):
+        sys.exit("Set SIBR_ARCHIVE to the archive to check")
+
+    checks = {
+        "game starts and ends": lambda: [day for season in get_day_map().values()
+                                         for day in season.values()],
+        "wildcard selections": lambda: list(find_times_by_events(
+            [109], is_postseason_birth, "wildcard selection").values()),
+        "elections": lambda: list(find_times_by_events(
+            [59, 60, 61], is_election, "elections").values()),
+        "postseason births": get_postseason_births,
+        "roams": get_roams,
+        "bottom dwells": get_bottom_dwells,
+        "team formations": get_team_formations,
+        "tunes for psychoacoustics": get_tunes_for_psychoacoustics,
+        "localizations": get_localizations,
+        "aboardings": get_aboardings,
+        "vault leavings": get_vault_leavings,
+        "odysseys": get_odysseys,
+        "rng events": lambda: list(query_eventually({
+            'type': '_or_'.join(str(t) for t in RNG_EVENT_TYPES),
+        })),
+    }
+
+    empty = []
+    for name, get in checks.items():
+        found = len(get())
+        print(f"{name}: {found}")
+        if not found:
+            empty.append(name)
+
+    if empty:
+        sys.exit(f"No events in the archive for {', '.join(empty)}")
+
+
+if __name__ == '__main__':
+    check_archive()
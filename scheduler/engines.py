@@ -0,0 +1,54 @@
+"""
+Schedule engines, all with the same interface:
+
+    assign_home_away(matchups_by_day, teams) -> schedule
+
+matchups_by_day maps day -> list of (team, team) pairs, with teams from the
+`teams` set. The schedule maps day -> list of (away, home) team indices.
+Engines are looked up by name, so main.py can run or benchmark any of them.
+"""
+
+from typing import Callable, Dict
+
+ENGINES: Dict[str, Callable] = {}
+
+
+def register(name):
+    def decorator(engine):
+        ENGINES[name] = engine
+        return engine
+
+    return decorator
+
+
+def get_engine(name) -> Callable:
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name!r}, expected one of {', '.join(ENGINES)}")
+    return ENGINES[name]
+
+
+@register("euler")
+def euler(matchups_by_day, teams):
+    from scheduler.sheduler import test_matchups
+    return test_matchups(matchups_by_day, teams)
+
+
+@register("euler-backtrack")
+def euler_backtrack(matchups_by_day, teams):
+    from scheduler.sheduler import test_matchups
+    return test_matchups(matchups_by_day, teams, backtrack=True)
+
+
+@register("euler-maxflow")
+def euler_maxflow(matchups_by_day, teams):
+    # Re-solves the max-flow problem for every candidate instead of keeping
+    # an OrientationTracker. Slow, but a useful reference
+    from scheduler.sheduler import test_matchups
+    return test_matchups(matchups_by_day, teams, incremental=False)
+
+
+@register("mip")
+def mip_engine(matchups_by_day, teams):
+    # Imported here so the other engines work without mip installed
+    from scheduler.sheduler2 import test_matchups
+    return test_matchups(matchups_by_day, teams)
@@ -1,11 +1,19 @@
+import argparse
 import json
+import os
 import random
+import sys
 import time
-from collections import defaultdict
-from itertools import count
-from multiprocessing import Process, Value
+import traceback
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import count, islice
+from typing import Optional
 
-from scheduler.sheduler import test_matchups
+import numpy as np
+
+from scheduler.engines import ENGINES, euler, get_engine
 
 
 def phase_for_day(day):
@@ -28,7 +36,8 @@ def get_season(season):
 def get_random(teams):
     matchups_by_day = {i: [] for i in range(1, 99, 3)}
     for day in matchups_by_day.keys():
-        teams_today = list(teams)
+        # Sorted, because set order changes between processes
+        teams_today = sorted(teams)
         random.shuffle(teams_today)
 
         for i in range(0, len(teams_today), 2):
@@ -38,81 +47,249 @@ def get_random(teams):
 
 
 def validate(all_teams, schedule):
-    team_home_minus_away = defaultdict(lambda: 0)
-    team_home_minus_away_by_phase = [defaultdict(lambda: 0) for _ in range(3)]
-    pair_count = defaultdict(lambda: 0)
-    pair_count_by_phase = [defaultdict(lambda: 0) for _ in range(3)]
-
-    for day, games in schedule.items():
-        phase = phase_for_day(day)
-
-        # Check there are 12 games
-        assert len(games) == 12
-
-        # Check every team plays
-        assert {i for i_s in games for i in i_s} == set(range(24))
-
-        for (away, home) in games:
-            team_home_minus_away[home] += 1
-            team_home_minus_away[away] -= 1
-            pair_count[(away, home)] += 1
-
-            team_home_minus_away_by_phase[phase][home] += 1
-            team_home_minus_away_by_phase[phase][away] -= 1
-            pair_count_by_phase[phase][away, home] += 1
-
-    assert all(abs(n) <= 1 for n in team_home_minus_away.values())
-
-    for a in all_teams:
-        for b in all_teams:
-            assert abs(pair_count[a, b] - pair_count[b, a]) <= 1
-
-    for phase in range(3):
-        assert all(abs(n) <= 1 for n in
-                   team_home_minus_away_by_phase[phase].values())
-
-        for a in range(24):
-            for b in range(24):
-                assert abs(pair_count_by_phase[phase][a, b] -
-                           pair_count_by_phase[phase][b, a]) <= 1
-
-
-def validate_random(teams, counter: Value):
-    for _ in count():
+    """
+    Check every day is a full slate of games and that home and away are
+    balanced to within 1, both in total and in every phase, for every team
+    and for every pair of teams. Teams in the schedule are indices into
+    all_teams. Raises AssertionError if not.
+    """
+    num_teams = len(all_teams)
+    days = list(schedule)
+    games_per_day = num_teams // 2
+
+    # Check every day has a game for every team (but one, if there's an odd
+    # number of them)
+    assert all(len(schedule[day]) == games_per_day for day in days)
+    games = np.array([schedule[day] for day in days], dtype=int).reshape(
+        len(days), games_per_day, 2)
+    teams_by_day = np.sort(games.reshape(len(days), -1), axis=1)
+    assert np.all(teams_by_day[:, 1:] != teams_by_day[:, :-1])
+    assert np.all((0 <= games) & (games < num_teams))
+
+    # pair_counts[phase, away, home] is the number of games away plays at home
+    phases = np.array([phase_for_day(day) for day in days])
+    pair_counts = np.zeros((3, num_teams, num_teams), dtype=int)
+    np.add.at(pair_counts,
+              (np.repeat(phases, games_per_day), games[..., 0].ravel(),
+               games[..., 1].ravel()), 1)
+    home_minus_away = pair_counts.sum(axis=1) - pair_counts.sum(axis=2)
+    pair_net = pair_counts - pair_counts.transpose(0, 2, 1)
+
+    assert np.all(np.abs(home_minus_away.sum(axis=0)) <= 1)
+    assert np.all(np.abs(pair_net.sum(axis=0)) <= 1)
+    assert np.all(np.abs(home_minus_away) <= 1)
+    assert np.all(np.abs(pair_net) <= 1)
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+
+@dataclass
+class SeasonResult:
+    seed: int
+    seconds: float
+    error: Optional[str] = None
+    matchups_by_day: Optional[dict] = None
+
+
+def run_batch(teams, seeds, assign=euler):
+    # Every season gets its own seed, both for generating it and for the
+    # scheduler's choices, so any one of them can be replayed on its own
+    results = []
+    for seed in seeds:
+        seed_everything(seed)
         matchups_by_day = get_random(teams)
-        schedule = test_matchups(matchups_by_day, teams)
-        validate(teams, schedule)
 
-        with counter.get_lock():
-            counter.value += 1
+        seed_everything(seed)
+        start = time.perf_counter()
+        try:
+            validate(teams, assign(matchups_by_day, teams))
+        except Exception:
+            results.append(SeasonResult(seed, time.perf_counter() - start,
+                                        traceback.format_exc(), matchups_by_day))
+        else:
+            results.append(SeasonResult(seed, time.perf_counter() - start))
+    return results
+
+
+def save_failure(failures_dir, result: SeasonResult):
+    os.makedirs(failures_dir, exist_ok=True)
+    path = os.path.join(failures_dir, f"seed-{result.seed}.json")
+    with open(path, "w") as f:
+        json.dump({"seed": result.seed, "error": result.error,
+                   "matchups_by_day": result.matchups_by_day}, f)
+    return path
+
+
+def replay(path, assign=euler):
+    with open(path, "r") as f:
+        failure = json.load(f)
+
+    matchups_by_day = {int(k): v for k, v in failure["matchups_by_day"].items()}
+    teams = set(team for pairs in matchups_by_day.values()
+                for pair in pairs for team in pair)
+
+    seed_everything(failure["seed"])
+    validate(teams, assign(matchups_by_day, teams))
+    print(f"Seed {failure['seed']} validated")
+
+
+def report(latencies, failures, elapsed):
+    latencies = np.array(latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (0, 0, 0)
+    print(f"{len(latencies)} seasons in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.1f} seasons/s), "
+          f"latency p50 {p50 * 1000:.0f}ms p90 {p90 * 1000:.0f}ms "
+          f"p99 {p99 * 1000:.0f}ms, {failures} failed")
+
+
+def validate_random(teams, seasons=None, time_budget=None, workers=12,
+                    batch_size=10, seed=0, failures_dir="failures",
+                    assign=euler, report_every=5):
+    """
+    Validate randomly generated seasons on a process pool until `seasons`
+    have run or `time_budget` seconds have passed (or forever, if neither
+    is given). Seasons are seeded seed, seed + 1, ..., so a run is
+    reproducible, and each failure is written to failures_dir for replay.
+    Returns the number of failures.
+    """
+    seeds = count(seed) if seasons is None else iter(range(seed, seed + seasons))
+    latencies = []
+    failures = 0
+    start = last_report = time.perf_counter()
+
+    def next_batch():
+        return list(islice(seeds, batch_size))
+
+    with ProcessPoolExecutor(workers) as executor:
+        # Only keep a couple of batches per worker in flight, so stopping
+        # early doesn't have to wait on a long queue
+        pending = set()
+        try:
+            while True:
+                out_of_time = (time_budget is not None and
+                               time.perf_counter() - start > time_budget)
+                while not out_of_time and len(pending) < 2 * workers:
+                    batch = next_batch()
+                    if not batch:
+                        break
+                    pending.add(executor.submit(run_batch, teams, batch, assign))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in future.result():
+                        latencies.append(result.seconds)
+                        if result.error is not None:
+                            failures += 1
+                            path = save_failure(failures_dir, result)
+                            print(f"Seed {result.seed} failed, saved to {path}")
+
+                if time.perf_counter() - last_report > report_every:
+                    last_report = time.perf_counter()
+                    report(latencies, failures, last_report - start)
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+
+    report(latencies, failures, time.perf_counter() - start)
+    return failures
+
+
+def synthetic_league(num_teams):
+    return {f"team-{i}" for i in range(num_teams)}
+
+
+def benchmark(engine_names, league_sizes=(24, 48, 96), seed=0):
+    """
+    Time every engine on the real seasons and on a random season for each
+    league size. Peak memory is what tracemalloc sees, which includes numpy
+    arrays but not memory allocated inside a solver library.
+    """
+    cases = []
+    for season in range(13, 20):
+        matchups_by_day = get_season(season)
+        teams = set(team for pairs in matchups_by_day.values()
+                    for pair in pairs for team in pair)
+        cases.append((f"season {season}", teams, matchups_by_day))
+    for num_teams in league_sizes:
+        teams = synthetic_league(num_teams)
+        seed_everything(seed)
+        cases.append((f"random {num_teams} teams", teams, get_random(teams)))
+
+    print(f"{'engine':<16} {'case':<18} {'result':<20} {'seconds':>8} {'peak MiB':>9}")
+    for name in engine_names:
+        assign = get_engine(name)
+        for case, teams, matchups_by_day in cases:
+            seed_everything(seed)
+            tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                validate(teams, assign(matchups_by_day, teams))
+                result = "ok"
+            except Exception as e:
+                result = type(e).__name__
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<16} {case:<18} {result:<20} {elapsed:>8.2f} "
+                  f"{peak / 1024 ** 2:>9.1f}")
 
 
 def main():
-    # For debugging
-    # np.random.seed(0)
-
+    parser = argparse.ArgumentParser()
+    # mip is the default because it solves a season many times faster
+    parser.add_argument("--engine", default="mip", choices=list(ENGINES))
+    parser.add_argument("--seasons", type=int, default=None,
+                        help="Stop after this many random seasons")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Stop after this many seconds")
+    parser.add_argument("--workers", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--failures-dir", default="failures")
+    parser.add_argument("--replay", metavar="FAILURE_JSON",
+                        help="Re-run one saved failure in this process")
+    parser.add_argument("--benchmark", nargs="*", metavar="ENGINE",
+                        help="Benchmark these engines (default all) and exit")
+    parser.add_argument("--league-sizes", type=int, nargs="+", default=[24, 48, 96],
+                        help="Team counts of the random leagues to benchmark on")
+    args = parser.parse_args()
+    assign = get_engine(args.engine)
+
+    if args.benchmark is not None:
+        benchmark(args.benchmark or list(ENGINES), args.league_sizes, args.seed)
+        return
+
+    if args.replay:
+        replay(args.replay, assign)
+        return
+
+    # Real seasons that fail are reported like random ones, so the random
+    # seasons still run
     teams = None
+    failures = 0
     for season in range(13, 20):
         matchups_by_day = get_season(season)
         teams = set(team for pairs in matchups_by_day.values()
                     for pair in pairs for team in pair)
 
-        schedule = test_matchups(matchups_by_day, teams)
-        validate(teams, schedule)
-        print(f"Validated on season {season}!")
-
-    counter = Value('i', 0)
-    processes = [Process(target=validate_random, args=(teams, counter), daemon=True)
-                 for _ in range(12)]
-
-    for process in processes:
-        process.start()
-
-    while True:
-        time.sleep(5)
-        with counter.get_lock():
-            current_count = counter.value
-        print(f"Validated on {current_count} randomly generated seasons")
+        try:
+            validate(teams, assign(matchups_by_day, teams))
+        except Exception:
+            failures += 1
+            print(f"Season {season} failed:\n{traceback.format_exc()}")
+        else:
+            print(f"Validated on season {season}!")
+
+    failures += validate_random(teams, args.seasons, args.time_budget,
+                                args.workers, args.batch_size, args.seed,
+                                args.failures_dir, assign)
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
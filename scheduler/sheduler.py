@@ -1,10 +1,10 @@
 import random
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import numpy as np
 from itertools import chain, combinations
-
-from tqdm import tqdm
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import maximum_flow
 
 
 def powerset(iterable):
@@ -13,184 +13,402 @@ def powerset(iterable):
     return chain.from_iterable(combinations(s, r) for r in range(len(s) + 1))
 
 
-def get_tour(adjancency, start_node, total_edge_follows, phase_edge_follows):
+def get_tour(adjancency, start_node, total_edge_follows, phase_edge_follows,
+             tracker=None, backtrack=False, planned_edge_follows=None):
     return get_path_until(adjancency, start_node, start_node,
-                          total_edge_follows, phase_edge_follows)
+                          total_edge_follows, phase_edge_follows,
+                          tracker=tracker, backtrack=backtrack,
+                          planned_edge_follows=planned_edge_follows)
+
+
+def min_edges_each_way(adjancency, total_edge_follows, phase_edge_follows,
+                       planned_edge_follows=None):
+    """
+    For each pair (u, v), the fewest of the edges left between them that have
+    to point u -> v to keep the pair's net direction within 1, both in this
+    phase and in total, which keeps_pairs_balanced requires of every follow.
+    The most that can point u -> v is what's left after the fewest that have
+    to point v -> u. If planned_edge_follows is given, at least
+    planned_edge_follows[u, v] of the pair's edges this phase point u -> v.
+    """
+    # Pointing x of the remaining edges u -> v makes the net direction
+    # follows[u, v] + x - follows[v, u] - (remaining - x), which has to be
+    # at least -1
+    lower = np.maximum(0, (adjancency + np.maximum(
+        total_edge_follows.T - total_edge_follows,
+        phase_edge_follows.T - phase_edge_follows)) // 2)
+    if planned_edge_follows is not None:
+        lower = np.maximum(lower, planned_edge_follows - phase_edge_follows)
+    return lower
+
+
+def feasible_orientation(adjancency, imbalance, lower):
+    """
+    A way to orient the undirected edges left in `adjancency` so that
+    every node ends up with as many edges out as in, given each node's
+    out-minus-in `imbalance` from the edges already followed, and with at
+    least lower[u, v] of the edges between u and v pointing u -> v, as the
+    number of edges pointing each way. None if there isn't one.
+
+    This is the mixed graph Euler condition, checked as a max-flow problem.
+    Each pair of nodes sends one unit of flow per edge to the endpoint that
+    edge points away from, and node v has to be the tail of exactly
+    (degree - imbalance) / 2 of them. The lower bounds are assigned up front,
+    which leaves each pair the rest to split however it likes.
+    """
+    num_nodes = adjancency.shape[0]
+    degree = adjancency.sum(axis=1)
+    need_out = degree - imbalance
+    if np.any(need_out % 2 != 0):
+        return None
+    need_out //= 2
+
+    # Including pairs with no edges left, which can't fix their direction
+    if np.any(lower > adjancency):
+        return None
+
+    a, b = np.nonzero(np.triu(adjancency, 1))
+    a_lower, b_lower = lower[a, b], lower[b, a]
+    free = adjancency[a, b] - a_lower - b_lower
+    if np.any(free < 0):
+        return None
+
+    need_out -= np.bincount(a, a_lower, num_nodes).astype(need_out.dtype)
+    need_out -= np.bincount(b, b_lower, num_nodes).astype(need_out.dtype)
+    if np.any(need_out < 0) or need_out.sum() != free.sum():
+        return None
+
+    # Flow nodes: source, one per pair, one per graph node, sink
+    num_pairs = len(a)
+    source, sink = 0, 1 + num_pairs + num_nodes
+    pair_nodes = 1 + np.arange(num_pairs)
+    graph_nodes = 1 + num_pairs + np.arange(num_nodes)
+    rows = np.concatenate([np.full(num_pairs, source), pair_nodes, pair_nodes,
+                           graph_nodes])
+    cols = np.concatenate([pair_nodes, graph_nodes[a], graph_nodes[b],
+                           np.full(num_nodes, sink)])
+    capacities = np.concatenate([free, free, free, need_out]).astype(np.int32)
+    network = csr_matrix((capacities, (rows, cols)), shape=(sink + 1, sink + 1))
+
+    result = maximum_flow(network, source, sink)
+    if result.flow_value != free.sum():
+        return None
+
+    flow = result.flow.toarray()
+    orientation = np.zeros_like(adjancency)
+    orientation[a, b] = a_lower + flow[pair_nodes, graph_nodes[a]]
+    orientation[b, a] = b_lower + flow[pair_nodes, graph_nodes[b]]
+    return orientation
+
+
+def orientation_is_feasible(adjancency, imbalance, lower):
+    """
+    Whether the undirected edges left in `adjancency` can be oriented so that
+    every node ends up with as many edges out as in. See feasible_orientation.
+    """
+    return feasible_orientation(adjancency, imbalance, lower) is not None
 
 
 def obeys_induced_subgraph_condition(adjancency, a, c,
-                                     total_edge_follows, phase_edge_follows):
+                                     total_edge_follows, phase_edge_follows,
+                                     planned_edge_follows=None):
+    # Whether following the edge a -> c still leaves a way to finish this
+    # phase's tour with every pair balanced. Earlier phases are closed tours,
+    # so only this phase's follows can leave a node unbalanced, but earlier
+    # phases' follows still count towards each pair's total.
     adjancency = adjancency.copy()
     total_edge_follows = total_edge_follows.copy()
     phase_edge_follows = phase_edge_follows.copy()
 
-    # Follow this edge
     adjancency[a, c] -= 1
     adjancency[c, a] -= 1
-
     total_edge_follows[a, c] += 1
     phase_edge_follows[a, c] += 1
 
-    masks = np.unpackbits(
-        np.arange(2 ** adjancency.shape[0], dtype=np.uint32)
-            .reshape((1, -1)).view(np.uint8),
-        count=adjancency.shape[0], axis=0).view(bool)
-
-    stride = 1000000
-    for i in tqdm(range(0, 2**adjancency.shape[0], stride)):
-        masks_2d = masks[:, None, i:i+stride] * ~masks[None, :, i:i+stride]
-
-        directed_out = (total_edge_follows[:, :, None] * masks_2d).sum(axis=(0, 1))
-        directed_in = (total_edge_follows[:, :, None] * np.transpose(masks_2d, (1, 0, 2))).sum(axis=(0, 1))
-        undirected = (adjancency[:, :, None] * masks_2d).sum(axis=(0, 1))
-
-        total_edges = directed_in + directed_out + undirected
-
-        directed_diff = directed_out - directed_in
-
-        cond_1, cond_2 = directed_diff, total_edges % 2 == 0
-
-        case_1 = cond_1 & cond_2
-        # max(0, directed_diff - undirected) == 0
-        # directed_diff - undirected > 0
-        # directed_diff > undirected
-        if not np.all(directed_diff[case_1] > undirected[case_1]):
-            return False
-
-        case_2 = cond_1 & ~cond_2
-        # max(1, directed_diff - undirected) == 0
-        # directed_diff - undirected == 0
-        # directed_diff == undirected
-        if not np.all(directed_diff[case_2] == undirected[case_2]):
+    imbalance = phase_edge_follows.sum(axis=1) - phase_edge_follows.sum(axis=0)
+    lower = min_edges_each_way(adjancency, total_edge_follows,
+                               phase_edge_follows, planned_edge_follows)
+    return orientation_is_feasible(adjancency, imbalance, lower)
+
+
+class OrientationTracker:
+    """
+    Incremental obeys_induced_subgraph_condition for one phase. It keeps one
+    feasible way of orienting the edges left (orientation[u, v] of them point
+    u -> v) and updates it as edges are followed, instead of solving the
+    max-flow problem again for every candidate.
+
+    Following an edge the orientation already points the same way just uses
+    it up. Otherwise one of the opposite edges gets used, which leaves a with
+    two too many edges out and c two too few, and reversing any path from a
+    to c puts that right. So the follow is feasible exactly when there is
+    such a path among edges that can still be reversed, which is a BFS.
+    Follows can be undone in reverse order, for backtracking.
+    """
+
+    def __init__(self, adjancency, total_edge_follows, phase_edge_follows,
+                 planned_edge_follows=None):
+        self.remaining = adjancency.copy()
+        self.total_follows = total_edge_follows.copy()
+        self.follows = phase_edge_follows.copy()
+        self.planned = (np.zeros_like(self.follows)
+                        if planned_edge_follows is None else planned_edge_follows)
+        imbalance = self.follows.sum(axis=1) - self.follows.sum(axis=0)
+        self.orientation = feasible_orientation(
+            self.remaining, imbalance,
+            min_edges_each_way(self.remaining, self.total_follows,
+                               self.follows, self.planned))
+        assert self.orientation is not None, "no balanced tour for this phase"
+        self.history = []
+
+    def lower(self, u, v):
+        # min_edges_each_way for one pair
+        behind = max(self.total_follows[v, u] - self.total_follows[u, v],
+                     self.follows[v, u] - self.follows[u, v])
+        return max(0, (self.remaining[u, v] + behind) // 2,
+                   self.planned[u, v] - self.follows[u, v])
+
+    def reversible(self, u, v):
+        return self.orientation[u, v] > self.lower(u, v)
+
+    def find_path(self, a, c):
+        came_from = {a: None}
+        queue = deque([a])
+        while queue:
+            u = queue.popleft()
+            if u == c:
+                path = []
+                while came_from[u] is not None:
+                    path.append((came_from[u], u))
+                    u = came_from[u]
+                return path[::-1]
+            for v in self.orientation[u].nonzero()[0]:
+                if v not in came_from and self.reversible(u, v):
+                    came_from[v] = u
+                    queue.append(v)
+        return None
+
+    def _use_edge(self, a, c, pointing_from, amount):
+        self.remaining[a, c] -= amount
+        self.remaining[c, a] -= amount
+        self.total_follows[a, c] += amount
+        self.follows[a, c] += amount
+        self.orientation[pointing_from, a if pointing_from == c else c] -= amount
+
+    def follow(self, a, c):
+        """
+        Follow a -> c if that still leaves a feasible orientation. Returns
+        whether it did.
+        """
+        if self.remaining[a, c] == 0:
             return False
 
-        case_3 = ~cond_1 & cond_2
-        # min(0, directed_diff + undirected) == 0
-        # directed_diff + undirected >= 0
-        # directed_diff >= -undirected
-        if not np.all(directed_diff[case_3] >= -undirected[case_3]):
+        if self.orientation[a, c] > 0:
+            self._use_edge(a, c, a, 1)
+            self.history.append((a, c, a, []))
+            return True
+
+        self._use_edge(a, c, c, 1)
+        path = None
+        if self.orientation[c, a] >= self.lower(c, a):
+            path = self.find_path(a, c)
+        if path is None:
+            self._use_edge(a, c, c, -1)
             return False
 
-        case_4 = ~cond_1 & ~cond_2
-        # min(-1, directed_diff + undirected) == 0
-        # directed_diff + undirected == 0
-        # directed_diff == -undirected
-        if not np.all(directed_diff[case_4] == -undirected[case_4]):
-            return False
-
-    print("Deficiency check passed")
-
-    return True
-
-
-def get_path_until(adjancency, start_node, end_node, total_edge_follows,
-                   phase_edge_follows, came_from=None):
-    # Recursion base case
-    if came_from is not None and start_node == end_node:
-        return []
-
+        for u, v in path:
+            self.orientation[u, v] -= 1
+            self.orientation[v, u] += 1
+        self.history.append((a, c, c, path))
+        return True
+
+    def undo(self):
+        a, c, pointing_from, path = self.history.pop()
+        for u, v in path:
+            self.orientation[u, v] += 1
+            self.orientation[v, u] -= 1
+        self._use_edge(a, c, pointing_from, -1)
+
+    def can_follow(self, a, c):
+        if self.follow(a, c):
+            self.undo()
+            return True
+        return False
+
+
+def order_candidates(adjancency, start_node, total_edge_follows,
+                     phase_edge_follows, tracker=None,
+                     planned_edge_follows=None):
     # Get a list of candidates for which node to jump to next
     candidates0 = adjancency[start_node].nonzero()[0]
 
-    assert candidates0.size > 0
-
-    candidates1 = candidates0[
-        [i for i, c in enumerate(candidates0)
-         if obeys_induced_subgraph_condition(
-            adjancency, start_node, c, total_edge_follows, phase_edge_follows)]
-    ]
-
-    assert candidates1.size > 0
+    if tracker is not None:
+        candidates1 = candidates0[
+            [i for i, c in enumerate(candidates0)
+             if tracker.can_follow(start_node, c)]
+        ]
+    else:
+        candidates1 = candidates0[
+            [i for i, c in enumerate(candidates0)
+             if obeys_induced_subgraph_condition(
+                adjancency, start_node, c, total_edge_follows,
+                phase_edge_follows, planned_edge_follows)]
+        ]
+
+    if candidates1.size == 0:
+        return []
 
     # Sort candidates by how many extra edges in the respective node pair are
     # already pointed this direction. If fewer are pointed this direction than
     # the other direction, then choosing that candidate is more helpful so it
     # goes to the beginning. If more are pointed this direction than the other
     # direction, then choosing that candidate takes us further from our goal so
-    # it goes to the end. Then the frontmost candidate is selected.
+    # it goes to the end. Ties go to the candidate with the most edges left,
+    # and remaining ties are broken randomly. The frontmost candidate is
+    # selected, and the rest are the alternatives to backtrack to.
     total_net_edge_follows = (total_edge_follows[start_node, candidates1] -
                               total_edge_follows[candidates1, start_node])
     phase_net_edge_follows = (phase_edge_follows[start_node, candidates1] -
                               phase_edge_follows[candidates1, start_node])
     net_edge_follows = np.minimum(total_net_edge_follows,
                                   phase_net_edge_follows)
-    candidates2 = candidates1[net_edge_follows == net_edge_follows.min()]
-
-    remaining_nodes = adjancency[candidates2].sum(axis=1)
-    candidates3 = candidates2[remaining_nodes == remaining_nodes.max()]
-
-    next_node = random.choice(candidates3)
-
-    # Net follows in this direction if all remaining nodes were assigned in
-    # the opposite direction must be at most 1
-    assert (total_edge_follows[start_node, next_node] -
-            total_edge_follows[next_node, start_node] -
-            adjancency[start_node, next_node]) <= 1
-    assert (phase_edge_follows[start_node, next_node] -
-            phase_edge_follows[next_node, start_node] -
-            adjancency[start_node, next_node]) <= 1
-    # print("SKIPPED CANDIDATE")
-    # continue
-
-    total_edge_follows[start_node, next_node] += 1
-    phase_edge_follows[start_node, next_node] += 1
-
-    assert adjancency[start_node, next_node] > 0
-    assert adjancency[next_node, start_node] > 0
-    adjancency[start_node, next_node] -= 1
-    adjancency[next_node, start_node] -= 1
-
-    assert (total_edge_follows[start_node, next_node] -
-            total_edge_follows[next_node, start_node] -
-            adjancency[start_node, next_node]) <= 1
-    assert (phase_edge_follows[start_node, next_node] -
-            phase_edge_follows[next_node, start_node] -
-            adjancency[start_node, next_node]) <= 1
-
-    path_rest = get_path_until(adjancency, start_node=next_node,
-                               end_node=end_node,
-                               total_edge_follows=total_edge_follows,
-                               phase_edge_follows=phase_edge_follows,
-                               came_from=start_node)
-
-    if path_rest is None:
-        # Undo modifications to adjacency and edge_follows
-        total_edge_follows[start_node, next_node] -= 1
-        phase_edge_follows[start_node, next_node] -= 1
-        adjancency[start_node, next_node] += 1
-        adjancency[next_node, start_node] += 1
-
-    return [(start_node, next_node)] + path_rest
-
-    # print("BACKTRACKED")
-    # return None
+    remaining_nodes = adjancency[candidates1].sum(axis=1)
+
+    shuffle = random.sample(range(candidates1.size), candidates1.size)
+    order = np.lexsort((shuffle, -remaining_nodes, net_edge_follows))
+    return list(candidates1[order])
+
+
+def keeps_pairs_balanced(adjancency, a, c, total_edge_follows,
+                         phase_edge_follows):
+    # Net follows a -> c after following it, if all remaining edges were
+    # assigned in the opposite direction, must be at most 1
+    return ((total_edge_follows[a, c] - total_edge_follows[c, a] -
+             adjancency[a, c]) <= -1 and
+            (phase_edge_follows[a, c] - phase_edge_follows[c, a] -
+             adjancency[a, c]) <= -1)
+
+
+def follow_edge(adjancency, a, c, total_edge_follows, phase_edge_follows,
+                tracker=None, amount=1):
+    # amount=-1 undoes a follow
+    assert adjancency[a, c] - amount >= 0
+    total_edge_follows[a, c] += amount
+    phase_edge_follows[a, c] += amount
+    adjancency[a, c] -= amount
+    adjancency[c, a] -= amount
+    if tracker is None:
+        pass
+    elif amount > 0:
+        assert tracker.follow(a, c)
+    else:
+        tracker.undo()
+
+
+def get_path_until(adjancency, start_node, end_node, total_edge_follows,
+                   phase_edge_follows, came_from=None, tracker=None,
+                   backtrack=False, planned_edge_follows=None):
+    """
+    Walk from start_node until reaching end_node, following the best
+    candidate at each step, and return the edges followed. Edges are used up
+    in `adjancency` and counted in the follows matrices as it goes.
+
+    Iterative, with an explicit stack of the alternatives left at each step.
+    Without `backtrack` a dead end (no candidate that keeps the tour
+    finishable and every pair balanced) is an AssertionError, as it always
+    was. With it, the walk steps back and takes the next alternative
+    instead, and only fails once the alternatives at start_node run out.
+    The feasibility check includes every pair's balance, so neither happens
+    when the phase started out feasible.
+    """
+    if came_from is not None and start_node == end_node:
+        return []
+
+    path = []
+    alternatives_stack = []
+    node = start_node
+    alternatives = None
+    while not path or node != end_node:
+        if alternatives is None:
+            alternatives = order_candidates(adjancency, node,
+                                            total_edge_follows,
+                                            phase_edge_follows, tracker,
+                                            planned_edge_follows)
+            # Reversed, so the best candidate is popped first
+            alternatives.reverse()
+
+        next_node = None
+        while alternatives:
+            candidate = alternatives.pop()
+            if keeps_pairs_balanced(adjancency, node, candidate,
+                                    total_edge_follows, phase_edge_follows):
+                next_node = candidate
+                break
+            assert backtrack, "no candidate keeps every pair balanced"
+
+        if next_node is None:
+            assert backtrack and path, "walk got stuck"
+            a, c = path.pop()
+            follow_edge(adjancency, a, c, total_edge_follows,
+                        phase_edge_follows, tracker, amount=-1)
+            node = a
+            alternatives = alternatives_stack.pop()
+            continue
+
+        follow_edge(adjancency, node, next_node, total_edge_follows,
+                    phase_edge_follows, tracker)
+        path.append((node, next_node))
+        alternatives_stack.append(alternatives)
+        node = next_node
+        alternatives = None
+
+    return path
 
 
 def get_euler_tour(adjancency, start_node, total_edge_follows,
-                   phase_edge_follows):
-    tour = get_tour(adjancency, start_node, total_edge_follows,
-                    phase_edge_follows)
-    # Classic-style for loop allows modifying the list while traversing it
+                   phase_edge_follows, tracker=None, backtrack=False,
+                   planned_edge_follows=None):
+    # The tour is kept as a linked list of edges, so nested tours are spliced
+    # in at the cursor in constant time
+    edges = []
+    next_edge = []
+
+    def add_tour(tour, after):
+        if not tour:
+            return
+        first = len(edges)
+        edges.extend(tour)
+        next_edge.extend(range(first + 1, first + len(tour)))
+        next_edge.append(-1 if after is None else next_edge[after])
+        if after is not None:
+            next_edge[after] = first
+
+    add_tour(get_tour(adjancency, start_node, total_edge_follows,
+                      phase_edge_follows, tracker, backtrack,
+                      planned_edge_follows), None)
+
     i = 0
-    while i < len(tour):
-        a, b = tour[i]
-
-        # Check if there is an unused edge on node B
-        if adjancency[b].nonzero()[0].size > 0:
-            # If so, find a tour from it and splice the nested tour into the
-            # main tour
-            nested_tour = get_tour(adjancency, b, total_edge_follows,
-                                   phase_edge_follows)
-            # This is python's idiosyncratic way of splicing lists
-            tour[i + 1:i + 1] = nested_tour
-
-            # Check
-            pa, pb = tour[-1]
-            for ta, tb in tour:
-                assert ta == pb
-                pa, pb = ta, tb
-
-        i += 1
+    while i != -1:
+        a, b = edges[i]
+
+        # If there is an unused edge on node B, find a tour from it and
+        # splice it into the main tour right after this edge
+        if adjancency[b].any():
+            add_tour(get_tour(adjancency, b, total_edge_follows,
+                              phase_edge_follows, tracker, backtrack,
+                              planned_edge_follows), i)
+
+        i = next_edge[i]
+
+    tour = []
+    i = 0
+    while i != -1:
+        tour.append(edges[i])
+        i = next_edge[i]
+
+    # Check it's one closed walk
+    for (_, b), (a, _) in zip(tour, tour[1:] + tour[:1]):
+        assert a == b
 
     return tour
 
@@ -204,7 +422,135 @@ def phase_for_day(day):
         return 2
 
 
-def test_matchups(matchups_by_day, all_teams):
+def plan_pair_directions(adjancency_by_phase):
+    """
+    Which way round each pair that matters to a later phase plays this one,
+    as planned_edge_follows for each phase, or None if no way works.
+
+    A pair that plays an odd number of times in a phase ends that phase one
+    game up one way or the other, and keeping its total within 1 means it
+    has to go the other way the next phase it plays an odd number of times.
+    So picking a direction in one phase's tour picks it in later phases too,
+    and a later phase can be left with no balanced tour. The directions of
+    those pairs are searched for here instead, one pair at a time, keeping
+    each phase's max-flow check feasible and stepping back when it isn't.
+    Pairs that are only odd in one phase are left to the tours.
+    """
+    num_nodes = adjancency_by_phase[0].shape[0]
+
+    pairs = []
+    for a, b in zip(*np.triu_indices(num_nodes, 1)):
+        odd_phases = [phase for phase, adjancency in enumerate(adjancency_by_phase)
+                      if adjancency[a, b] % 2 == 1]
+        if len(odd_phases) > 1:
+            pairs.append((a, b, odd_phases))
+
+    # A search that has stepped back this many times is started again in a
+    # different order, with twice the limit, because a bad early choice can
+    # take very long to undo one pair at a time
+    max_steps_back = 4 * len(pairs)
+    while True:
+        planned_by_phase = search_pair_directions(
+            adjancency_by_phase, pair_order(pairs), max_steps_back)
+        if planned_by_phase is not False:
+            return planned_by_phase
+        max_steps_back *= 2
+
+
+def pair_order(pairs):
+    # Each pair next to the pairs it shares nodes with, so that a node's
+    # pairs are all planned close together and a node that can't be
+    # balanced is found before many other pairs get planned on top of it
+    order = []
+    planned_at_node = defaultdict(int)
+    left = random.sample(pairs, len(pairs))
+    while left:
+        i = max(range(len(left)),
+                key=lambda i: (planned_at_node[left[i][0]] +
+                               planned_at_node[left[i][1]], len(left[i][2])))
+        a, b, odd_phases = left.pop(i)
+        order.append((a, b, odd_phases))
+        planned_at_node[a] += 1
+        planned_at_node[b] += 1
+    return order
+
+
+def search_pair_directions(adjancency_by_phase, pairs, max_steps_back):
+    # plan_pair_directions for pairs in this order, or False if it has to
+    # step back more than max_steps_back times
+    no_follows = np.zeros_like(adjancency_by_phase[0])
+    planned_by_phase = [np.zeros_like(no_follows) for _ in adjancency_by_phase]
+
+    def plan(a, b, odd_phases, direction):
+        for phase in odd_phases:
+            games = adjancency_by_phase[phase][a, b]
+            planned_by_phase[phase][a, b] = (games + direction) // 2
+            planned_by_phase[phase][b, a] = (games - direction) // 2
+            direction = -direction
+
+    def orient(phase):
+        adjancency = adjancency_by_phase[phase]
+        lower = min_edges_each_way(adjancency, no_follows, no_follows,
+                                   planned_by_phase[phase])
+        return feasible_orientation(adjancency, no_follows.sum(axis=1), lower)
+
+    # A feasible orientation for each phase, given the pairs planned so far.
+    # Planning a pair the way these already point it keeps them feasible, so
+    # that direction is tried first and only phases that disagree are solved
+    # again. Stepping back only loosens the plan, so they stay feasible then.
+    orientations = [orient(phase) for phase in range(len(adjancency_by_phase))]
+    if any(orientation is None for orientation in orientations):
+        return None
+
+    def directions(a, b, odd_phases):
+        # Least preferred first, because they're popped from the end
+        votes = sum((-1) ** i * np.sign(orientations[phase][a, b] -
+                                         orientations[phase][b, a])
+                    for i, phase in enumerate(odd_phases))
+        if votes == 0:
+            return random.sample((1, -1), 2)
+        return [-np.sign(votes), np.sign(votes)]
+
+    def replan(a, b, odd_phases, direction):
+        plan(a, b, odd_phases, direction)
+        for i, phase in enumerate(odd_phases):
+            orientation = orientations[phase]
+            net = orientation[a, b] - orientation[b, a]
+            if net == (-1) ** i * direction:
+                continue
+            orientation = orient(phase)
+            if orientation is None:
+                return False
+            orientations[phase] = orientation
+        return True
+
+    # Directions left to try for each pair planned so far, most recent last
+    alternatives_stack = []
+    alternatives = None
+    steps_back = 0
+    while len(alternatives_stack) < len(pairs):
+        a, b, odd_phases = pairs[len(alternatives_stack)]
+        if alternatives is None:
+            alternatives = directions(a, b, odd_phases)
+
+        if not alternatives:
+            if not alternatives_stack:
+                return None
+            steps_back += 1
+            if steps_back > max_steps_back:
+                return False
+            plan(a, b, odd_phases, 0)
+            alternatives = alternatives_stack.pop()
+            continue
+
+        if replan(a, b, odd_phases, alternatives.pop()):
+            alternatives_stack.append(alternatives)
+            alternatives = None
+
+    return planned_by_phase
+
+
+def test_matchups(matchups_by_day, all_teams, incremental=True, backtrack=False):
     team_ids = sorted(all_teams)
     index_for_team = {team_id: i for i, team_id in enumerate(team_ids)}
     num_teams = len(team_ids)
@@ -246,13 +592,23 @@ def test_matchups(matchups_by_day, all_teams):
 
     total_edge_follows = np.zeros_like(adjancency_by_phase[0])
 
+    planned_by_phase = plan_pair_directions(adjancency_by_phase)
+    assert planned_by_phase is not None, "no balanced schedule for these matchups"
+
     # The euler tours for the 3 phases must share a start node. Any team
     # will do because they're all guaranteed to have games in each phase.
     start_node = 1  # np.random.randint(0, num_teams)
     for phase in range(0, 3):
         phase_edge_follows = np.zeros_like(adjancency_by_phase[0])
+        tracker = None
+        if incremental:
+            tracker = OrientationTracker(adjancency_by_phase[phase],
+                                         total_edge_follows,
+                                         phase_edge_follows,
+                                         planned_by_phase[phase])
         tour = get_euler_tour(adjancency_by_phase[phase], start_node,
-                              total_edge_follows, phase_edge_follows)
+                              total_edge_follows, phase_edge_follows, tracker,
+                              backtrack, planned_by_phase[phase])
 
         for a, b in tour:
             if a == num_teams or b == num_teams:
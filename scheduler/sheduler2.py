@@ -1,9 +1,8 @@
-import json
-import random
 from collections import defaultdict
-from itertools import count
 
 import mip
+import numpy as np
+from scipy.sparse import csr_matrix
 
 
 def phase_for_day(day):
@@ -15,90 +14,138 @@ def phase_for_day(day):
         return 2
 
 
+class ScheduleModel:
+    """
+    One model for every season with the same teams, so it's only built once.
+
+    The balance constraints don't care which day a game is on, only how many
+    games each pair plays each way in each phase. A pair (a, b) with a < b
+    that plays n games in a phase has to play n // 2 of them with a listed
+    first and n // 2 with b listed first, and if n is odd the extra game
+    can go either way. So the model has one binary per phase and pair, which
+    is 1 if the extra game has a listed first, and is fixed to 0 if there's
+    no extra game. The pair's net count is then 2 * extra - (n % 2), and a
+    team's is the sum of that over its pairs, negated for pairs where it's
+    listed second.
+
+    Every constraint has the same coefficients whatever the season, which
+    only sets the constants: which binaries are free, and each constraint's
+    right-hand side. Each solve is warm started from the last solution.
+    """
+
+    def __init__(self, team_ids):
+        self.team_ids = list(team_ids)
+        self.team_index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+
+        num_teams = len(self.team_ids)
+        self.pair_a, self.pair_b = np.triu_indices(num_teams, 1)
+        self.pair_index = np.full((num_teams, num_teams), -1)
+        self.pair_index[self.pair_a, self.pair_b] = np.arange(len(self.pair_a))
+        self.pair_index[self.pair_b, self.pair_a] = np.arange(len(self.pair_a))
+
+        self.m = mip.Model()
+        self.m.emphasis = 1  # 1 = feasibility emphasis
+        self.m.verbose = 0
+
+        # Nothing is playing until a season is set
+        self.extra = self.m.add_var_tensor((3, len(self.pair_a)), "extra",
+                                           ub=0, var_type=mip.BINARY)
+        self.odd = np.zeros(self.extra.shape, dtype=int)
+        self.solution = np.zeros(self.extra.shape, dtype=int)
+
+        # Each signed sum of 2 * extra - odd has to be within 1, so the sum
+        # of 2 * extra has to be within 1 of the same sum of odd, which is
+        # its right-hand side. The signs of every sum are kept as one sparse
+        # matrix, so the right-hand sides are one product per season.
+        self.upper, self.lower = [], []
+        rows, cols, signs = [], [], []
+        for pair in range(len(self.pair_a)):
+            self.add_sum(np.arange(3), [pair], np.array([1]), rows, cols, signs)
+        for team in range(num_teams):
+            pairs = np.concatenate([np.nonzero(self.pair_a == team)[0],
+                                    np.nonzero(self.pair_b == team)[0]])
+            team_signs = np.where(self.pair_a[pairs] == team, 1, -1)
+            self.add_sum(np.arange(3), pairs, team_signs, rows, cols, signs)
+            for phase in range(3):
+                self.add_sum([phase], pairs, team_signs, rows, cols, signs)
+        self.sum_signs = csr_matrix(
+            (np.concatenate(signs), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(self.upper), self.extra.size))
+        self.net_odd = np.zeros(len(self.upper), dtype=int)
+
+    def add_sum(self, phases, pairs, signs, all_rows, all_cols, all_signs):
+        cells = np.ix_(phases, pairs)
+        coeffs = np.broadcast_to(signs, (len(phases), len(pairs))).ravel()
+        summed = mip.LinExpr(list(self.extra[cells].flat), (2 * coeffs).tolist())
+        all_rows.append(np.full(len(coeffs), len(self.upper)))
+        all_cols.append(np.ravel_multi_index(cells, self.extra.shape).ravel())
+        all_signs.append(coeffs)
+        self.upper.append(self.m.add_constr(summed <= 1))
+        self.lower.append(self.m.add_constr(summed >= -1))
+
+    def count_games(self, matchups_by_day):
+        games = np.zeros(self.extra.shape, dtype=int)
+        for day, matchups in matchups_by_day.items():
+            phase = phase_for_day(day)
+            for (a, b) in matchups:
+                games[phase, self.pair_index[self.team_index[a],
+                                             self.team_index[b]]] += 1
+        return games
+
+    def set_odd(self, odd):
+        # Only the bounds and right-hand sides that changed are set
+        for phase, pair in zip(*np.nonzero(odd != self.odd)):
+            self.extra[phase, pair].ub = odd[phase, pair]
+
+        net_odd = self.sum_signs @ odd.ravel()
+        for i in np.nonzero(net_odd != self.net_odd)[0]:
+            self.upper[i].rhs = net_odd[i] + 1
+            self.lower[i].rhs = net_odd[i] - 1
+
+        self.odd = odd
+        self.net_odd = net_odd
+
+    def solve(self, matchups_by_day):
+        games = self.count_games(matchups_by_day)
+        self.set_odd(games % 2)
+
+        # Start from the last solution, for the extra games this season
+        # still has. It won't usually be feasible, but the solver repairs it
+        # from there. Binaries left out of the start are taken to be 0.
+        free = list(zip(*np.nonzero(self.odd)))
+        self.m.start = [(self.extra[phase, pair], int(self.solution[phase, pair]))
+                        for phase, pair in free]
+
+        status = self.m.optimize()
+        assert (status == mip.OptimizationStatus.OPTIMAL or
+                status == mip.OptimizationStatus.FEASIBLE)
+        self.solution[:] = 0
+        for phase, pair in free:
+            self.solution[phase, pair] = self.extra[phase, pair].x > 0.5
+
+        # Give each pair its games with the lower team listed first before
+        # the rest, in any order of days
+        forward_left = games // 2 + self.solution
+        schedule = defaultdict(lambda: [])
+        for day, matchups in matchups_by_day.items():
+            phase = phase_for_day(day)
+            for (a, b) in matchups:
+                i, j = sorted((self.team_index[a], self.team_index[b]))
+                pair = self.pair_index[i, j]
+                if forward_left[phase, pair] > 0:
+                    forward_left[phase, pair] -= 1
+                    schedule[day].append((i, j))
+                else:
+                    schedule[day].append((j, i))
+
+        return schedule
+
+
+_models = {}
+
+
 def test_matchups(matchups_by_day, all_teams):
-    m = mip.Model()
-    m.emphasis = 1  # 1 = feasibility emphasis
-    m.verbose = 0
-
-    games_at_phase = [0 for _ in range(3)]
-
-    vars_by_day = {k: [] for k in matchups_by_day.keys()}
-    team_total_sums = {team: 0 for team in all_teams}
-    team_phase_sums = [{team: 0 for team in all_teams} for _ in range(3)]
-    team_matchup_sums = {team: {t: 0 for t in all_teams} for team in all_teams}
-    team_phase_matchup_sums = [
-        {team: {t: 0 for t in all_teams} for team in all_teams} for _ in
-        range(3)]
-    for day, matchups in matchups_by_day.items():
-        phase = phase_for_day(day)
-        games_at_phase[phase] += 1
-
-        for (a, b) in matchups:
-            forward = m.add_var(var_type=mip.BINARY)
-            backward = m.add_var(var_type=mip.BINARY)
-            vars_by_day[day].append((forward, backward))
-
-            m += forward + backward == 1
-
-            # The forward-facing game counts for a and against b, and
-            # the backward-facing game is the reverse
-            team_total_sums[a] = team_total_sums[a] + forward - backward
-            team_total_sums[b] = team_total_sums[b] + backward - forward
-
-            # Same as the total, but also indexed by phase
-            team_phase_sums[phase][a] = \
-                team_phase_sums[phase][a] + forward - backward
-            team_phase_sums[phase][b] = \
-                team_phase_sums[phase][b] + backward - forward
-
-            team_matchup_sums[a][b] = \
-                team_matchup_sums[a][b] + forward - backward
-            team_matchup_sums[b][a] = \
-                team_matchup_sums[b][a] + backward - forward
-
-            team_phase_matchup_sums[phase][a][b] = \
-                team_phase_matchup_sums[phase][a][b] + forward - backward
-            team_phase_matchup_sums[phase][b][a] = \
-                team_phase_matchup_sums[phase][b][a] + backward - forward
-
-    for summed in team_total_sums.values():
-        m += summed <= 1
-        m += summed >= -1
-
-    for phase_summed in team_phase_sums:
-        for summed in phase_summed.values():
-            if summed is not 0:  # Do not use == here, it is overridden
-                m += summed <= 1
-                m += summed >= -1
-
-    for matchup_summed in team_matchup_sums.values():
-        for summed in matchup_summed.values():
-            if summed is not 0:  # Do not use == here, it is overridden
-                m += summed <= 1
-                m += summed >= -1
-
-    for phase_summed in team_phase_matchup_sums:
-        for matchup_summed in phase_summed.values():
-            for summed in matchup_summed.values():
-                if summed is not 0:  # Do not use == here, it is overridden
-                    m += summed <= 1
-                    m += summed >= -1
-
-    status = m.optimize()
-    assert (status == mip.OptimizationStatus.OPTIMAL or
-            status == mip.OptimizationStatus.FEASIBLE)
-
-    team_to_num = {team_id: i for i, team_id in enumerate(all_teams)}
-    schedule = defaultdict(lambda: [])
-    for day in matchups_by_day.keys():
-        for teams, variables in zip(matchups_by_day[day], vars_by_day[day]):
-            if variables[0].x > 0:
-                assert variables[1].x == 0
-                schedule[day].append((team_to_num[teams[0]],
-                                      team_to_num[teams[1]]))
-            else:
-                assert variables[1].x > 0
-                schedule[day].append((team_to_num[teams[1]],
-                                      team_to_num[teams[0]]))
-
-    return schedule
+    key = frozenset(all_teams)
+    if key not in _models:
+        _models[key] = ScheduleModel(sorted(all_teams))
+    return _models[key].solve(matchups_by_day)
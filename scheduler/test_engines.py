@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from scheduler.engines import get_engine
+from scheduler.main import get_season, seed_everything, validate
+
+
+@pytest.mark.parametrize("engine", ["euler", "euler-backtrack"])
+@pytest.mark.parametrize("season", [13, 14, 16])
+def test_real_season(engine, season, monkeypatch):
+    # get_season reads the matchups from the working directory
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    matchups_by_day = get_season(season)
+    teams = set(team for pairs in matchups_by_day.values()
+                for pair in pairs for team in pair)
+
+    seed_everything(0)
+    validate(teams, get_engine(engine)(matchups_by_day, teams))
+
+
+def test_mip_across_seasons(monkeypatch):
+    # Every season after the first reuses the model the first one built
+    pytest.importorskip("mip")
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    for season in range(13, 20):
+        matchups_by_day = get_season(season)
+        teams = set(team for pairs in matchups_by_day.values()
+                    for pair in pairs for team in pair)
+        validate(teams, get_engine("mip")(matchups_by_day, teams))
@@ -0,0 +1,145 @@
+"""
+Concurrent Chronicler client.
+
+All requests go through one pooled requests Session, so connections are
+reused, and failed requests (connection errors, 429s and 5xxs) are retried
+with exponential backoff by urllib3. The async methods run the blocking
+requests on a thread pool as big as the connection pool, which is what
+bounds the concurrency, so
+
+    oldest = run(client.get_versions_many("player", ids, count=1))
+
+keeps `concurrency` requests in flight until every id is done, instead of
+making them one at a time. Pagination (nextPage) is followed automatically.
+
+Scripts that aren't async can use the blocking wrappers at the bottom, which
+share one default client. That one answers from the shared http_cache.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from util.http_cache import CachingAdapter, HttpCache, default_cache
+
+CHRON_V1 = "https://api.sibr.dev/chronicler/v1"
+CHRON_V2 = "https://api.sibr.dev/chronicler/v2"
+PAGE_SIZE = 1000
+
+
+class ChroniclerClient:
+    def __init__(self, concurrency: int = 16, retries: int = 5, backoff: float = 0.5,
+                 timeout: float = 60, cache: Optional[HttpCache] = None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        pool = dict(pool_connections=4, pool_maxsize=concurrency, max_retries=Retry(
+            total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=["GET"], respect_retry_after_header=True))
+        if cache is not None:
+            adapter = CachingAdapter(cache, "chronicler", **pool)
+        else:
+            adapter = HTTPAdapter(**pool)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="chron")
+
+    def get(self, url: str, params: Optional[dict] = None):
+        resp = self.session.get(url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def aget(self, url: str, params: Optional[dict] = None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.get, url, params)
+
+    async def pages(self, url: str, params: dict, key: str = "items",
+                    limit: Optional[int] = None) -> List[dict]:
+        # Pages of one query have to be fetched in order, because each one
+        # has the token for the next
+        params = dict(params, count=min(PAGE_SIZE, limit) if limit else PAGE_SIZE)
+        items = []
+        while True:
+            resp = await self.aget(url, params)
+            items.extend(resp[key])
+            if limit is not None and len(items) >= limit:
+                return items[:limit]
+            if not resp.get("nextPage") or not resp[key]:
+                return items
+            params["page"] = resp["nextPage"]
+
+    async def get_entities(self, type_: str, at: Optional[str] = None,
+                           ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        params = {"type": type_}
+        if at is not None:
+            params["at"] = at
+        if ids is not None:
+            params["id"] = ",".join(ids)
+        items = await self.pages(f"{CHRON_V2}/entities", params)
+        return {item["entityId"]: item["data"] for item in items}
+
+    async def get_versions(self, type_: str, id_: Optional[str] = None,
+                           count: Optional[int] = None, **params) -> List[dict]:
+        params = dict(params, type=type_)
+        if id_ is not None:
+            params["id"] = id_
+        params.setdefault("order", "asc")
+        return await self.pages(f"{CHRON_V2}/versions", params, limit=count)
+
+    async def get_versions_many(self, type_: str, ids: Iterable[str],
+                                count: Optional[int] = None, **params) -> Dict[str, List[dict]]:
+        ids = list(ids)
+        results = await asyncio.gather(*(self.get_versions(type_, id_, count, **params)
+                                         for id_ in ids))
+        return dict(zip(ids, results))
+
+    async def get_game_updates(self, game_id: str, **params) -> List[dict]:
+        return await self.pages(f"{CHRON_V1}/games/updates", dict(params, game=game_id), key="data")
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+
+def run(coro):
+    # asyncio.run can't be called from a thread with a loop already running
+    # (like a notebook's), so run the coroutine on its own loop in another
+    # thread there
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+_default_client: Optional[ChroniclerClient] = None
+
+
+def default_client() -> ChroniclerClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = ChroniclerClient(cache=default_cache())
+    return _default_client
+
+
+def get(url: str, params: Optional[dict] = None):
+    return default_client().get(url, params)
+
+
+def get_entities(type_: str, at: Optional[str] = None,
+                 ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    return run(default_client().get_entities(type_, at, ids))
+
+
+def get_versions_many(type_: str, ids: Iterable[str], count: Optional[int] = None,
+                      **params) -> Dict[str, List[dict]]:
+    return run(default_client().get_versions_many(type_, ids, count, **params))
+
+
+def get_oldest_versions(type_: str, ids: Iterable[str]) -> Dict[str, dict]:
+    versions = get_versions_many(type_, ids, count=1, order="asc")
+    return {id_: items[0] for id_, items in versions.items() if items}
@@ -0,0 +1,280 @@
+"""
+One response cache for every script.
+
+Everything lives in a single SQLite file (HTTP_CACHE_PATH, by default
+~/.cache/blaseball_analysis/http_cache.sqlite):
+
+    entries  request key -> body hash, status, headers, last use
+    bodies   body hash -> zlib-compressed body
+
+Request keys are a hash of the normalized request (method, lowercased host,
+path, sorted query parameters), so `?a=1&b=2` and `?b=2&a=1` share an entry.
+Bodies are stored by the hash of their content, so identical responses (empty
+pages, the same entity at two timestamps) are only stored once.
+
+When the bodies go over max_bytes, the least recently used entries are
+evicted. Pinned entries never are. Everything stored under one of
+IMMUTABLE_NAMESPACES is pinned, since the archives behind them are history
+that can't change, so only plain "http" responses are ever evicted.
+
+Hits and misses are counted per namespace and added to the totals in the
+file when the process exits, so
+
+    python -m util.http_cache
+
+reports them across every script that has used the cache.
+
+Use cached_session() for blaseball_mike or raw requests, CachingAdapter to
+add caching to an existing Session, and memoize() for derived results that
+took many requests to compute.
+"""
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Callable, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+DEFAULT_PATH = os.environ.get(
+    "HTTP_CACHE_PATH", os.path.expanduser("~/.cache/blaseball_analysis/http_cache.sqlite"))
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+# Namespaces for the SIBR archives, whose answers never change
+IMMUTABLE_NAMESPACES = frozenset({"chronicler", "blaseball_mike", "datablase", "eventually"})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    description TEXT,
+    body_hash TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    pinned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (pinned, used);
+CREATE INDEX IF NOT EXISTS entries_body ON entries (body_hash);
+CREATE TABLE IF NOT EXISTS stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL,
+    misses INTEGER NOT NULL
+);
+"""
+
+# Headers worth keeping; the rest (dates, cookies, cf-ray...) would just
+# make identical responses look different. Bodies are stored decoded, so
+# content-encoding isn't one of them.
+KEPT_HEADERS = {"content-type"}
+
+
+def normalize_url(url: str, params: Optional[dict] = None) -> str:
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(k, str(v)) for k, v in params.items() if v is not None]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/",
+                       urlencode(sorted(query)), ""))
+
+
+def request_key(method: str, url: str, params: Optional[dict] = None,
+                body: Optional[bytes] = None) -> str:
+    h = hashlib.sha256(f"{method.upper()} {normalize_url(url, params)}\n".encode("utf-8"))
+    if body:
+        h.update(body)
+    return h.hexdigest()
+
+
+class HttpCache:
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 immutable_namespaces=IMMUTABLE_NAMESPACES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.immutable_namespaces = frozenset(immutable_namespaces)
+        self.hits = Counter()
+        self.misses = Counter()
+        # The connection is shared by the Chronicler client's worker threads
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        atexit.register(self.flush_stats)
+
+    def get(self, key: str, namespace: str = "http") -> Optional[Tuple[int, dict, bytes]]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT e.status, e.headers, b.data FROM entries e "
+                "JOIN bodies b ON b.hash = e.body_hash WHERE e.key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[namespace] += 1
+                return None
+            self.db.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+            self.hits[namespace] += 1
+        status, headers, data = row
+        return status, json.loads(headers), zlib.decompress(data)
+
+    def put(self, key: str, content: bytes, status: int = 200, headers: Optional[dict] = None,
+            namespace: str = "http", description: str = "", pinned: Optional[bool] = None):
+        body_hash = hashlib.sha256(content).hexdigest()
+        headers = {k.lower(): v for k, v in (headers or {}).items() if k.lower() in KEPT_HEADERS}
+        pinned = namespace in self.immutable_namespaces if pinned is None else pinned
+        now = time.time()
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM bodies WHERE hash = ?", (body_hash,)).fetchone() is None:
+                data = zlib.compress(content, 6)
+                self.db.execute("INSERT INTO bodies VALUES (?, ?, ?)", (body_hash, data, len(data)))
+                self.size += len(data)
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, namespace, description, body_hash, status,
+                             json.dumps(headers), now, now, int(pinned)))
+            self.evict()
+
+    def evict(self):
+        # Caller holds the lock
+        if self.size <= self.max_bytes:
+            return
+        self.db.execute("BEGIN")
+        for key, body_hash, size in self.db.execute(
+                "SELECT e.key, e.body_hash, b.size FROM entries e "
+                "JOIN bodies b ON b.hash = e.body_hash "
+                "WHERE e.pinned = 0 ORDER BY e.used").fetchall():
+            if self.size <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            # Bodies are shared, so one only goes when its last entry does
+            if self.db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1",
+                               (body_hash,)).fetchone() is None:
+                self.db.execute("DELETE FROM bodies WHERE hash = ?", (body_hash,))
+                self.size -= size
+        self.db.execute("COMMIT")
+
+    def get_json(self, url: str, params: Optional[dict] = None, namespace: str = "http",
+                 session: Optional[requests.Session] = None):
+        key = request_key("GET", url, params)
+        cached = self.get(key, namespace)
+        if cached is not None:
+            return json.loads(cached[2])
+
+        resp = (session or requests).get(url, params=params)
+        resp.raise_for_status()
+        self.put(key, resp.content, resp.status_code, resp.headers, namespace,
+                 normalize_url(url, params))
+        return resp.json()
+
+    def memoize(self, namespace: str, name: str, compute: Callable[[], object]):
+        """
+        For results that are expensive to rebuild but aren't one response,
+        like a histogram made from thousands of requests. Always pinned.
+        """
+        key = request_key("MEMO", f"memo://{namespace}/{name}")
+        cached = self.get(key, namespace)
+        if cached is not None:
+            return json.loads(cached[2])
+
+        value = compute()
+        self.put(key, json.dumps(value).encode("utf-8"), namespace=namespace,
+                 description=name, pinned=True)
+        return value
+
+    def flush_stats(self):
+        with self.lock:
+            for namespace in set(self.hits) | set(self.misses):
+                self.db.execute(
+                    "INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT (namespace) DO UPDATE "
+                    "SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                    (namespace, self.hits[namespace], self.misses[namespace]))
+            self.hits.clear()
+            self.misses.clear()
+
+    def report(self):
+        self.flush_stats()
+        print(f"{self.path}: {self.size / 1024 ** 2:.1f} MiB compressed")
+        print(f"{'namespace':<24} {'entries':>8} {'hits':>8} {'misses':>8} {'hit rate':>8}")
+        rows = self.db.execute(
+            "SELECT s.namespace, s.hits, s.misses, "
+            "(SELECT COUNT(*) FROM entries e WHERE e.namespace = s.namespace) "
+            "FROM stats s ORDER BY s.namespace").fetchall()
+        for namespace, hits, misses, entries in rows:
+            total = hits + misses
+            rate = f"{hits / total:.1%}" if total else "-"
+            print(f"{namespace:<24} {entries:>8} {hits:>8} {misses:>8} {rate:>8}")
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that answers GETs from the cache. Takes the same
+    arguments as HTTPAdapter (pool sizes, max_retries) as well.
+    """
+
+    def __init__(self, cache: HttpCache, namespace: str = "http", **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.namespace = namespace
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        key = request_key(request.method, request.url)
+        cached = self.cache.get(key, self.namespace)
+        if cached is None:
+            response = super().send(request, **kwargs)
+            if response.status_code == 200:
+                self.cache.put(key, response.content, response.status_code, response.headers,
+                               self.namespace, normalize_url(request.url))
+            return response
+
+        status, headers, content = cached
+        raw = HTTPResponse(body=io.BytesIO(content), status=status, preload_content=False,
+                           headers=dict(headers, **{"content-length": str(len(content))}))
+        return self.build_response(request, raw)
+
+
+_default_cache: Optional[HttpCache] = None
+
+
+def default_cache() -> HttpCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HttpCache()
+    return _default_cache
+
+
+def cached_session(namespace: str = "http", cache: Optional[HttpCache] = None) -> requests.Session:
+    session = requests.Session()
+    adapter = CachingAdapter(cache or default_cache(), namespace)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_json(url: str, params: Optional[dict] = None, namespace: str = "http"):
+    return default_cache().get_json(url, params, namespace)
+
+
+def memoize(namespace: str, name: str, compute: Callable[[], object]):
+    return default_cache().memoize(namespace, name, compute)
+
+
+if __name__ == "__main__":
+    HttpCache(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH).report()
@@ -0,0 +1,396 @@
+"""
+Offline stand-in for Chronicler and Eventually.
+
+Responses come from a local archive directory instead of api.sibr.dev:
+
+    versions/<type>.jsonl   chronicler v2 versions {entityId, hash, validFrom, validTo, data}
+    game_updates.jsonl      chronicler v1 game updates {gameId, timestamp, hash, data}
+    events.jsonl            feed events, as returned by eventually
+
+The endpoints the scripts use are answered with the same query and paging
+semantics as the real ones (at/after/before, order, count, page, limit,
+offset), so blaseball_mike, raw requests.get calls and EntityStore all work
+unchanged. Anything else gets a 404 rather than silently going to the network.
+
+install() mounts the stand-in on every requests Session, so it has to run
+before the code under test makes its requests. Sessions that already exist
+(like the requests_cache session rng_game makes at import) can be passed in.
+In record mode, requests go to the real APIs and whatever comes back is added
+to the archive, so one online run fills it for every offline run after. Only
+what was fetched is archived, so an offline query that's broader than the
+recorded ones gets an incomplete answer.
+
+Set SIBR_ARCHIVE=<dir> (and SIBR_RECORD=1 to record) to turn it on for the
+scripts that call install_from_env(). The archive can also be served over
+HTTP for things that aren't Python:
+
+    python -m util.offline_api serve archive_dir --port 8080
+"""
+
+import io
+import json
+import os
+import sys
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from dateutil.parser import isoparse
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3 import HTTPResponse
+
+PREFIXES = ["https://api.sibr.dev/", "https://api.blaseball.com/"]
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+OPEN_ENDED = sys.maxsize
+DEFAULT_COUNT = 100
+
+Params = Dict[str, str]
+
+
+@lru_cache(maxsize=None)
+def to_micros(timestamp: str) -> int:
+    # Chronicler timestamps have anywhere from 0 to 6 fractional digits, and
+    # eventually also takes epoch seconds
+    try:
+        return int(float(timestamp) * 1_000_000)
+    except ValueError:
+        pass
+    dt = isoparse(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def split_list(value: Optional[str]) -> Optional[set]:
+    # Eventually joins alternatives with _or_, Chronicler with commas
+    return set(value.replace("_or_", ",").split(",")) if value else None
+
+
+def get_path(obj, dotted: str):
+    for part in dotted.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(part)
+    return obj
+
+
+def paged(items: list, params: Params, default_count: Optional[int] = DEFAULT_COUNT):
+    # Page tokens are opaque to clients, so an offset into the result does
+    start = int(params.get("page") or 0)
+    count = int(params["count"]) if params.get("count") else default_count
+    if count is None:
+        return items[start:], None
+    end = start + count
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+class Archive:
+    def __init__(self, root: str):
+        self.root = root
+        self._versions: Dict[str, dict] = {}
+        self._updates: Optional[Dict[str, list]] = None
+        self._events: Optional[list] = None
+
+    def path(self, *parts) -> str:
+        return os.path.join(self.root, *parts)
+
+    def read_jsonl(self, path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def append_jsonl(self, path: str, items: list):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, sort_keys=True) + "\n")
+
+    # Loading. Items recorded more than once (a version whose validTo was
+    # filled in later, say) are deduplicated with the last one winning.
+
+    def versions(self, type_: str) -> dict:
+        type_ = type_.lower()
+        if type_ not in self._versions:
+            by_key = {}
+            for v in self.read_jsonl(self.path("versions", type_ + ".jsonl")):
+                by_key[(v["entityId"], v["validFrom"])] = v
+
+            by_entity = defaultdict(list)
+            for v in by_key.values():
+                by_entity[v["entityId"]].append(v)
+            for entity_versions in by_entity.values():
+                entity_versions.sort(key=lambda v: to_micros(v["validFrom"]))
+
+            self._versions[type_] = {
+                entity_id: ([to_micros(v["validFrom"]) for v in vs], vs)
+                for entity_id, vs in sorted(by_entity.items())
+            }
+        return self._versions[type_]
+
+    def game_updates(self) -> Dict[str, list]:
+        if self._updates is None:
+            by_key = {}
+            for u in self.read_jsonl(self.path("game_updates.jsonl")):
+                by_key[(u["gameId"], u["timestamp"], u["hash"])] = u
+            self._updates = defaultdict(list)
+            for u in by_key.values():
+                self._updates[u["gameId"]].append(u)
+            for updates in self._updates.values():
+                updates.sort(key=lambda u: (to_micros(u["timestamp"]), u["hash"]))
+        return self._updates
+
+    def events(self) -> list:
+        if self._events is None:
+            by_id = {e["id"]: e for e in self.read_jsonl(self.path("events.jsonl"))}
+            self._events = sorted(by_id.values(), key=lambda e: (to_micros(e["created"]), e["id"]))
+        return self._events
+
+    # Recording
+
+    def add_versions(self, type_: str, items: list):
+        if items:
+            self.append_jsonl(self.path("versions", type_.lower() + ".jsonl"), items)
+            self._versions.pop(type_.lower(), None)
+
+    def add_game_updates(self, items: list):
+        if items:
+            self.append_jsonl(self.path("game_updates.jsonl"), items)
+            self._updates = None
+
+    def add_events(self, items: list):
+        if items:
+            self.append_jsonl(self.path("events.jsonl"), items)
+            self._events = None
+
+
+# Endpoints. Each takes the archive and the query parameters and returns the
+# JSON body.
+
+def chronicler_entities(archive: Archive, params: Params):
+    ids = split_list(params.get("id"))
+    at = to_micros(params["at"]) if params.get("at") else None
+
+    items = []
+    for entity_id, (starts, versions) in archive.versions(params["type"]).items():
+        if ids is not None and entity_id not in ids:
+            continue
+        if at is None:
+            version = versions[-1] if versions[-1]["validTo"] is None else None
+        else:
+            i = bisect_right(starts, at) - 1
+            version = versions[i] if i >= 0 else None
+            if version is not None and version["validTo"] is not None \
+                    and to_micros(version["validTo"]) <= at:
+                version = None
+        if version is not None:
+            items.append(version)
+
+    page, next_page = paged(items, params, default_count=None)
+    return {"nextPage": next_page, "items": page}
+
+
+def chronicler_versions(archive: Archive, params: Params):
+    ids = split_list(params.get("id"))
+    after = to_micros(params["after"]) if params.get("after") else None
+    before = to_micros(params["before"]) if params.get("before") else None
+
+    items = []
+    for entity_id, (starts, versions) in archive.versions(params["type"]).items():
+        if ids is not None and entity_id not in ids:
+            continue
+        for start, version in zip(starts, versions):
+            if (after is None or start > after) and (before is None or start < before):
+                items.append((start, entity_id, version))
+
+    items.sort(key=lambda item: item[:2], reverse=params.get("order", "asc").lower() == "desc")
+    page, next_page = paged([version for _, _, version in items], params)
+    return {"nextPage": next_page, "items": page}
+
+
+def chronicler_game_updates(archive: Archive, params: Params):
+    games = split_list(params.get("game"))
+    after = to_micros(params["after"]) if params.get("after") else None
+    before = to_micros(params["before"]) if params.get("before") else None
+
+    items = []
+    for game_id, updates in archive.game_updates().items():
+        if games is not None and game_id not in games:
+            continue
+        for update in updates:
+            timestamp = to_micros(update["timestamp"])
+            if (after is None or timestamp > after) and (before is None or timestamp < before):
+                items.append((timestamp, game_id, update))
+
+    items.sort(key=lambda item: item[:2], reverse=params.get("order", "asc").lower() == "desc")
+    page, next_page = paged([update for _, _, update in items], params)
+    return {"nextPage": next_page, "data": page}
+
+
+# Eventually query parameters that aren't plain field comparisons
+EVENTUALLY_PARAMS = {"after", "before", "sortby", "sortorder", "limit", "offset",
+                     "expand_parent", "expand_children"}
+TAG_PARAMS = {"gameTags", "playerTags", "teamTags"}
+
+
+def eventually_events(archive: Archive, params: Params):
+    after = to_micros(params["after"]) if params.get("after") else None
+    before = to_micros(params["before"]) if params.get("before") else None
+
+    def matches(event):
+        created = to_micros(event["created"])
+        if (after is not None and created <= after) or (before is not None and created >= before):
+            return False
+        for key, value in params.items():
+            if key in EVENTUALLY_PARAMS:
+                continue
+            if key in TAG_PARAMS:
+                if not split_list(value) & set(event.get(key) or []):
+                    return False
+            elif key == "description":
+                # Eventually searches descriptions, ignoring case
+                description = (event.get("description") or "").lower()
+                if not any(part.lower() in description for part in split_list(value)):
+                    return False
+            elif str(get_path(event, key)) not in split_list(value):
+                return False
+        return True
+
+    events = [e for e in archive.events() if matches(e)]
+
+    # Eventually sorts by {created}, newest first, unless told otherwise
+    sort_field = params.get("sortby", "{created}").strip("{}")
+    if sort_field != "created":
+        events.sort(key=lambda e: str(get_path(e, sort_field)))
+    if params.get("sortorder", "desc").lower() == "desc":
+        events.reverse()
+
+    offset = int(params.get("offset") or 0)
+    limit = int(params.get("limit") or DEFAULT_COUNT)
+    return events[offset:] if limit < 0 else events[offset:offset + limit]
+
+
+def blaseball_game_feed(archive: Archive, params: Params):
+    events = [e for e in archive.events() if params["id"] in (e.get("gameTags") or [])]
+    return events if params.get("sort") == "1" else events[::-1]
+
+
+ROUTES: Dict[str, Callable[[Archive, Params], object]] = {
+    "/chronicler/v2/entities": chronicler_entities,
+    "/chronicler/v2/versions": chronicler_versions,
+    "/chronicler/v1/games/updates": chronicler_game_updates,
+    "/eventually/v2/events": eventually_events,
+    "/database/feed/game": blaseball_game_feed,
+}
+
+
+def record(archive: Archive, path: str, params: Params, body):
+    if path in ("/chronicler/v2/entities", "/chronicler/v2/versions"):
+        archive.add_versions(params["type"], body["items"])
+    elif path == "/chronicler/v1/games/updates":
+        archive.add_game_updates(body["data"])
+    elif path in ("/eventually/v2/events", "/database/feed/game"):
+        archive.add_events(body)
+
+
+def handle(archive: Archive, url: str) -> Tuple[int, object]:
+    parts = urlsplit(url)
+    route = ROUTES.get(parts.path.rstrip("/"))
+    if route is None:
+        return 404, {"error": f"{parts.path} isn't served from the archive"}
+    try:
+        return 200, route(archive, dict(parse_qsl(parts.query)))
+    except KeyError as e:
+        return 400, {"error": f"missing parameter {e}"}
+
+
+class ArchiveAdapter(BaseAdapter):
+    def __init__(self, archive: Archive, record: bool = False):
+        super().__init__()
+        self.archive = archive
+        self.record = record
+        self.live = HTTPAdapter() if record else None
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        path = parts.path.rstrip("/")
+
+        if self.record:
+            response = self.live.send(request, **kwargs)
+            if response.ok and path in ROUTES:
+                record(self.archive, path, dict(parse_qsl(parts.query)), response.json())
+            return response
+
+        status, body = handle(self.archive, request.url)
+        content = json.dumps(body).encode("utf-8")
+        # Built the same way as a real response, so requests_cache can store it
+        raw = HTTPResponse(body=io.BytesIO(content), status=status, preload_content=False,
+                           headers={"Content-Type": "application/json",
+                                    "Content-Length": str(len(content))})
+        return HTTPAdapter().build_response(request, raw)
+
+    def close(self):
+        if self.live is not None:
+            self.live.close()
+
+
+_original_session_init = requests.Session.__init__
+
+
+def install(archive_dir: str, record: bool = False, sessions=()) -> Archive:
+    archive = Archive(archive_dir)
+    adapter = ArchiveAdapter(archive, record)
+
+    def mount(session):
+        for prefix in PREFIXES:
+            session.mount(prefix, adapter)
+
+    def session_init(self, *args, **kwargs):
+        _original_session_init(self, *args, **kwargs)
+        mount(self)
+
+    requests.Session.__init__ = session_init
+    for session in sessions:
+        mount(session)
+    return archive
+
+
+def uninstall():
+    requests.Session.__init__ = _original_session_init
+
+
+def install_from_env(sessions=()) -> Optional[Archive]:
+    archive_dir = os.environ.get("SIBR_ARCHIVE")
+    if not archive_dir:
+        return None
+    return install(archive_dir, record=bool(os.environ.get("SIBR_RECORD")), sessions=sessions)
+
+
+def serve(archive_dir: str, port: int = 8080):
+    archive = Archive(archive_dir)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = handle(archive, self.path)
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    print(f"Serving {archive_dir} on http://localhost:{port}/")
+    ThreadingHTTPServer(("", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "serve":
+        print("usage: python -m util.offline_api serve ARCHIVE_DIR [--port PORT]")
+        sys.exit(1)
+    serve(sys.argv[2], int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else 8080)
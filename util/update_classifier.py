@@ -0,0 +1,184 @@
+"""
+Sorting game updates into outcomes by their text.
+
+Scripts that walk through game updates used to do it with a long if/elif
+chain of `in` checks, ending in a check against every flavor event plus a
+regex. An UpdateClassifier takes the same chain as an ordered list of rules,
+compiles each rule once into the cheapest check for it and gives the same
+answer. Rules with many patterns, like the flavor events, become one
+trie-shaped regex, so they take one scan of the text instead of one `in`
+per pattern.
+
+Compiling the whole chain into one scan would be simpler, but CPython's
+`in` is much faster per character than the re module, and most updates
+are settled by the first few rules.
+"""
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# Events that don't change any of the game state the scripts track
+# TODO: Separate special from flavor
+FLAVOR_EVENTS = (
+    "A desolate peanutty wind blows.",
+    "Peanut fragments rustle on the infield.",
+    "A solitary peanut rolls onto the field. Nobody cares.",
+    "The faint crunch of a shell underfoot",
+    "The sour smell of rancid peanuts on the wind",
+    "The Birds circle ... but they don't find what they're looking for.",
+    "swallowed a stray peanut and had an allergic reaction!",
+    "has returned from Elsewhere",
+    "They became Magmatic!",
+    "The Blooddrain gurgled!",
+    "They are now Triple Threats!",
+    "is now Reverberating wildly!",
+    "is Partying!",
+    " has been cured of their peanut allergy!",
+    "BIRD NOISES",
+    "The Shame Pit activates!",
+    "These birds hate Blaseball!",
+    "Rogue Umpire incinerated ",
+    "Don't feed the birds",
+    "Have you ever seen this many birds?",
+    "The birds are mad at you. You specifically. You know who you are.",
+    "The birds are after the children...",
+    "The Electricity zaps a strike away!",
+    "Several birds are pecking...",
+    "Game over.",
+    "Oh dear Gods...",
+    "Where did these birds come from?",
+    "What are we gonna do with all these birds?",
+    "This is too many birds.",
+    "There's just too many birds!",
+    "They're clearing feathers off the field...",
+    "The birds are very loud!",
+    "I hardly think a few birds are going to bring about the end of the world.",
+    "The birds continue to stare.",
+    "The birds are paralyzed! They can't move!",
+    "Do these birds have souls?",
+    "The Birds circle...\nThe Birds pecked ",
+    "  Perks up.",
+    "The Community Chest Opens!",
+    "A shimmering Crate descends.",
+    "Smithy beckons to ",
+    "The Black Hole swallows the Runs and ",
+    "Sun 2 set a Win upon the ",
+    "Incoming Shadow Fax...",
+    " Echoed ",  # uh oh, this one is vulnerable to the Scores Baserunner problem
+    " is homesick.",
+    " is happy to be home.",
+    " chugs a Third Wave of Coffee!",
+    "The Echo Chamber traps a wave",
+    " loves Peanuts.",
+    " misses Peanuts.",
+    "Reality flickers. Things look different ...",
+    "Reverberations are at unsafe levels!",
+    "Reverberations are at high levels!",
+    " tastes the infinite!",
+    "SALMON CANNONS FIRE",
+    " are Late to the Party",
+    " go Undersea. They're now Overperforming!",
+    "The Peanut Mister activates!",
+)
+
+
+def contains(*texts):
+    return [("contains", text) for text in texts]
+
+
+def startswith(*texts):
+    return [("startswith", text) for text in texts]
+
+
+def endswith(*texts):
+    return [("endswith", text) for text in texts]
+
+
+def regex(*patterns):
+    return [("regex", pattern) for pattern in patterns]
+
+
+def flavor_rule():
+    return contains(*FLAVOR_EVENTS) + regex(r"^\d+ Birds$")
+
+
+def add_to_trie(trie, text):
+    node = trie
+    for char in text:
+        node = node.setdefault(char, {})
+    node[""] = True
+
+
+def trie_pattern(node):
+    # A regex matching any text in the trie. Sharing prefixes means the
+    # regex only tries the characters that can come next, instead of trying
+    # every pattern in turn
+    alternatives = [re.escape(char) + trie_pattern(child)
+                    for char, child in sorted(node.items()) if char]
+    if "" in node:
+        alternatives.append("")
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return f"(?:{'|'.join(alternatives)})"
+
+
+# Rules with more `in` checks than this get a regex instead
+MAX_LITERAL_CHECKS = 3
+
+
+def rule_conditions(rule, patterns, constants):
+    # Python expressions that are true when one of the patterns matches
+    # `text`, with any objects they need added to constants
+    by_kind = {"contains": [], "startswith": [], "endswith": [], "regex": []}
+    for kind, pattern in patterns:
+        by_kind[kind].append(pattern)
+
+    conditions = []
+    for kind in ("startswith", "endswith"):
+        if by_kind[kind]:
+            conditions.append(f"text.{kind}({tuple(by_kind[kind])!r})")
+    if len(by_kind["contains"]) > MAX_LITERAL_CHECKS:
+        trie = {}
+        for literal in by_kind["contains"]:
+            add_to_trie(trie, literal)
+        constants[f"search_{rule}"] = re.compile(trie_pattern(trie), flags=re.DOTALL).search
+        conditions.append(f"search_{rule}(text) is not None")
+    else:
+        conditions += [f"{literal!r} in text" for literal in by_kind["contains"]]
+    for i, pattern in enumerate(by_kind["regex"]):
+        constants[f"match_{rule}_{i}"] = re.compile(pattern, flags=re.DOTALL).match
+        conditions.append(f"match_{rule}_{i}(text) is not None")
+    return conditions
+
+
+class UpdateClassifier:
+    """
+    rules is a list of (category, patterns) in the order an if/elif chain
+    would check them, where patterns come from contains, startswith,
+    endswith and regex. A rule matches if any of its patterns do. Regex
+    patterns are matched from the start of the text, like re.match.
+
+    The rules are compiled into the if/elif chain itself, so that the
+    common early outcomes cost no more than they did written out by hand.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, List[Tuple[str, str]]]]):
+        self.categories = []
+        constants = {}
+        source = ["def classify(text):"]
+        for rule, (category, patterns) in enumerate(rules):
+            self.categories.append(category)
+            conditions = rule_conditions(rule, patterns, constants)
+            source.append(f"    if {' or '.join(conditions) or 'False'}:")
+            source.append(f"        return {category!r}")
+        source.append("    return None")
+
+        exec("\n".join(source), constants)
+        self.source = "\n".join(source)
+        self._classify = constants["classify"]
+
+    def rank(self, category) -> int:
+        return self.categories.index(category)
+
+    def classify(self, text: str) -> Optional[str]:
+        return self._classify(text)
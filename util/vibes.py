@@ -0,0 +1,78 @@
+"""
+Player vibes, computed for whole rosters and seasons at once.
+
+Days are 0-indexed like the `day` field of game updates. blaseball_mike's
+Player.get_vibe(day) takes 1-indexed days, so get_vibe(day) is vibes at
+day - 1 here.
+"""
+
+from functools import lru_cache
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+
+# Regular season plus postseason, with plenty of room to spare
+SEASON_DAYS = 200
+
+
+def vibes(buoyancy, pressurization, cinnamon, day):
+    # Works on scalars or any arrays that broadcast together
+    frequency = 6 + np.round(10 * np.asarray(buoyancy))
+    phase = np.pi * ((2 / frequency) * day + 0.5)
+
+    vibes_range = 0.5 * (pressurization + cinnamon)
+    return (vibes_range * np.sin(phase)) - (0.5 * pressurization) + (0.5 * cinnamon)
+
+
+def player_vibes(player: dict, day: int) -> float:
+    return float(vibes(player['buoyancy'], player['pressurization'], player['cinnamon'], day))
+
+
+@lru_cache(maxsize=None)
+def vibes_by_day(buoyancy: float, pressurization: float, cinnamon: float) -> np.ndarray:
+    # One player's vibes for every day of a season. Cached on the attributes,
+    # so each version of a player is only computed once.
+    return vibes(buoyancy, pressurization, cinnamon, np.arange(SEASON_DAYS))
+
+
+def get_vibe(player, day: int) -> Optional[float]:
+    """
+    Drop-in for blaseball_mike's player.get_vibe(day), including its 1-indexed
+    day and returning None for players without vibes attributes.
+    """
+    buoyancy = getattr(player, "buoyancy", None)
+    pressurization = getattr(player, "pressurization", None)
+    cinnamon = getattr(player, "cinnamon", None)
+    if not pressurization or not cinnamon or not buoyancy:
+        return None
+
+    if 1 <= day <= SEASON_DAYS:
+        return float(vibes_by_day(buoyancy, pressurization, cinnamon)[day - 1])
+    return float(vibes(buoyancy, pressurization, cinnamon, day - 1))
+
+
+class VibesTable:
+    """
+    Vibes for every player on every day, from one snapshot of player dicts
+    (chronicler data, keyed by id). Players missing any of the attributes,
+    like pre-vibes ghosts, get None.
+    """
+
+    def __init__(self, players: Mapping[str, dict], days: int = SEASON_DAYS):
+        self.index: Dict[str, int] = {player_id: i for i, player_id in enumerate(players)}
+
+        def column(attr):
+            return np.array([p.get(attr) if p.get(attr) is not None else np.nan
+                             for p in players.values()], dtype=float)
+
+        self.table = vibes(column('buoyancy')[:, None],
+                           column('pressurization')[:, None],
+                           column('cinnamon')[:, None],
+                           np.arange(days)[None, :])
+
+    def get(self, player_id: str, day: int) -> Optional[float]:
+        value = self.table[self.index[player_id], day]
+        return None if np.isnan(value) else float(value)
+
+    def on_day(self, day: int) -> Dict[str, Optional[float]]:
+        return {player_id: self.get(player_id, day) for player_id in self.index}